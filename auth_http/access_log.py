@@ -0,0 +1,145 @@
+"""
+Access log of the mock servers, for replaying recorded traffic.
+
+Every request is written as one NDJSON line with its start time, the user,
+method, path, status and duration. Handlers store the user under the
+ACCESS_LOG_USER request key once they know it; requests rejected before that are
+logged without a user. Lines are buffered and written in batches of whole
+lines, so recording costs no system call per request and apps appending to the
+same file never split each other's lines. The rest is written on cleanup.
+
+The log path may contain ``{pid}``: each worker process of auth_http.server
+then writes its own file, and read_access_log merges them again.
+benchmarks/replay.py replays a log against the in-process servers.
+"""
+import asyncio
+import os
+import time
+from aiohttp import web
+from auth_http.serialization import dumps, loads
+
+# Bytes of log lines buffered before they are written.
+_FLUSH_SIZE = 65536
+
+class AccessLogEntry:
+    """
+    One logged request.
+    """
+    __slots__ = ('ts', 'user', 'method', 'path', 'status', 'duration')
+
+    def __init__(self, ts, user, method, path, status, duration):
+        """
+        :param ts: UNIX time the request started.
+        :param user: User's name, None if the request was rejected before the user was known.
+        :param method: HTTP method.
+        :param path: Path with query string.
+        :param status: HTTP status of the response, 499 if the client went away first.
+        :param duration: Seconds spent handling the request.
+        """
+        self.ts = ts
+        self.user = user
+        self.method = method
+        self.path = path
+        self.status = status
+        self.duration = duration
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['ts'], data.get('user'), data['method'], data['path'], data['status'], data['duration'])
+
+    def to_dict(self):
+        return {slot: getattr(self, slot) for slot in self.__slots__}
+
+    def __repr__(self):
+        return f"AccessLogEntry({', '.join(f'{slot}={getattr(self, slot)!r}' for slot in self.__slots__)})"
+
+class AccessLog:
+    """
+    Appends AccessLogEntry lines to a file.
+    """
+    def __init__(self, path):
+        """
+        Open the log for appending.
+
+        :param path: File path; ``{pid}`` is replaced by the process ID.
+        """
+        self.path = path.format(pid=os.getpid())
+        self._file = open(self.path, 'ab', buffering=0)
+        self._buffer = bytearray()
+
+    def record(self, entry):
+        """
+        :param entry: The AccessLogEntry to append.
+        """
+        buffer = self._buffer
+        buffer += dumps(entry.to_dict())
+        buffer += b'\n'
+        if len(buffer) >= _FLUSH_SIZE:
+            self.flush()
+
+    def flush(self):
+        """Write the buffered lines."""
+        if self._buffer:
+            self._file.write(self._buffer)
+            self._buffer.clear()
+
+    def close(self):
+        self.flush()
+        self._file.close()
+
+def read_access_log(*paths):
+    """
+    Read one or more access logs.
+
+    :param paths: Log file paths, e.g. one per worker process.
+    :return: List of AccessLogEntry objects ordered by start time.
+    """
+    entries = []
+    for path in paths:
+        with open(path, 'rb') as log_file:
+            entries.extend(AccessLogEntry.from_dict(loads(line)) for line in log_file if line.strip())
+    entries.sort(key=lambda entry: entry.ts)
+    return entries
+
+ACCESS_LOG = web.AppKey("access_log", AccessLog)
+ACCESS_LOG_USER = web.RequestKey("access_log_user", str)
+
+@web.middleware
+async def access_log_middleware(request, handler):
+    """
+    Record every request handled by the application in its AccessLog.
+    """
+    ts = time.time()
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await handler(request)
+        status = response.status
+        return response
+    except web.HTTPException as e:
+        status = e.status
+        raise
+    except asyncio.CancelledError:
+        status = 499
+        raise
+    finally:
+        request.app[ACCESS_LOG].record(AccessLogEntry(
+            ts, request.get(ACCESS_LOG_USER), request.method, request.path_qs, status, time.perf_counter() - started))
+
+async def _close_access_log(app):
+    app[ACCESS_LOG].close()
+
+def setup_access_log(app, path):
+    """
+    Record the requests of an application.
+
+    Set it up before other middlewares so the requests they reject are logged too.
+
+    :param app: The aiohttp application, before it is started.
+    :param path: Log file path, see AccessLog.
+    :return: The application's AccessLog.
+    """
+    access_log = app[ACCESS_LOG] = AccessLog(path)
+    app.middlewares.append(access_log_middleware)
+    app.on_cleanup.append(_close_access_log)
+    return access_log
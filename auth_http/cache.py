@@ -0,0 +1,107 @@
+"""
+Small in-process caches shared by the client and the mock servers.
+"""
+import time
+from collections import OrderedDict
+
+_MISSING = object()
+
+class TTLCache:
+    """
+    Bounded LRU mapping whose entries expire at a per-entry deadline.
+
+    Expired entries are dropped lazily when they are looked up, and the least
+    recently used entry is evicted once ``maxsize`` is reached.
+    """
+    def __init__(self, maxsize, ttl=None, clock=time.monotonic):
+        """
+        Initialize the cache.
+
+        :param maxsize: Maximum number of entries kept. ``0`` disables caching.
+        :param ttl: Default lifetime of an entry in seconds, ``None`` for no expiry.
+        :param clock: Callable returning the current time used for expiry deadlines.
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._clock = clock
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        """
+        Return the live value stored for key and mark it as recently used.
+
+        :param key: Cache key.
+        :param default: Value returned when the key is missing or expired.
+        :return: The cached value or default.
+        """
+        entry = self._entries.get(key, _MISSING)
+        if entry is not _MISSING:
+            value, expires_at = entry
+            if expires_at is None or expires_at > self._clock():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+            del self._entries[key]
+        self.misses += 1
+        return default
+
+    def set(self, key, value, ttl=None, expires_at=None):
+        """
+        Store a value, evicting the least recently used entry if the cache is full.
+
+        :param key: Cache key.
+        :param value: Value to store.
+        :param ttl: Lifetime in seconds, overriding the cache default.
+        :param expires_at: Absolute deadline on the cache clock, overriding ttl.
+        """
+        if self.maxsize <= 0:
+            return
+        if expires_at is None:
+            ttl = self.ttl if ttl is None else ttl
+            expires_at = None if ttl is None else self._clock() + ttl
+        self._entries[key] = (value, expires_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def pop(self, key, default=None):
+        """
+        Remove key from the cache.
+
+        :param key: Cache key.
+        :param default: Value returned when the key is missing.
+        :return: The removed value or default.
+        """
+        entry = self._entries.pop(key, _MISSING)
+        return default if entry is _MISSING else entry[0]
+
+    def purge_expired(self):
+        """
+        Drop every expired entry.
+
+        :return: Number of entries removed.
+        """
+        now = self._clock()
+        expired = [key for key, (_, expires_at) in self._entries.items()
+                   if expires_at is not None and expires_at <= now]
+        for key in expired:
+            del self._entries[key]
+        return len(expired)
+
+    def clear(self):
+        """Remove every entry and reset the hit and miss counters."""
+        self._entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        entry = self._entries.get(key, _MISSING)
+        if entry is _MISSING:
+            return False
+        expires_at = entry[1]
+        return expires_at is None or expires_at > self._clock()
@@ -1,4 +1,33 @@
+import asyncio
 from auth_http.exceptions import AuthorizationError, DataFetchError
+from auth_http.metrics import REGISTRY
+from settings import settings
+
+class RequestResult:
+    """
+    Outcome of a single request processed by Client.process_many or Client.stream_many.
+    """
+    __slots__ = ('index', 'user_name', 'data', 'error')
+
+    def __init__(self, index, user_name, data=None, error=None):
+        """
+        :param index: Position of the request in the submitted sequence.
+        :param user_name: User's name the request was made for.
+        :param data: Result of the request processing, if it succeeded.
+        :param error: Exception raised while processing the request, if it failed.
+        """
+        self.index = index
+        self.user_name = user_name
+        self.data = data
+        self.error = error
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    def __repr__(self):
+        outcome = f"error={self.error!r}" if self.error is not None else f"data={self.data!r}"
+        return f"RequestResult(index={self.index}, user_name={self.user_name!r}, {outcome})"
 
 class Client:
     """
@@ -8,7 +37,7 @@ class Client:
         """
         Initialize the client.
 
-        :param authorization_handler: An instance of AuthorizationHandler.
+        :param authorization_handler: An instance of AuthorizationHandler, or a Pipeline.
         """
         self._handler_chain = authorization_handler
 
@@ -27,3 +56,76 @@ class Client:
             return str(auth_error)
         except DataFetchError as fetch_error:
             return str(fetch_error)
+
+    async def process_many(self, requests, concurrency=None):
+        """
+        Process many requests concurrently and collect their results.
+
+        :param requests: Iterable of (user_name, password) tuples.
+        :param concurrency: Maximum number of requests in flight, defaults to settings.CLIENT_CONCURRENCY.
+        :return: List of RequestResult objects in the order the requests were submitted.
+        """
+        results = [result async for result in self.stream_many(requests, concurrency)]
+        results.sort(key=lambda result: result.index)
+        return results
+
+    async def stream_many(self, requests, concurrency=None):
+        """
+        Process many requests concurrently, yielding results as they finish.
+
+        Requests are pulled lazily from the iterable, so at most ``concurrency``
+        of them are in flight and only a bounded number of finished results wait
+        for the consumer.
+
+        :param requests: Iterable of (user_name, password) tuples.
+        :param concurrency: Maximum number of requests in flight, defaults to settings.CLIENT_CONCURRENCY.
+        :return: Async iterator of RequestResult objects in completion order.
+        """
+        concurrency = concurrency or settings.CLIENT_CONCURRENCY
+        pending = enumerate(requests)
+        finished = asyncio.Queue(maxsize=concurrency)
+        done = object()
+
+        async def worker():
+            try:
+                for index, (user_name, password) in pending:
+                    await finished.put(await self._process_one(index, user_name, password))
+            except Exception as error:
+                # A malformed request or a failing iterable, not a failed request.
+                await finished.put(error)
+            else:
+                await finished.put(done)
+
+        workers = [asyncio.ensure_future(worker()) for _ in range(concurrency)]
+        try:
+            running = len(workers)
+            while running:
+                result = await finished.get()
+                if result is done:
+                    running -= 1
+                elif isinstance(result, Exception):
+                    raise result
+                else:
+                    yield result
+        finally:
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+
+    def metrics_snapshot(self):
+        """
+        Return the client-side metrics of this process.
+
+        Covers token requests, data requests and the access token cache: latency
+        histograms, requests in flight and responses by HTTP status.
+
+        :return: Dict mapping metric name to its values keyed by comma-joined label values.
+        """
+        return REGISTRY.snapshot(prefix='client_')
+
+    async def _process_one(self, index, user_name, password):
+        try:
+            data = await self._handler_chain.handle_request(user_name, password)
+        except Exception as error:
+            return RequestResult(index, user_name, error=error)
+        return RequestResult(index, user_name, data=data)
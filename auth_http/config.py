@@ -0,0 +1,23 @@
+"""
+Settings of an aiohttp application.
+
+The servers' create_app stores the Settings object it was built from on the
+application, and handlers read their tunables (token lifetimes, page sizes,
+Retry-After values, ...) through get_config, so applications built from
+different configs can run side by side in one process.
+"""
+from aiohttp import web
+from settings import Settings, settings
+
+CONFIG = web.AppKey("config", Settings)
+
+def get_config(app):
+    """
+    Return the settings an aiohttp application was built from.
+
+    Applications without any use the module's settings.
+
+    :param app: The aiohttp application.
+    :return: A Settings object.
+    """
+    return app.get(CONFIG, settings)
@@ -0,0 +1,376 @@
+"""
+Credential stores used by the mock servers to look users up.
+
+Three implementations share the CredentialStore interface:
+
+- InMemoryCredentialStore: a dict, seeded from settings.AUTH_CREDENTIALS by default.
+- SQLiteCredentialStore: a SQLite table whose primary key indexes the user name.
+- SnapshotCredentialStore: a read-only, memory-mapped hash table written by
+  write_snapshot. Worker processes mapping the same file share its pages
+  through the OS page cache instead of each loading its own copy.
+"""
+import hashlib
+import mmap
+import os
+import sqlite3
+import struct
+from aiohttp import web
+from settings import settings
+
+# Hashes without recorded parameters are salted SHA-256, as in settings.AUTH_CREDENTIALS.
+DEFAULT_KDF = 'sha256'
+
+class Credential:
+    """
+    Stored credentials of a single user.
+    """
+    __slots__ = ('user_name', 'salt', 'hash', 'kdf')
+
+    def __init__(self, user_name, salt, hash, kdf=DEFAULT_KDF):
+        """
+        :param user_name: User's name.
+        :param salt: Per-user salt bytes.
+        :param hash: Hex digest of the salted password.
+        :param kdf: Key derivation function and parameters the hash was computed with,
+                    see auth_http.password_hashing.
+        """
+        self.user_name = user_name
+        self.salt = salt
+        self.hash = hash
+        self.kdf = kdf
+
+    def __eq__(self, other):
+        if not isinstance(other, Credential):
+            return NotImplemented
+        return ((self.user_name, self.salt, self.hash, self.kdf)
+                == (other.user_name, other.salt, other.hash, other.kdf))
+
+    def __repr__(self):
+        return f"Credential(user_name={self.user_name!r})"
+
+class CredentialStore:
+    """
+    Interface of a credential store.
+    """
+    def get(self, user_name):
+        """
+        Look a user up.
+
+        :param user_name: User's name.
+        :return: The user's Credential, or None if the user is unknown.
+        """
+        raise NotImplementedError
+
+    def __iter__(self):
+        """Iterate over every stored Credential."""
+        raise NotImplementedError
+
+    def remove(self, user_name):
+        """
+        Remove a user if present.
+
+        :param user_name: User's name.
+        :raises NotImplementedError: If the store is read-only.
+        """
+        raise NotImplementedError(f"{type(self).__name__} is read-only")
+
+    def __contains__(self, user_name):
+        return isinstance(user_name, str) and self.get(user_name) is not None
+
+    def close(self):
+        """Release the resources held by the store."""
+
+class InMemoryCredentialStore(CredentialStore):
+    """
+    Credential store backed by a dict.
+    """
+    def __init__(self, credentials=None):
+        """
+        Initialize the store.
+
+        :param credentials: Mapping of user name to a dict with 'salt', 'hash' and optionally
+                            'kdf' keys, in the format of settings.AUTH_CREDENTIALS.
+        """
+        self._credentials = {}
+        for user_name, record in (credentials or {}).items():
+            self.add(user_name, record['salt'], record['hash'], record.get('kdf', DEFAULT_KDF))
+
+    def get(self, user_name):
+        return self._credentials.get(user_name)
+
+    def add(self, user_name, salt, hash, kdf=DEFAULT_KDF):
+        """
+        Add or replace a user.
+
+        :param user_name: User's name.
+        :param salt: Per-user salt bytes.
+        :param hash: Hex digest of the salted password.
+        :param kdf: Key derivation function and parameters of the hash.
+        """
+        self._credentials[user_name] = Credential(user_name, salt, hash, kdf)
+
+    def remove(self, user_name):
+        """
+        Remove a user if present.
+
+        :param user_name: User's name.
+        """
+        self._credentials.pop(user_name, None)
+
+    def __iter__(self):
+        return iter(list(self._credentials.values()))
+
+    def __len__(self):
+        return len(self._credentials)
+
+class SQLiteCredentialStore(CredentialStore):
+    """
+    Credential store backed by a SQLite table indexed by user name.
+
+    Lookups are single primary-key probes, cheap enough to run on the event loop.
+    """
+    def __init__(self, path):
+        """
+        Open, and create if needed, the credentials table.
+
+        :param path: Path of the SQLite database file, or ':memory:'.
+        """
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS credentials ("
+            "user_name TEXT PRIMARY KEY, salt BLOB NOT NULL, hash TEXT NOT NULL, "
+            f"kdf TEXT NOT NULL DEFAULT '{DEFAULT_KDF}'"
+            ") WITHOUT ROWID"
+        )
+        columns = {row[1] for row in self._connection.execute("PRAGMA table_info(credentials)")}
+        if 'kdf' not in columns:
+            # Tables created before per-user KDF parameters were stored.
+            self._connection.execute(
+                f"ALTER TABLE credentials ADD COLUMN kdf TEXT NOT NULL DEFAULT '{DEFAULT_KDF}'")
+        self._connection.commit()
+
+    def get(self, user_name):
+        row = self._connection.execute(
+            "SELECT salt, hash, kdf FROM credentials WHERE user_name = ?", (user_name,)
+        ).fetchone()
+        if row is None:
+            return None
+        return Credential(user_name, bytes(row[0]), row[1], row[2])
+
+    def add(self, user_name, salt, hash, kdf=DEFAULT_KDF):
+        """
+        Add or replace a user.
+
+        :param user_name: User's name.
+        :param salt: Per-user salt bytes.
+        :param hash: Hex digest of the salted password.
+        :param kdf: Key derivation function and parameters of the hash.
+        """
+        self.add_many([Credential(user_name, salt, hash, kdf)])
+
+    def add_many(self, credentials):
+        """
+        Add or replace many users in one transaction.
+
+        :param credentials: Iterable of Credential objects.
+        """
+        with self._connection:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO credentials (user_name, salt, hash, kdf) VALUES (?, ?, ?, ?)",
+                ((credential.user_name, credential.salt, credential.hash, credential.kdf)
+                 for credential in credentials),
+            )
+
+    def remove(self, user_name):
+        """
+        Remove a user if present.
+
+        :param user_name: User's name.
+        """
+        with self._connection:
+            self._connection.execute("DELETE FROM credentials WHERE user_name = ?", (user_name,))
+
+    def __iter__(self):
+        for user_name, salt, hash, kdf in self._connection.execute(
+                "SELECT user_name, salt, hash, kdf FROM credentials ORDER BY user_name"):
+            yield Credential(user_name, bytes(salt), hash, kdf)
+
+    def __len__(self):
+        return self._connection.execute("SELECT COUNT(*) FROM credentials").fetchone()[0]
+
+    def close(self):
+        self._connection.close()
+
+# Snapshot layout, all integers little-endian:
+#   header:  magic, version, slot count (power of two), record count
+#   slots:   (64-bit key digest, record offset) pairs, offset 0 marks an empty slot
+#   records: length-prefixed user name, salt, hash and, from version 2, kdf
+_SNAPSHOT_MAGIC = b'AHCS'
+_SNAPSHOT_VERSION = 2
+_SNAPSHOT_FIELDS = {1: 3, 2: 4}
+_HEADER = struct.Struct('<4sIII')
+_SLOT = struct.Struct('<QQ')
+_LENGTH = struct.Struct('<H')
+
+def _digest(user_name_bytes):
+    return int.from_bytes(hashlib.blake2b(user_name_bytes, digest_size=8).digest(), 'little')
+
+def _pack_fields(*fields):
+    return b''.join(_LENGTH.pack(len(field)) + field for field in fields)
+
+def write_snapshot(path, credentials):
+    """
+    Write credentials to a snapshot file readable by SnapshotCredentialStore.
+
+    The file is written next to path and moved into place atomically, so running
+    readers keep their mapping of the previous snapshot.
+
+    :param path: Destination path.
+    :param credentials: Iterable of Credential objects, e.g. another CredentialStore.
+    :return: Number of credentials written.
+    """
+    records = []
+    for credential in credentials:
+        user_name = credential.user_name.encode('utf8')
+        records.append((_digest(user_name), _pack_fields(
+            user_name, credential.salt, credential.hash.encode('ascii'), credential.kdf.encode('ascii'))))
+
+    slot_count = 1
+    while slot_count < 2 * len(records):
+        slot_count *= 2
+    mask = slot_count - 1
+
+    slots = [(0, 0)] * slot_count
+    offset = _HEADER.size + slot_count * _SLOT.size
+    for key, record in records:
+        index = key & mask
+        while slots[index][1]:
+            index = (index + 1) & mask
+        slots[index] = (key, offset)
+        offset += len(record)
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as snapshot:
+        snapshot.write(_HEADER.pack(_SNAPSHOT_MAGIC, _SNAPSHOT_VERSION, slot_count, len(records)))
+        snapshot.write(b''.join(_SLOT.pack(*slot) for slot in slots))
+        for _, record in records:
+            snapshot.write(record)
+    os.replace(tmp_path, path)
+    return len(records)
+
+class SnapshotCredentialStore(CredentialStore):
+    """
+    Read-only credential store over a memory-mapped snapshot file.
+
+    Lookups hash the user name and probe an open-addressing table in the mapping,
+    so they take constant time and never load the whole table into the process.
+    """
+    def __init__(self, path):
+        """
+        Map a snapshot written by write_snapshot.
+
+        :param path: Path of the snapshot file.
+        :raises ValueError: If the file is not a credential snapshot.
+        """
+        with open(path, 'rb') as snapshot:
+            self._map = mmap.mmap(snapshot.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self._slot_count, self._record_count = _HEADER.unpack_from(self._map, 0)
+        if magic != _SNAPSHOT_MAGIC or version not in _SNAPSHOT_FIELDS:
+            self._map.close()
+            raise ValueError(f"{path} is not a credential snapshot")
+        self._field_count = _SNAPSHOT_FIELDS[version]
+        self._mask = self._slot_count - 1
+
+    def get(self, user_name):
+        name = user_name.encode('utf8')
+        key = _digest(name)
+        index = key & self._mask
+        while True:
+            slot_key, offset = _SLOT.unpack_from(self._map, _HEADER.size + index * _SLOT.size)
+            if not offset:
+                return None
+            if slot_key == key:
+                fields, _ = self._read_record(offset)
+                if fields[0] == name:
+                    return self._credential(user_name, fields)
+            index = (index + 1) & self._mask
+
+    def _read_record(self, offset):
+        fields = []
+        for _ in range(self._field_count):
+            (length,) = _LENGTH.unpack_from(self._map, offset)
+            offset += _LENGTH.size
+            fields.append(self._map[offset:offset + length])
+            offset += length
+        return fields, offset
+
+    def __iter__(self):
+        offset = _HEADER.size + self._slot_count * _SLOT.size
+        for _ in range(self._record_count):
+            fields, offset = self._read_record(offset)
+            yield self._credential(fields[0].decode('utf8'), fields)
+
+    @staticmethod
+    def _credential(user_name, fields):
+        kdf = fields[3].decode('ascii') if len(fields) > 3 else DEFAULT_KDF
+        return Credential(user_name, fields[1], fields[2].decode('ascii'), kdf)
+
+    def __len__(self):
+        return self._record_count
+
+    def close(self):
+        self._map.close()
+
+def create_credential_store(config=settings):
+    """
+    Build the credential store selected by settings.
+
+    :param config: Settings object; CREDENTIAL_STORE selects 'memory', 'sqlite' or 'snapshot'
+                   and CREDENTIAL_STORE_PATH locates the database or snapshot file.
+    :return: A CredentialStore.
+    :raises ValueError: If the store kind is unknown.
+    """
+    kind = config.CREDENTIAL_STORE
+    if kind == 'memory':
+        return InMemoryCredentialStore(config.AUTH_CREDENTIALS)
+    if kind == 'sqlite':
+        return SQLiteCredentialStore(config.CREDENTIAL_STORE_PATH)
+    if kind == 'snapshot':
+        return SnapshotCredentialStore(config.CREDENTIAL_STORE_PATH)
+    raise ValueError(f"Unknown credential store: {kind}")
+
+CREDENTIAL_STORE = web.AppKey("credential_store", CredentialStore)
+
+_default_store = None
+
+def get_credential_store(app):
+    """
+    Return the credential store configured on an aiohttp application.
+
+    Applications without one share a store built from settings on first use.
+
+    :param app: The aiohttp application.
+    :return: A CredentialStore.
+    """
+    store = app.get(CREDENTIAL_STORE)
+    if store is None:
+        global _default_store
+        if _default_store is None:
+            _default_store = create_credential_store()
+        store = _default_store
+    return store
+
+async def _close_credential_store(app):
+    app[CREDENTIAL_STORE].close()
+
+def setup_credential_store(app, config=settings):
+    """
+    Give an application its own credential store, closed on cleanup.
+
+    :param app: The aiohttp application, before it is started.
+    :param config: Settings object, see create_credential_store.
+    :return: The application's CredentialStore.
+    """
+    store = app[CREDENTIAL_STORE] = create_credential_store(config)
+    app.on_cleanup.append(_close_credential_store)
+    return store
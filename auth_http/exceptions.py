@@ -1,8 +1,28 @@
 
 class AuthorizationError(Exception):
     """Custom exception for authorization errors."""
-    pass
+    def __init__(self, message, status=None):
+        """
+        :param message: Error description.
+        :param status: HTTP status returned by the authorization server, if any.
+        """
+        super().__init__(message)
+        self.status = status
 
 class DataFetchError(Exception):
     """Custom exception for data fetching errors."""
+    def __init__(self, message, status=None):
+        """
+        :param message: Error description.
+        :param status: HTTP status returned by the resource API, if any.
+        """
+        super().__init__(message)
+        self.status = status
+
+class TransientError(Exception):
+    """Raised for failures worth retrying, such as an overloaded or unreachable server."""
+    pass
+
+class CircuitOpenError(Exception):
+    """Raised without calling an endpoint whose circuit breaker is open."""
     pass
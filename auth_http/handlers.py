@@ -1,7 +1,74 @@
 import base64
+from functools import lru_cache
+from time import perf_counter
+from yarl import URL
+from auth_http.cache import TTLCache
 from auth_http.exceptions import AuthorizationError, DataFetchError
+from auth_http.metrics import REGISTRY
+from auth_http.resources import NDJSON_CONTENT_TYPE
+from auth_http.serialization import DataResponse, ResourcePage, loads
+from auth_http.token_cache import TokenCache
 from settings import settings
 
+_AUTH_SECONDS = REGISTRY.histogram(
+    'client_auth_request_duration_seconds', 'Latency of token requests to the authorization server.',
+    ('endpoint',))
+_AUTH_IN_FLIGHT = REGISTRY.gauge(
+    'client_auth_requests_in_flight', 'Token requests waiting for the authorization server.', ('endpoint',))
+_AUTH_RESPONSES = REGISTRY.counter(
+    'client_auth_responses_total', 'Token requests by endpoint and HTTP status, "error" without a response.',
+    ('endpoint', 'status'))
+_FETCH_SECONDS = REGISTRY.histogram(
+    'client_fetch_duration_seconds', 'Latency of data requests to the resource API.')
+_FETCH_IN_FLIGHT = REGISTRY.gauge(
+    'client_fetch_requests_in_flight', 'Data requests waiting for the resource API.')
+_FETCH_RESPONSES = REGISTRY.counter(
+    'client_fetch_responses_total', 'Data requests by HTTP status, "error" without a response.', ('status',))
+
+class _TokenEndpointMetrics:
+    """
+    Metric children of one authorization server endpoint, resolved once per handler.
+    """
+    __slots__ = ('endpoint', 'in_flight', 'latency', 'ok')
+
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        self.in_flight = _AUTH_IN_FLIGHT.labels(endpoint)
+        self.latency = _AUTH_SECONDS.labels(endpoint)
+        self.ok = _AUTH_RESPONSES.labels(endpoint, 200)
+
+    def response(self, status):
+        """
+        :param status: HTTP status, or 'error' without a response.
+        :return: The response counter child of the status.
+        """
+        return self.ok if status == 200 else _AUTH_RESPONSES.labels(self.endpoint, status)
+
+def _endpoint_url(host, port, path):
+    """
+    Build an endpoint URL once so requests do not re-parse it.
+
+    :param host: Server host name.
+    :param port: Server port.
+    :param path: Endpoint path.
+    :return: A yarl.URL.
+    """
+    return URL.build(scheme="http", host=host, port=port, path=path)
+
+@lru_cache(maxsize=settings.TOKEN_CACHE_SIZE)
+def _token_user(access_token):
+    """
+    Read the user an access token was issued to, without verifying it.
+
+    Only used to keep cached responses of different users apart.
+    """
+    # Imported here so that importing the handlers does not load PyJWT.
+    import jwt
+    try:
+        return jwt.decode(access_token, options={"verify_signature": False}).get("user_name")
+    except jwt.PyJWTError:
+        return None
+
 class Handler:
     """
     Base class for handling requests in the chain.
@@ -29,20 +96,35 @@ class AuthorizationHandler(Handler):
     """
     Handler for authenticating the client.
     """
-    def __init__(self, http_client, successor=None):
+    def __init__(self, http_client, successor=None, token_cache=None, url=None, refresh_url=None):
         """
         Initialize the AuthorizationHandler.
 
         :param http_client: An aiohttp.ClientSession object.
         :param successor: The next handler in the chain.
+        :param token_cache: TokenCache used to reuse access tokens, a new one by default.
+        :param url: Authentication endpoint URL, built from settings by default.
+        :param refresh_url: Token refresh endpoint URL, settings.REFRESH_ENDPOINT on the
+                            authentication server by default.
         """
         super().__init__(successor) 
         self._http_client = http_client
+        self._url = URL(url) if url is not None else _endpoint_url(
+            settings.AUTHORIZATION_HOST, settings.AUTHORIZATION_PORT, settings.AUTHORIZATION_ENDPOINT)
+        self._refresh_url = URL(refresh_url) if refresh_url is not None else self._url.with_path(
+            settings.REFRESH_ENDPOINT)
+        self._token_cache = token_cache if token_cache is not None else TokenCache()
+        self._login_metrics = _TokenEndpointMetrics('authenticate')
+        self._refresh_metrics = _TokenEndpointMetrics('refresh')
 
     async def handle_request(self, user_name, password, **kwargs):
         """
         Handle authentication request. If successful, delegate to the successor.
 
+        A cached access token is reused while it is valid and renewed through the refresh
+        endpoint when it is about to expire; a token rejected by the resource API is
+        dropped from the cache.
+
         :param user_name: Client's username.
         :param password: Client's password.
         :param kwargs: Additional keyword arguments.
@@ -50,14 +132,40 @@ class AuthorizationHandler(Handler):
         :raises AuthorizationError: If authentication fails.
         """
         try:
-            access_token = await self.authenticate(user_name, password)
+            access_token = await self.get_access_token(user_name, password)
             if access_token:
                 kwargs['access_token'] = access_token
-                return await super().handle_request(**kwargs)
+                try:
+                    return await super().handle_request(**kwargs)
+                except DataFetchError as fetch_error:
+                    if fetch_error.status == 401:
+                        self.invalidate_token(user_name, password)
+                    raise
             raise AuthorizationError("Authentication failed")
         except Exception as e:
             raise AuthorizationError(e) from e
 
+    async def get_access_token(self, user_name, password):
+        """
+        Return a valid access token, from the token cache when possible.
+
+        :param user_name: The client username.
+        :param password: The client password.
+        :return: The access token.
+        :raises AuthorizationError: If authentication fails.
+        """
+        return await self._token_cache.get_or_fetch(
+            user_name, password, lambda: self.request_tokens(user_name, password), self.refresh)
+
+    def invalidate_token(self, user_name, password):
+        """
+        Drop the cached access token of a client, e.g. after the resource API rejected it.
+
+        :param user_name: The client username.
+        :param password: The client password.
+        """
+        self._token_cache.invalidate(user_name, password)
+
     async def authenticate(self, user_name, password):
         """
         Authenticate the client using the mock authentication server.
@@ -69,22 +177,55 @@ class AuthorizationHandler(Handler):
         :param password: The client password.
         :return: The access token if authentication is successful, otherwise an AuthorizationError.
         """
-        auth_server_url = "http://" + settings.AUTHORIZATION_HOST\
-        + ":" + str(settings.AUTHORIZATION_PORT)\
-        + settings.AUTHORIZATION_ENDPOINT
+        data = await self.request_tokens(user_name, password)
+        return data["access_token"]
+
+    async def request_tokens(self, user_name, password):
+        """
+        Log in to the mock authentication server.
+
+        :param user_name: The client username.
+        :param password: The client password.
+        :return: The token response, with 'access_token' and, if issued, 'refresh_token'.
+        :raises AuthorizationError: If authentication fails.
+        """
         headers = {"Authorization": self._create_basic_auth_header(user_name, password)}
+        return await self._post_for_tokens(self._url, headers, "Authentication", self._login_metrics)
+
+    async def refresh(self, refresh_token):
+        """
+        Obtain a new access token with a refresh token, without sending the password.
 
+        :param refresh_token: Refresh token issued at login.
+        :return: The token response with a new 'access_token'.
+        :raises AuthorizationError: If the refresh token is rejected.
+        """
+        headers = {"Authorization": f"Bearer {refresh_token}"}
+        return await self._post_for_tokens(self._refresh_url, headers, "Token refresh", self._refresh_metrics)
+
+    async def _post_for_tokens(self, url, headers, action, metrics):
+        metrics.in_flight.inc()
+        started = perf_counter()
+        status = 'error'
         try:
-            async with self._http_client.post(auth_server_url, headers=headers) as response:
+            async with self._http_client.post(url, headers=headers) as response:
+                status = response.status
                 if response.status == 200:
-                    data = await response.json()
-                    return data["access_token"]
+                    data = await response.json(loads=loads)
+                    if "access_token" not in data:
+                        raise AuthorizationError(f"{action} response has no access token")
+                    return data
                 elif response.status == 401:
-                    raise AuthorizationError("Authentication failed")
+                    raise AuthorizationError(f"{action} failed", status=401)
                 else:
-                    raise AuthorizationError(response.status)
+                    raise AuthorizationError(f"{action} failed with status {response.status}",
+                                             status=response.status)
         except Exception as e:
-            raise AuthorizationError("Authentication request failed") from e
+            raise AuthorizationError(f"{action} request failed", status=getattr(e, 'status', None)) from e
+        finally:
+            metrics.latency.observe(perf_counter() - started)
+            metrics.in_flight.dec()
+            metrics.response(status).inc()
 
     def _create_basic_auth_header(self, user_name, password):
         """
@@ -102,17 +243,26 @@ class DataFetchingHandler(Handler):
     """
     Handler for fetching data.
     """
-    def __init__(self, http_client, successor=None):
+    def __init__(self, http_client, successor=None, url=None, response_cache=None):
         """
         Initialize the DataFetchingHandler.
 
         :param http_client: An aiohttp.ClientSession object.
         :param successor: The next handler in the chain.
+        :param url: Resource API endpoint URL, built from settings by default.
+        :param response_cache: TTLCache of responses revalidated with If-None-Match,
+                               a new one of settings.RESPONSE_CACHE_SIZE entries by default.
         """
         super().__init__(successor)
         self.http_client = http_client
+        self._url = URL(url) if url is not None else _endpoint_url(
+            settings.API_HOST, settings.API_PORT, settings.API_ENDPOINT)
+        self._responses = response_cache if response_cache is not None else TTLCache(settings.RESPONSE_CACHE_SIZE)
+        self._in_flight = _FETCH_IN_FLIGHT.labels()
+        self._latency = _FETCH_SECONDS.labels()
+        self._ok = _FETCH_RESPONSES.labels(200)
 
-    async def handle_request(self, access_token):
+    async def handle_request(self, access_token, **kwargs):
         """
         Handle data fetching request.
 
@@ -125,7 +275,7 @@ class DataFetchingHandler(Handler):
             data = await self.fetch_data(access_token)
             return data
         except Exception as e:
-            raise DataFetchError("Data fetching failed") from e
+            raise DataFetchError("Data fetching failed", status=getattr(e, 'status', None)) from e
 
     async def fetch_data(self, access_token):
         """
@@ -135,15 +285,98 @@ class DataFetchingHandler(Handler):
         :return: Fetched data.
         :raises DataFetchError: If data fetching fails.
         """
-        resource_api_url = "http://" + settings.API_HOST\
-        + ":" + str(settings.API_PORT)\
-        + settings.API_ENDPOINT
+        return (await self._get_json(self._url, access_token, DataResponse)).data
+
+    async def fetch_page(self, access_token, cursor=None, limit=None):
+        """
+        Fetch a page of the resource's records.
+
+        :param access_token: Access token for authorization.
+        :param cursor: Cursor returned with the previous page, None for the first page.
+        :param limit: Maximum number of records, defaults to settings.RESOURCE_PAGE_SIZE.
+        :return: Tuple of the records and the cursor of the next page, None on the last page.
+        :raises DataFetchError: If data fetching fails.
+        """
+        query = {'limit': settings.RESOURCE_PAGE_SIZE if limit is None else limit}
+        if cursor is not None:
+            query['cursor'] = cursor
+        page = await self._get_json(self._url.with_query(query), access_token, ResourcePage)
+        return page.data, page.next_cursor
+
+    async def iter_pages(self, access_token, limit=None):
+        """
+        Fetch every page of the resource's records in turn.
+
+        :param access_token: Access token for authorization.
+        :param limit: Maximum number of records per page.
+        :return: Async iterator of record lists.
+        :raises DataFetchError: If data fetching fails.
+        """
+        cursor = None
+        while True:
+            records, cursor = await self.fetch_page(access_token, cursor, limit)
+            yield records
+            if cursor is None:
+                return
+
+    async def _get_json(self, url, access_token, struct):
+        """
+        GET a JSON resource, revalidating a cached copy with If-None-Match.
+
+        The body is decoded straight into struct. Responses carrying an ETag are
+        cached per URL and user; when the resource API answers 304 Not Modified the
+        cached struct is returned without downloading or decoding it again. Cached
+        structs are shared between callers and must not be modified.
+
+        :param url: Resource URL.
+        :param access_token: Access token for authorization.
+        :param struct: Struct subclass the body is decoded into.
+        :return: An instance of struct.
+        :raises DataFetchError: If the resource API does not answer 200 or 304.
+        """
         headers = {"Authorization": f"Bearer {access_token}"}
-        async with self.http_client.get(resource_api_url, headers=headers) as response:
-            if response.status == 200:
-                data = await response.json()
-                return data['data']
-            else:
-                    raise DataFetchError("Error fetching data")
+        key = (url, _token_user(access_token))
+        cached = self._responses.get(key)
+        if cached is not None:
+            headers["If-None-Match"] = cached[0]
+        self._in_flight.inc()
+        started = perf_counter()
+        status = 'error'
+        try:
+            async with self.http_client.get(url, headers=headers) as response:
+                status = response.status
+                if response.status == 200:
+                    data = await response.json(loads=struct.loads)
+                    etag = response.headers.get('ETag')
+                    if etag:
+                        self._responses.set(key, (etag, data))
+                    return data
+                elif response.status == 304 and cached is not None:
+                    return cached[1]
+                else:
+                    raise DataFetchError("Error fetching data", status=response.status)
+        finally:
+            self._latency.observe(perf_counter() - started)
+            self._in_flight.dec()
+            (self._ok if status == 200 else _FETCH_RESPONSES.labels(status)).inc()
+
+    async def stream_records(self, access_token):
+        """
+        Fetch the resource as NDJSON and yield its records one by one.
+
+        Only the line being parsed is held in memory, however large the resource.
+
+        :param access_token: Access token for authorization.
+        :return: Async iterator of records.
+        :raises DataFetchError: If the resource API rejects the request.
+        """
+        headers = {"Authorization": f"Bearer {access_token}", "Accept": NDJSON_CONTENT_TYPE}
+        async with self.http_client.get(self._url, headers=headers) as response:
+            _FETCH_RESPONSES.labels(response.status).inc()
+            if response.status != 200:
+                raise DataFetchError("Error fetching data", status=response.status)
+            async for line in response.content:
+                if line.strip():
+                    yield loads(line)
 
 
@@ -0,0 +1,336 @@
+"""
+Asymmetric JWT signing keys and their distribution as a JWKS.
+
+The authorization server signs tokens with a private key from a SigningKeyRing
+and publishes the public halves at settings.JWKS_ENDPOINT. The resource API
+keeps a JWKSCache of parsed public keys indexed by key ID (``kid``) and
+refreshes it in the background, so verification needs neither the signing
+secret nor a network call on the request path, and keys can be rotated by
+publishing the new key before signing with it.
+"""
+import asyncio
+import base64
+import hashlib
+import json
+import time
+import aiohttp
+import jwt
+from aiohttp import web
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ed25519, rsa
+from jwt.algorithms import OKPAlgorithm, RSAAlgorithm
+from auth_http.serialization import loads
+from settings import settings
+
+ASYMMETRIC_ALGORITHMS = ('EdDSA', 'RS256')
+
+# Members of each key type hashed into its RFC 7638 thumbprint.
+_THUMBPRINT_MEMBERS = {'OKP': ('crv', 'kty', 'x'), 'RSA': ('e', 'kty', 'n')}
+
+def generate_private_key(algorithm):
+    """
+    Generate a private key for a signing algorithm.
+
+    :param algorithm: 'EdDSA' or 'RS256'.
+    :return: A cryptography private key.
+    :raises ValueError: If the algorithm is not an asymmetric one.
+    """
+    if algorithm == 'EdDSA':
+        return ed25519.Ed25519PrivateKey.generate()
+    if algorithm == 'RS256':
+        return rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    raise ValueError(f"Unsupported signing algorithm: {algorithm}")
+
+def public_jwk(private_key, algorithm):
+    """
+    Describe the public half of a private key as a JWK.
+
+    The key ID is the key's RFC 7638 thumbprint, so every process loading the
+    same key derives the same ``kid``.
+
+    :param private_key: A cryptography private key.
+    :param algorithm: 'EdDSA' or 'RS256'.
+    :return: JWK dict including 'kid', 'alg' and 'use'.
+    """
+    converter = OKPAlgorithm if algorithm == 'EdDSA' else RSAAlgorithm
+    jwk = converter.to_jwk(private_key.public_key(), as_dict=True)
+    members = {name: jwk[name] for name in _THUMBPRINT_MEMBERS[jwk['kty']]}
+    canonical = json.dumps(members, separators=(',', ':'), sort_keys=True).encode()
+    kid = base64.urlsafe_b64encode(hashlib.sha256(canonical).digest()).rstrip(b'=').decode()
+    return dict(jwk, kid=kid, alg=algorithm, use='sig')
+
+class SigningKeyRing:
+    """
+    Private keys of the authorization server.
+
+    The most recently added key signs new tokens; every key in the ring stays
+    published, and accepted for refresh tokens, until it is retired.
+    """
+    def __init__(self, secret=''):
+        """
+        :param secret: Shared HS256 secret used while the ring holds no key, none by default.
+        """
+        self._secret = secret
+        self._keys = {}
+        self._active = None
+        self._jwks = {'keys': []}
+
+    @classmethod
+    def from_settings(cls, config=settings):
+        """
+        Build the key ring described by settings.
+
+        :param config: Settings object; JWT_PRIVATE_KEY_PATH names a PEM private key,
+                       an ephemeral key for JWT_ALGORITHM is generated when it is empty.
+        :return: A SigningKeyRing, empty when JWT_ALGORITHM is 'HS256'.
+        :raises ValueError: If JWT_ALGORITHM is 'HS256' and JWT_SECRET_KEY is empty.
+        """
+        ring = cls(config.JWT_SECRET_KEY)
+        if config.JWT_ALGORITHM == 'HS256':
+            if not config.JWT_SECRET_KEY:
+                raise ValueError("JWT_SECRET_KEY must be set to sign tokens with HS256")
+            return ring
+        if config.JWT_PRIVATE_KEY_PATH:
+            with open(config.JWT_PRIVATE_KEY_PATH, 'rb') as pem:
+                ring.add(serialization.load_pem_private_key(pem.read(), password=None), config.JWT_ALGORITHM)
+        else:
+            ring.rotate(config.JWT_ALGORITHM)
+        return ring
+
+    def add(self, private_key, algorithm):
+        """
+        Add a key and make it the signing key.
+
+        :param private_key: A cryptography private key.
+        :param algorithm: 'EdDSA' or 'RS256'.
+        :return: The key ID.
+        """
+        jwk = public_jwk(private_key, algorithm)
+        kid = jwk['kid']
+        self._keys[kid] = (private_key, algorithm, jwt.PyJWK(jwk).key, jwk)
+        self._active = kid
+        self._publish()
+        return kid
+
+    def rotate(self, algorithm=None):
+        """
+        Generate a new signing key, keeping the previous ones published.
+
+        :param algorithm: 'EdDSA' or 'RS256', defaults to settings.JWT_ALGORITHM.
+        :return: The new key ID.
+        """
+        algorithm = algorithm or settings.JWT_ALGORITHM
+        return self.add(generate_private_key(algorithm), algorithm)
+
+    def retire(self, kid):
+        """
+        Stop publishing a key. The signing key cannot be retired.
+
+        :param kid: Key ID.
+        :raises ValueError: If kid is the signing key.
+        """
+        if kid == self._active:
+            raise ValueError("Cannot retire the active signing key")
+        self._keys.pop(kid, None)
+        self._publish()
+
+    @property
+    def active_kid(self):
+        return self._active
+
+    def sign(self, payload):
+        """
+        Sign a payload with the active key, or the shared secret when the ring is empty.
+
+        :param payload: JWT claims.
+        :return: The encoded token.
+        :raises ValueError: If the ring is empty and no shared secret is configured.
+        """
+        if self._active is None:
+            if not self._secret:
+                raise ValueError("No signing key: add a key or set JWT_SECRET_KEY")
+            return jwt.encode(payload, self._secret, algorithm="HS256")
+        private_key, algorithm, _, _ = self._keys[self._active]
+        return jwt.encode(payload, private_key, algorithm=algorithm, headers={'kid': self._active})
+
+    def verify(self, token):
+        """
+        Verify a token signed by this ring.
+
+        :param token: Encoded token.
+        :return: The decoded payload.
+        :raises jwt.InvalidTokenError: If the token is invalid, expired or signed by an unknown key.
+        """
+        if self._active is None:
+            if not self._secret:
+                raise jwt.InvalidTokenError("No signing key")
+            return jwt.decode(token, self._secret, algorithms=["HS256"])
+        entry = self._keys.get(jwt.get_unverified_header(token).get('kid'))
+        if entry is None:
+            raise jwt.InvalidTokenError("Unknown signing key")
+        _, algorithm, public_key, _ = entry
+        return jwt.decode(token, public_key, algorithms=[algorithm])
+
+    def jwks(self):
+        """
+        :return: The JWK Set of the published public keys.
+        """
+        return self._jwks
+
+    def _publish(self):
+        self._jwks = {'keys': [entry[3] for entry in self._keys.values()]}
+
+class JWKSCache:
+    """
+    Public keys of the authorization server indexed by key ID.
+
+    Keys are only ever fetched by a background task: periodically, and early when a
+    token with an unknown ``kid`` was seen, at most once per ``min_interval``.
+    """
+    def __init__(self, url=None, interval=None, min_interval=None):
+        """
+        Initialize the cache.
+
+        :param url: JWKS URL, settings.JWKS_ENDPOINT on the authorization server by default.
+        :param interval: Seconds between refreshes, defaults to settings.JWKS_REFRESH_INTERVAL.
+        :param min_interval: Minimum seconds between two refreshes, defaults to
+                             settings.JWKS_MIN_REFRESH_INTERVAL.
+        """
+        self.url = url or (f"http://{settings.AUTHORIZATION_HOST}:{settings.AUTHORIZATION_PORT}"
+                           f"{settings.JWKS_ENDPOINT}")
+        self.interval = settings.JWKS_REFRESH_INTERVAL if interval is None else interval
+        self.min_interval = settings.JWKS_MIN_REFRESH_INTERVAL if min_interval is None else min_interval
+        self._keys = {}
+        self._wakeup = None
+        self._task = None
+        self.last_refresh = None
+
+    def get(self, kid):
+        """
+        Return the parsed public key for a key ID.
+
+        :param kid: Key ID from the token header.
+        :return: A jwt.PyJWK, or None if the key is unknown.
+        """
+        return self._keys.get(kid)
+
+    def load(self, jwks):
+        """
+        Replace the cached keys with those of a JWK Set.
+
+        Keys that fail to parse or use an unsupported algorithm are skipped.
+
+        :param jwks: JWK Set dict.
+        """
+        keys = {}
+        for jwk in jwks.get('keys', ()):
+            if jwk.get('alg') not in ASYMMETRIC_ALGORITHMS or not jwk.get('kid'):
+                continue
+            try:
+                keys[jwk['kid']] = jwt.PyJWK(jwk)
+            except jwt.PyJWTError:
+                continue
+        self._keys = keys
+        self.last_refresh = time.monotonic()
+
+    async def refresh(self):
+        """Fetch the JWK Set once."""
+        async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=settings.HTTP_TOTAL_TIMEOUT)) as session:
+            async with session.get(self.url) as response:
+                response.raise_for_status()
+                self.load(await response.json(loads=loads))
+
+    def request_refresh(self):
+        """
+        Ask the background task to refresh soon, e.g. after seeing an unknown key ID.
+
+        Starts the background task if it is not running.
+        """
+        if self._task is None or self._task.done():
+            self.start()
+        self._wakeup.set()
+
+    def start(self):
+        """Start the background refresh task on the running event loop."""
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        """Stop the background refresh task."""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            if self.last_refresh is not None:
+                wait = self.last_refresh + self.min_interval - time.monotonic()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+            try:
+                await self.refresh()
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError):
+                # Keep serving the keys we have; try again next round.
+                self.last_refresh = time.monotonic()
+
+SIGNING_KEYS = web.AppKey("signing_keys", SigningKeyRing)
+JWKS_CACHE = web.AppKey("jwks_cache", JWKSCache)
+
+_default_signing_keys = None
+_default_jwks_cache = None
+
+def get_signing_keys(app):
+    """
+    Return the signing key ring configured on an aiohttp application.
+
+    Applications without one share a ring built from settings on first use.
+
+    :param app: The aiohttp application.
+    :return: A SigningKeyRing.
+    """
+    ring = app.get(SIGNING_KEYS)
+    if ring is None:
+        global _default_signing_keys
+        if _default_signing_keys is None:
+            _default_signing_keys = SigningKeyRing.from_settings()
+        ring = _default_signing_keys
+    return ring
+
+def get_jwks_cache(app):
+    """
+    Return the JWKS cache configured on an aiohttp application.
+
+    Applications without one share a cache built from settings on first use.
+
+    :param app: The aiohttp application.
+    :return: A JWKSCache.
+    """
+    cache = app.get(JWKS_CACHE)
+    if cache is None:
+        global _default_jwks_cache
+        if _default_jwks_cache is None:
+            _default_jwks_cache = JWKSCache()
+        cache = _default_jwks_cache
+    return cache
+
+async def jwks_refresher(app):
+    """
+    aiohttp cleanup context loading the JWKS at startup and refreshing it in the background.
+
+    :param app: The resource API aiohttp application.
+    """
+    cache = get_jwks_cache(app)
+    try:
+        await cache.refresh()
+    except (aiohttp.ClientError, asyncio.TimeoutError, ValueError):
+        # The authorization server may start later; the background task retries.
+        pass
+    cache.start()
+    yield
+    await cache.stop()
@@ -0,0 +1,238 @@
+"""
+Lightweight in-process metrics with a Prometheus text exposition.
+
+Counters, gauges and histograms live in a Registry; REGISTRY is shared by the
+mock servers and the client handlers of a process. Label children are created
+once and reused, so recording a sample on the hot path is a dict lookup and an
+addition. Servers expose the registry at /metrics through metrics_handler, and
+Client.metrics_snapshot returns the client's share as a dict.
+"""
+import time
+from bisect import bisect_left
+from functools import wraps
+from aiohttp import web
+
+# Latency buckets in seconds, from sub-millisecond cache hits to slow KDFs.
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def _format_labels(labelnames, values, extra=()):
+    pairs = list(zip(labelnames, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{value}"' for name, value in pairs) + '}'
+
+class _Metric:
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        # Children by label values as passed to labels(), e.g. both 200 and '200'.
+        self._lookup = {}
+        if not self.labelnames:
+            self._default = self._children[()] = self._new_child()
+
+    def labels(self, *values):
+        """
+        Return the child for a combination of label values, creating it on first use.
+
+        :param values: Label values, in the order of the metric's label names.
+        :return: The child metric.
+        """
+        child = self._lookup.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}")
+            key = tuple(str(value) for value in values)
+            child = self._children.get(key)
+            if child is None:
+                child = self._children[key] = self._new_child()
+            self._lookup[values] = child
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+class _Value:
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def dec(self, amount=1):
+        self.value -= amount
+
+    def set(self, value):
+        self.value = value
+
+class Counter(_Metric):
+    """A monotonically increasing count."""
+    type = 'counter'
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount=1):
+        self._default.value += amount
+
+    def samples(self):
+        for values, child in self._children.items():
+            yield self.name, values, (), child.value
+
+    def snapshot(self):
+        return {','.join(values): child.value for values, child in self._children.items()}
+
+class Gauge(Counter):
+    """A value that goes up and down, e.g. requests in flight."""
+    type = 'gauge'
+
+    def dec(self, amount=1):
+        self._default.value -= amount
+
+    def set(self, value):
+        self._default.value = value
+
+class _HistogramValue:
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+class Histogram(_Metric):
+    """Distribution of observed values, e.g. latencies in seconds."""
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value):
+        self._default.observe(value)
+
+    def samples(self):
+        for values, child in self._children.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), child.counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                yield self.name + '_bucket', values, (('le', le),), cumulative
+            yield self.name + '_sum', values, (), child.sum
+            yield self.name + '_count', values, (), child.count
+
+    def snapshot(self):
+        return {
+            ','.join(values): {
+                'count': child.count,
+                'sum': child.sum,
+                'buckets': dict(zip(self.buckets + (float('inf'),), child.counts)),
+            }
+            for values, child in self._children.items()
+        }
+
+class Registry:
+    """
+    A named collection of metrics.
+    """
+    def __init__(self):
+        self._metrics = {}
+
+    def counter(self, name, documentation, labelnames=()):
+        """Return the counter called name, creating it if needed."""
+        return self._get_or_create(Counter, name, documentation, labelnames)
+
+    def gauge(self, name, documentation, labelnames=()):
+        """Return the gauge called name, creating it if needed."""
+        return self._get_or_create(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        """Return the histogram called name, creating it if needed."""
+        return self._get_or_create(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def _get_or_create(self, cls, name, documentation, labelnames, **kwargs):
+        metric = self._metrics.get(name)
+        if metric is None:
+            metric = self._metrics[name] = cls(name, documentation, labelnames, **kwargs)
+        elif type(metric) is not cls:
+            raise ValueError(f"{name} is already registered as a {metric.type}")
+        return metric
+
+    def render(self):
+        """
+        :return: Every metric in the Prometheus text exposition format.
+        """
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for name, values, extra, value in metric.samples():
+                lines.append(f"{name}{_format_labels(metric.labelnames, values, extra)} {value}")
+        return '\n'.join(lines) + '\n'
+
+    def snapshot(self, prefix=''):
+        """
+        Return the current values as plain data.
+
+        :param prefix: Only include metrics whose name starts with prefix.
+        :return: Dict mapping metric name to its values keyed by comma-joined label values.
+        """
+        return {name: metric.snapshot() for name, metric in self._metrics.items() if name.startswith(prefix)}
+
+REGISTRY = Registry()
+
+def instrument_handler(prefix, registry=REGISTRY):
+    """
+    Decorate an aiohttp request handler with latency, in-flight and response status metrics.
+
+    :param prefix: Metric name prefix, e.g. 'auth_server_authenticate'.
+    :param registry: Registry holding the metrics.
+    :return: The decorator.
+    """
+    latency = registry.histogram(f'{prefix}_duration_seconds', 'Request handling latency in seconds.')
+    in_flight = registry.gauge(f'{prefix}_in_flight', 'Requests being handled.')
+    responses = registry.counter(f'{prefix}_responses_total', 'Responses by HTTP status.', ('status',))
+
+    def decorator(handler):
+        @wraps(handler)
+        async def wrapper(request):
+            in_flight.inc()
+            started = time.perf_counter()
+            status = 500
+            try:
+                response = await handler(request)
+                status = response.status
+                return response
+            except web.HTTPException as error:
+                status = error.status
+                raise
+            finally:
+                latency.observe(time.perf_counter() - started)
+                in_flight.dec()
+                responses.labels(status).inc()
+        return wrapper
+    return decorator
+
+async def metrics_handler(request):
+    """
+    Expose the process metrics in the Prometheus text format.
+
+    :param request: The HTTP request object.
+    :return: A plain-text response.
+    """
+    return web.Response(text=REGISTRY.render(), content_type='text/plain', charset='utf-8',
+                        headers={'Cache-Control': 'no-store'})
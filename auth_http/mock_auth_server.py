@@ -6,20 +6,74 @@ It is only intended to illustrate the basic concepts of an authorization server.
 """
 from aiohttp import web
 import base64
-import hashlib
+import logging
+import time
+import uuid
 import jwt
+from auth_http.access_log import ACCESS_LOG_USER, setup_access_log
+from auth_http.config import CONFIG, get_config
+from auth_http.credential_store import get_credential_store, setup_credential_store
+from auth_http.keys import SIGNING_KEYS, SigningKeyRing, get_signing_keys
+from auth_http.metrics import instrument_handler, metrics_handler
+from auth_http.password_hashing import (PASSWORD_HASHER, HasherSaturatedError, InvalidCredentialError,
+                                        create_password_hasher, get_password_hasher)
+from auth_http.rate_limit import limit_user, setup_rate_limiting
+from auth_http.revocation import get_revocation_log, setup_revocation_log
+from auth_http.serialization import json_response
 from settings import settings
 
+logger = logging.getLogger(__name__)
+
+def _encode_token(app, user_name, lifetime, **claims):
+    """
+    Sign a JWT for a user with the application's signing key.
+
+    :param app: The aiohttp application.
+    :param user_name: User's name.
+    :param lifetime: Seconds until the token expires.
+    :param claims: Additional claims.
+    :return: The encoded token.
+    """
+    issued_at = int(time.time())
+    payload = {"user_name": user_name, "iat": issued_at, "exp": issued_at + lifetime, "jti": uuid.uuid4().hex}
+    payload.update(claims)
+    return get_signing_keys(app).sign(payload)
+
+def _access_token_response(app, user_name, refresh_token=None):
+    """
+    Build the JSON response carrying a new access token.
+
+    :param app: The aiohttp application.
+    :param user_name: User's name.
+    :param refresh_token: Refresh token to include, if any.
+    :return: A JSON response.
+    """
+    lifetime = get_config(app).ACCESS_TOKEN_TTL
+    response_data = {
+        'access_token': _encode_token(app, user_name, lifetime),
+        'token_type': 'Bearer',
+        'expires_in': lifetime,
+    }
+    if refresh_token:
+        response_data['refresh_token'] = refresh_token
+    return json_response(response_data)
+
+@instrument_handler('auth_server_authenticate')
 async def authenticate(request):
     """
-    Authenticate the client using basic authentication and SHA-256 hashing.
+    Authenticate the client using basic authentication and salted password hashing.
 
     This function handles the authentication process using basic authentication headers.
-    The provided client password is securely hashed using SHA-256 along with a unique salt.
+    The provided client password is hashed with the user's KDF and unique salt in the
+    password hasher's executor, so the event loop is never blocked by the KDF.
 
     :param request: The HTTP request object.
-    :return: A JSON response with an access token if authentication is successful,
-             or an Unauthorized response.
+    :return: A JSON response with a short-lived access token and a refresh token if
+             authentication is successful,
+             an Unauthorized response, a Too Many Requests response when the user is
+             rate limited, a Service Unavailable response when the password hashing
+             queue is full, Bad Request for a malformed Authorization header, or an
+             Internal Server Error response when the user's stored credential is invalid.
     """
     auth_header = request.headers.get('Authorization')
     if not auth_header:
@@ -32,23 +86,157 @@ async def authenticate(request):
 
         decoded_credentials = base64.b64decode(credentials.encode('utf-8')).decode('utf-8')
         user_name, password = decoded_credentials.split(':')
+    except (ValueError, UnicodeDecodeError):
+        return web.Response(status=400, text='Bad Request')
 
-        if user_name in settings.AUTH_CREDENTIALS:
-            stored_salt = settings.AUTH_CREDENTIALS[user_name]['salt']
-            stored_hash = settings.AUTH_CREDENTIALS[user_name]['hash']
+    request[ACCESS_LOG_USER] = user_name
+    limited = limit_user(request, user_name)
+    if limited is not None:
+        return limited
 
-            hashed_secret = hashlib.sha256(password.encode() + stored_salt).hexdigest()
+    credential = get_credential_store(request.app).get(user_name)
+    if credential is not None:
+        try:
+            verified = await get_password_hasher(request.app).verify(credential, password)
+        except HasherSaturatedError:
+            return web.Response(status=503, text='Service Unavailable',
+                                headers={'Retry-After': str(get_config(request.app).PASSWORD_HASH_RETRY_AFTER)})
+        except InvalidCredentialError:
+            # The stored credential is broken, not the client's request.
+            logger.exception("Invalid stored credential for user %s", user_name)
+            return web.Response(status=500, text='Internal Server Error')
+        if verified:
+            refresh_token = _encode_token(request.app, user_name, get_config(request.app).REFRESH_TOKEN_TTL,
+                                          typ="refresh")
+            return _access_token_response(request.app, user_name, refresh_token)
 
-            if stored_hash == hashed_secret:
-                access_token = jwt.encode({"user_name": user_name}, settings.JWT_SECRET_KEY, algorithm="HS256")
-                response_data = {'access_token': access_token}
-                return web.json_response(response_data)
+    return web.Response(status=401, text='Unauthorized', headers={'WWW-Authenticate': 'Basic'})
 
-        return web.Response(status=401, text='Unauthorized', headers={'WWW-Authenticate': 'Basic'})
+@instrument_handler('auth_server_refresh')
+async def refresh(request):
+    """
+    Issue a new access token in exchange for a refresh token.
 
-    except (ValueError, UnicodeDecodeError):
+    Unlike authenticate this involves no password hashing: the refresh token's
+    signature and expiry are checked, it must not be revoked and the user must
+    still exist.
+
+    :param request: The HTTP request object with the refresh token as Bearer credentials.
+    :return: A JSON response with a new access token, or an Unauthorized response.
+    """
+    auth_header = request.headers.get('Authorization')
+    if not auth_header:
+        return web.Response(status=401, text='Unauthorized', headers={'WWW-Authenticate': 'Bearer'})
+
+    try:
+        auth_type, refresh_token = auth_header.split()
+        if auth_type.lower() != 'bearer':
+            raise ValueError
+        payload = get_signing_keys(request.app).verify(refresh_token)
+        user_name = request[ACCESS_LOG_USER] = payload.get('user_name')
+        if (payload.get('typ') != 'refresh' or user_name not in get_credential_store(request.app)
+                or get_revocation_log(request.app).is_revoked(payload.get('jti'))):
+            return web.Response(status=401, text='Unauthorized', headers={'WWW-Authenticate': 'Bearer'})
+        return _access_token_response(request.app, user_name)
+    except jwt.ExpiredSignatureError:
+        return web.Response(status=401, text='Token has expired')
+    except (jwt.InvalidTokenError, ValueError):
+        return web.Response(status=401, text='Invalid token')
+
+async def revoke(request):
+    """
+    Revoke an access or refresh token, in the manner of RFC 7009.
+
+    Whoever holds a token may revoke it. Tokens that are invalid, expired or carry
+    no ``jti`` need no revocation and are acknowledged all the same.
+
+    :param request: The HTTP request object with the token in the form field 'token'.
+    :return: An empty OK response, or a Bad Request response if no token was sent.
+    """
+    token = (await request.post()).get('token')
+    if not token:
+        return web.Response(status=400, text='Bad Request')
+    try:
+        payload = get_signing_keys(request.app).verify(token)
+    except jwt.InvalidTokenError:
+        return web.Response()
+    jti, exp = payload.get('jti'), payload.get('exp')
+    if jti and isinstance(exp, (int, float)):
+        get_revocation_log(request.app).revoke(jti, exp)
+    return web.Response()
+
+async def revocations(request):
+    """
+    Publish the revocations after a version of the revocation log.
+
+    :param request: The HTTP request object with the query parameters 'since', 'epoch' and 'limit'.
+    :return: A JSON response described by RevocationLog.changes, or Bad Request.
+    """
+    try:
+        since = int(request.query.get('since', 0))
+        limit = int(request.query.get('limit', get_config(request.app).REVOCATION_PAGE_SIZE))
+        if since < 0 or limit <= 0:
+            raise ValueError
+    except ValueError:
         return web.Response(status=400, text='Bad Request')
+    return json_response(get_revocation_log(request.app).changes(since, request.query.get('epoch'), limit))
+
+async def jwks(request):
+    """
+    Publish the public keys that verify issued tokens as a JWK Set.
+
+    :param request: The HTTP request object.
+    :return: A JSON response with the JWK Set.
+    """
+    max_age = int(get_config(request.app).JWKS_REFRESH_INTERVAL)
+    return json_response(get_signing_keys(request.app).jwks(), headers={'Cache-Control': f'max-age={max_age}'})
 
-app = web.Application()
-app.router.add_post('/authenticate', authenticate)
+async def _close_password_hasher(app):
+    # Requests are drained by now. Waiting lets a process pool stop its processes before
+    # the worker exits; multiprocessing's exit handlers would otherwise close the pool's
+    # queue before it was told to stop, leaving the processes orphaned.
+    app[PASSWORD_HASHER].close(wait=True)
+
+def create_app(config=None, signing_keys=None):
+    """
+    Build the authorization server application.
+
+    The handlers read their settings from the config stored on the application,
+    which also owns a credential store, signing key ring, revocation log and
+    password hasher built from the config. The hasher's executor is shut down on cleanup, so a
+    worker process using a process pool exits without leaving the pool's
+    processes behind.
+
+    :param config: Settings object, the module's settings by default.
+    :param signing_keys: SigningKeyRing to sign with, built from the config by default. The
+                         workers of auth_http.server share one ring built before forking.
+    :return: The aiohttp application.
+    """
+    config = settings if config is None else config
+    app = web.Application()
+    app[CONFIG] = config
+    app[SIGNING_KEYS] = signing_keys if signing_keys is not None else SigningKeyRing.from_settings(config)
+    setup_credential_store(app, config)
+    setup_revocation_log(app, config)
+    app[PASSWORD_HASHER] = create_password_hasher(config)
+    app.on_cleanup.append(_close_password_hasher)
+    if config.ACCESS_LOG_PATH:
+        setup_access_log(app, config.ACCESS_LOG_PATH)
+    if config.RATE_LIMIT_ENABLED:
+        setup_rate_limiting(app, config)
+    app.router.add_post(config.AUTHORIZATION_ENDPOINT, authenticate)
+    app.router.add_post(config.REFRESH_ENDPOINT, refresh)
+    app.router.add_get(config.JWKS_ENDPOINT, jwks)
+    app.router.add_post(config.REVOKE_ENDPOINT, revoke)
+    app.router.add_get(config.REVOCATIONS_ENDPOINT, revocations)
+    app.router.add_get('/metrics', metrics_handler)
+    return app
 
+def __getattr__(name):
+    # The module-level `app` is only built when first used, so importing the
+    # handlers does not construct an application.
+    if name == 'app':
+        global app
+        app = create_app()
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
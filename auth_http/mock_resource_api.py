@@ -1,15 +1,75 @@
+import time
 import jwt
 from aiohttp import web
+from auth_http.access_log import ACCESS_LOG_USER, setup_access_log
+from auth_http.config import CONFIG, get_config
+from auth_http.credential_store import get_credential_store, setup_credential_store
+from auth_http.keys import JWKS_CACHE, JWKSCache, get_jwks_cache, jwks_refresher
+from auth_http.metrics import REGISTRY, instrument_handler, metrics_handler
+from auth_http.rate_limit import limit_user, setup_rate_limiting
+from auth_http.revocation import REVOCATION_LIST, RevocationList, get_revocation_list, revocation_syncer
+from auth_http.resources import DATASET, NDJSON_CONTENT_TYPE, Dataset, decode_cursor, get_dataset
+from auth_http.serialization import dumps, json_response
+from auth_http.verified_token_cache import VERIFIED_TOKEN_CACHE, VerifiedTokenCache, get_verified_token_cache
 from settings import settings
 
+_JWT_VERIFY_SECONDS = REGISTRY.histogram(
+    'resource_api_jwt_verify_seconds', 'Time to verify an access token signature.')
+_TOKEN_CACHE = REGISTRY.counter(
+    'resource_api_verified_token_cache_total', 'Access tokens by verified-token cache result.', ('result',))
+_TOKEN_CACHE_HIT = _TOKEN_CACHE.labels('hit')
+_TOKEN_CACHE_MISS = _TOKEN_CACHE.labels('miss')
+
+def verify_token(app, access_token):
+    """
+    Verify an access token's signature and expiry.
+
+    Tokens signed with an asymmetric key are checked against the public key cached
+    under their ``kid``; an unknown ``kid`` makes the background JWKS refresh run
+    early but is rejected right away. HS256 tokens are rejected unless the
+    application's JWT_SECRET_KEY is configured, which is empty by default, so a
+    resource node does not hold a signing secret unless it opts in.
+
+    :param app: The resource API aiohttp application.
+    :param access_token: Encoded access token.
+    :return: The decoded payload.
+    :raises jwt.InvalidTokenError: If the token cannot be verified.
+    """
+    header = jwt.get_unverified_header(access_token)
+    if header.get('alg') == 'HS256':
+        secret = get_config(app).JWT_SECRET_KEY
+        if not secret:
+            raise jwt.InvalidAlgorithmError("Shared-secret tokens are not accepted")
+        return jwt.decode(access_token, secret, algorithms=["HS256"])
+
+    jwks_cache = get_jwks_cache(app)
+    key = jwks_cache.get(header.get('kid'))
+    if key is None:
+        jwks_cache.request_refresh()
+        raise jwt.InvalidTokenError("Unknown signing key")
+    return jwt.decode(access_token, key.key, algorithms=[key.algorithm_name])
+
+@instrument_handler('resource_api_get_data')
 async def get_data(request):
     """
     Endpoint to simulate fetching data from the Resource API.
 
     This endpoint validates the access token and returns mock data as a response.
+    Tokens verified recently are served from the verified-token cache without
+    checking their signature again, but are still checked against the revocation
+    list. Clients accepting NDJSON get the records of the
+    application's dataset streamed one per line instead, and a ``limit`` or
+    ``cursor`` query parameter selects a page of records.
+
+    Every response carries a strong ETag derived from the dataset version; a
+    conditional request whose If-None-Match matches it is answered with 304 Not
+    Modified without rendering the body.
 
     :param request: The HTTP request object.
-    :return: A JSON response with mock data if the token is valid, otherwise Unauthorized response.
+    :return: A JSON response with mock data, a page of records or a streamed NDJSON
+             response if the token is valid, Not Modified, Bad Request for an invalid
+             page, Too Many Requests when the user is rate limited, otherwise
+             Unauthorized response.
     """
     auth_header = request.headers.get('Authorization')
     if not auth_header:
@@ -19,21 +79,164 @@ async def get_data(request):
         auth_type, access_token = auth_header.split()
         if auth_type.lower() != 'bearer':
             raise ValueError
-        # Verify the access token using the SECRET_KEY
-        payload = jwt.decode(access_token, settings.JWT_SECRET_KEY, algorithms=["HS256"])
+        token_cache = get_verified_token_cache(request.app)
+        payload = token_cache.get(access_token)
+        if payload is not None:
+            _TOKEN_CACHE_HIT.inc()
+        else:
+            _TOKEN_CACHE_MISS.inc()
+            # Verify the access token with the authorization server's public key
+            started = time.perf_counter()
+            try:
+                payload = verify_token(request.app, access_token)
+            finally:
+                _JWT_VERIFY_SECONDS.observe(time.perf_counter() - started)
 
-        # Check if the user_name is a valid user
-        user_name = payload.get('user_name')
-        if user_name not in settings.AUTH_CREDENTIALS:
-            return web.Response(status=401, text='Unauthorized')
+            # Refresh tokens are only accepted by the authorization server
+            if payload.get('typ') == 'refresh':
+                return web.Response(status=401, text='Invalid token')
 
-        response_data = {'data': 'mock_data'}
-        return web.json_response(response_data)
+            # Check if the user_name is a valid user
+            user_name = payload.get('user_name')
+            if user_name not in get_credential_store(request.app):
+                return web.Response(status=401, text='Unauthorized')
+            token_cache.put(access_token, payload)
     except jwt.ExpiredSignatureError:
         return web.Response(status=401, text='Token has expired')
-    except (jwt.DecodeError , ValueError):
+    except (jwt.InvalidTokenError, ValueError):
         return web.Response(status=401, text='Invalid token')
 
+    user_name = request[ACCESS_LOG_USER] = payload.get('user_name')
+    # Checked on verified-token cache hits too: a token may be revoked after it was cached.
+    if get_revocation_list(request.app).is_revoked(payload.get('jti')):
+        return web.Response(status=401, text='Token has been revoked')
+
+    limited = limit_user(request, user_name)
+    if limited is not None:
+        return limited
+
+    dataset = get_dataset(request.app)
+    if NDJSON_CONTENT_TYPE in request.headers.get('Accept', ''):
+        representation = 'ndjson'
+    elif 'cursor' in request.query or 'limit' in request.query:
+        try:
+            start = decode_cursor(request.query['cursor']) if 'cursor' in request.query else 0
+            config = get_config(request.app)
+            limit = int(request.query.get('limit', config.RESOURCE_PAGE_SIZE))
+            if not 0 < limit <= config.RESOURCE_MAX_PAGE_SIZE:
+                raise ValueError
+        except ValueError:
+            return web.Response(status=400, text='Bad Request')
+        representation = f'page-{start}-{limit}'
+    else:
+        representation = 'data'
+
+    etag = dataset.etag(representation)
+    headers = {'ETag': f'"{etag}"', 'Cache-Control': 'private, no-cache'}
+    if _etag_matches(request.if_none_match, etag):
+        return web.Response(status=304, headers=headers)
+
+    if representation == 'ndjson':
+        return await stream_records(request, dataset.records(), headers)
+    if representation == 'data':
+        response_data = {'data': 'mock_data'}
+    else:
+        records, next_cursor = dataset.page(start, limit)
+        response_data = {'data': records, 'next_cursor': next_cursor}
+    return json_response(response_data, headers=headers)
+
+def _etag_matches(if_none_match, etag):
+    """
+    Check an If-None-Match header against an entity tag, using the weak comparison RFC 9110 prescribes.
+
+    :param if_none_match: Parsed header, a tuple of aiohttp ETag objects or None.
+    :param etag: Unquoted entity tag of the current representation.
+    :return: True if the client's copy is current.
+    """
+    if not if_none_match:
+        return False
+    return any(tag.value == etag or tag.value == '*' for tag in if_none_match)
+
+async def stream_records(request, records, headers=None):
+    """
+    Stream records as newline-delimited JSON with chunked transfer encoding.
+
+    Lines are buffered up to the application's STREAM_CHUNK_SIZE bytes per write, and each
+    write waits for the transport to drain, so memory use does not grow with the
+    number of records and the first chunk leaves after at most one buffer.
+
+    :param request: The HTTP request object.
+    :param records: Iterable of JSON-serializable records.
+    :param headers: Additional response headers.
+    :return: The prepared and finished StreamResponse.
+    """
+    response = web.StreamResponse(headers=headers)
+    response.content_type = NDJSON_CONTENT_TYPE
+    response.enable_chunked_encoding()
+    await response.prepare(request)
+
+    chunk_size = get_config(request.app).STREAM_CHUNK_SIZE
+    buffer = bytearray()
+    for record in records:
+        buffer += dumps(record)
+        buffer += b'\n'
+        if len(buffer) >= chunk_size:
+            await response.write(bytes(buffer))
+            buffer.clear()
+    if buffer:
+        await response.write(bytes(buffer))
+    await response.write_eof()
+    return response
+
+def remove_user(app, user_name):
+    """
+    Remove a user and invalidate the tokens the resource API has cached for it.
+
+    :param app: The resource API aiohttp application.
+    :param user_name: User's name.
+    """
+    get_credential_store(app).remove(user_name)
+    get_verified_token_cache(app).invalidate_user(user_name)
+
+def create_app(config=None):
+    """
+    Build the resource API application.
+
+    The application syncs signing keys and revoked token IDs from the authorization
+    server at the host and port of the config, checks users against a credential
+    store built from the config, serves a dataset and caches verified tokens as
+    sized by the config, and its handlers read their settings from the config
+    stored on the application.
+
+    :param config: Settings object, the module's settings by default.
+    :return: The aiohttp application.
+    """
+    config = settings if config is None else config
+    auth_base = f"http://{config.AUTHORIZATION_HOST}:{config.AUTHORIZATION_PORT}"
+    app = web.Application()
+    app[CONFIG] = config
+    setup_credential_store(app, config)
+    app[DATASET] = Dataset(config.RESOURCE_RECORD_COUNT)
+    app[VERIFIED_TOKEN_CACHE] = VerifiedTokenCache(config.VERIFIED_TOKEN_CACHE_SIZE, config.VERIFIED_TOKEN_CACHE_TTL)
+    app[JWKS_CACHE] = JWKSCache(url=auth_base + config.JWKS_ENDPOINT, interval=config.JWKS_REFRESH_INTERVAL,
+                                min_interval=config.JWKS_MIN_REFRESH_INTERVAL)
+    app[REVOCATION_LIST] = RevocationList(url=auth_base + config.REVOCATIONS_ENDPOINT,
+                                          interval=config.REVOCATION_SYNC_INTERVAL)
+    if config.ACCESS_LOG_PATH:
+        setup_access_log(app, config.ACCESS_LOG_PATH)
+    if config.RATE_LIMIT_ENABLED:
+        setup_rate_limiting(app, config)
+    app.cleanup_ctx.append(jwks_refresher)
+    app.cleanup_ctx.append(revocation_syncer)
+    app.router.add_get(config.API_ENDPOINT, get_data)
+    app.router.add_get('/metrics', metrics_handler)
+    return app
 
-app = web.Application()
-app.router.add_get('/get_data', get_data)
+def __getattr__(name):
+    # The module-level `app` is only built when first used, so importing the
+    # handlers does not construct an application.
+    if name == 'app':
+        global app
+        app = create_app()
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,210 @@
+"""
+Password hashing for the mock authorization server.
+
+Key derivation runs in a thread or process pool so slow KDFs never block the
+event loop. Each credential records the KDF and parameters its hash was computed
+with, as a '$'-separated string:
+
+- ``sha256``: salted SHA-256, the format of settings.AUTH_CREDENTIALS.
+- ``pbkdf2_sha256$iterations=600000``
+- ``scrypt$n=16384$r=8$p=1``
+"""
+import asyncio
+import hashlib
+import hmac
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from aiohttp import web
+from auth_http.cache import TTLCache
+from auth_http.credential_store import Credential
+from auth_http.metrics import REGISTRY
+from settings import settings
+
+_HASH_SECONDS = REGISTRY.histogram(
+    'auth_server_password_hash_seconds', 'Time to hash a password in the executor, queueing included.')
+_VERIFY_CACHE = REGISTRY.counter(
+    'auth_server_password_verify_cache_total', 'Password verifications by verify cache result.', ('result',))
+_VERIFY_CACHE_HIT = _VERIFY_CACHE.labels('hit')
+_VERIFY_CACHE_MISS = _VERIFY_CACHE.labels('miss')
+
+class HasherSaturatedError(Exception):
+    """Raised when too many password verifications are already queued."""
+    pass
+
+class InvalidCredentialError(ValueError):
+    """Raised when a stored credential's KDF specification is malformed or incomplete."""
+    pass
+
+def parse_kdf(kdf):
+    """
+    Split a KDF specification into its name and integer parameters.
+
+    :param kdf: KDF specification, e.g. 'scrypt$n=16384$r=8$p=1'.
+    :return: Tuple of the KDF name and a dict of parameters.
+    :raises InvalidCredentialError: If the specification is malformed or the KDF is unknown.
+    """
+    name, *params = kdf.split('$')
+    if name not in ('sha256', 'pbkdf2_sha256', 'scrypt'):
+        raise InvalidCredentialError(f"Unknown KDF: {name}")
+    parsed = {}
+    for param in params:
+        key, _, value = param.partition('=')
+        try:
+            parsed[key] = int(value)
+        except ValueError:
+            raise InvalidCredentialError(f"Malformed KDF parameter: {param}") from None
+    return name, parsed
+
+def hash_password(password, salt, kdf):
+    """
+    Hash a password with the given KDF.
+
+    This is a module-level function so it can be sent to a process pool.
+
+    :param password: Password to hash.
+    :param salt: Per-user salt bytes.
+    :param kdf: KDF specification.
+    :return: Hex digest of the derived key.
+    :raises InvalidCredentialError: If the KDF specification is malformed, lacks a parameter
+                                    or has parameters the KDF rejects.
+    """
+    name, params = parse_kdf(kdf)
+    secret = password.encode()
+    if name == 'sha256':
+        return hashlib.sha256(secret + salt).hexdigest()
+    try:
+        if name == 'pbkdf2_sha256':
+            return hashlib.pbkdf2_hmac('sha256', secret, salt, params['iterations']).hex()
+        n, r, p = params['n'], params['r'], params['p']
+        return hashlib.scrypt(secret, salt=salt, n=n, r=r, p=p, maxmem=256 * n * r + 1024 * 1024).hex()
+    except KeyError as error:
+        raise InvalidCredentialError(f"Missing KDF parameter {error} in {kdf}") from None
+    except ValueError as error:
+        raise InvalidCredentialError(f"Invalid KDF parameters in {kdf}: {error}") from None
+
+def make_credential(user_name, password, kdf=None):
+    """
+    Create a Credential with a fresh salt.
+
+    :param user_name: User's name.
+    :param password: User's password.
+    :param kdf: KDF specification, defaults to settings.PASSWORD_KDF.
+    :return: A Credential ready to be added to a credential store.
+    """
+    kdf = kdf or settings.PASSWORD_KDF
+    salt = os.urandom(16)
+    return Credential(user_name, salt, hash_password(password, salt, kdf), kdf)
+
+class PasswordHasher:
+    """
+    Verifies passwords off the event loop with bounded backpressure.
+
+    At most ``max_pending`` verifications may be running or queued in the executor;
+    further calls fail fast with HasherSaturatedError. Successful verifications are
+    remembered for a short time so client retries do not pay the KDF cost again.
+    """
+    def __init__(self, executor, max_pending, cache_size, cache_ttl):
+        """
+        Initialize the hasher.
+
+        :param executor: concurrent.futures.Executor running hash_password.
+        :param max_pending: Maximum number of verifications running or queued.
+        :param cache_size: Maximum number of remembered successful verifications.
+        :param cache_ttl: Seconds a successful verification is remembered.
+        """
+        self._executor = executor
+        self.max_pending = max_pending
+        self.pending = 0
+        self._verified = TTLCache(cache_size, ttl=cache_ttl)
+        # Keyed MAC so the cache never holds a fast, offline-guessable password hash.
+        self._cache_key = os.urandom(32)
+
+    async def verify(self, credential, password):
+        """
+        Check a password against a stored credential.
+
+        :param credential: The user's Credential.
+        :param password: Password presented by the client.
+        :return: True if the password matches.
+        :raises HasherSaturatedError: If the executor queue is full.
+        """
+        key = hmac.new(
+            self._cache_key,
+            b'\x00'.join((credential.user_name.encode(), password.encode(), credential.hash.encode())),
+            hashlib.sha256,
+        ).digest()
+        if self._verified.get(key):
+            _VERIFY_CACHE_HIT.inc()
+            return True
+        _VERIFY_CACHE_MISS.inc()
+
+        if self.pending >= self.max_pending:
+            raise HasherSaturatedError("Password hashing queue is full")
+        self.pending += 1
+        started = time.perf_counter()
+        try:
+            loop = asyncio.get_running_loop()
+            hashed_secret = await loop.run_in_executor(
+                self._executor, hash_password, password, credential.salt, credential.kdf)
+        finally:
+            self.pending -= 1
+            _HASH_SECONDS.observe(time.perf_counter() - started)
+
+        verified = hmac.compare_digest(hashed_secret, credential.hash)
+        if verified:
+            self._verified.set(key, True)
+        return verified
+
+    def close(self, wait=False):
+        """
+        Shut the executor down.
+
+        :param wait: Whether to wait for running hashes and, for a process pool, its processes to exit.
+        """
+        self._executor.shutdown(wait=wait)
+
+def create_password_hasher(config=settings):
+    """
+    Build a PasswordHasher from settings.
+
+    :param config: Settings object; PASSWORD_HASH_EXECUTOR selects a 'thread' or 'process' pool.
+    :return: A PasswordHasher.
+    :raises ValueError: If the executor kind is unknown.
+    """
+    kind = config.PASSWORD_HASH_EXECUTOR
+    if kind == 'thread':
+        executor = ThreadPoolExecutor(config.PASSWORD_HASH_WORKERS, thread_name_prefix='password-hash')
+    elif kind == 'process':
+        # Loading the process pool pulls in multiprocessing; only pay for it when configured.
+        from concurrent.futures import ProcessPoolExecutor
+        executor = ProcessPoolExecutor(config.PASSWORD_HASH_WORKERS)
+    else:
+        raise ValueError(f"Unknown password hash executor: {kind}")
+    return PasswordHasher(
+        executor,
+        max_pending=config.PASSWORD_HASH_MAX_PENDING,
+        cache_size=config.PASSWORD_VERIFY_CACHE_SIZE,
+        cache_ttl=config.PASSWORD_VERIFY_CACHE_TTL,
+    )
+
+PASSWORD_HASHER = web.AppKey("password_hasher", PasswordHasher)
+
+_default_hasher = None
+
+def get_password_hasher(app):
+    """
+    Return the password hasher configured on an aiohttp application.
+
+    Applications without one share a hasher built from settings on first use.
+
+    :param app: The aiohttp application.
+    :return: A PasswordHasher.
+    """
+    hasher = app.get(PASSWORD_HASHER)
+    if hasher is None:
+        global _default_hasher
+        if _default_hasher is None:
+            _default_hasher = create_password_hasher()
+        hasher = _default_hasher
+    return hasher
@@ -0,0 +1,305 @@
+"""
+Declarative request pipeline.
+
+A Pipeline runs a list of stages over one RequestContext. Each stage names the
+stages it requires; the pipeline orders them into levels once, when it is
+built, and runs the stages of a level concurrently, e.g. authentication next to
+a prefetch of public data. Stages communicate through the context's slots
+instead of keyword arguments, so no dict is copied from one stage to the next.
+
+The time spent in each stage is kept in the context and in the
+``client_pipeline_stage_seconds`` histogram. A stage can end the request early
+by setting ``context.done``, which is how a caching stage answers without
+reaching the resource API; the stages of later levels are then skipped.
+
+Pipelines are assembled from specs, settings.PIPELINE_STAGES by default: a
+stage type name, or a dict with the type under 'stage' and the keyword
+arguments of its factory, e.g.::
+
+    ["authenticate", {"stage": "prefetch", "name": "jwks", "url": "http://localhost:8080/.well-known/jwks.json"},
+     {"stage": "fetch", "resilient": false}]
+"""
+import asyncio
+import time
+from yarl import URL
+from auth_http.exceptions import AuthorizationError, DataFetchError
+from auth_http.handlers import AuthorizationHandler, DataFetchingHandler
+from auth_http.metrics import REGISTRY
+from auth_http.resilience import ResilienceHandler
+from auth_http.serialization import loads
+from settings import settings
+
+_STAGE_SECONDS = REGISTRY.histogram(
+    'client_pipeline_stage_seconds', 'Time spent in each pipeline stage.', ('stage',))
+
+class RequestContext:
+    """
+    State of one request travelling through a Pipeline.
+    """
+    __slots__ = ('user_name', 'password', 'access_token', 'data', 'results', 'timings', 'done', 'extras')
+
+    def __init__(self, user_name=None, password=None, **extras):
+        """
+        :param user_name: User's name.
+        :param password: User's password.
+        :param extras: Additional request arguments, for custom stages.
+        """
+        self.user_name = user_name
+        self.password = password
+        self.access_token = None
+        # Result of the request.
+        self.data = None
+        # Outputs of stages that do not produce the result, by stage name.
+        self.results = {}
+        # Seconds spent in each stage that ran, by stage name.
+        self.timings = {}
+        # Set by a stage to skip the stages of later levels.
+        self.done = False
+        self.extras = extras
+
+    def __repr__(self):
+        return (f"RequestContext(user_name={self.user_name!r}, data={self.data!r}, "
+                f"timings={self.timings!r}, done={self.done!r})")
+
+class Stage:
+    """
+    Base class of pipeline stages.
+    """
+    def __init__(self, name, requires=()):
+        """
+        :param name: Stage name, unique within a pipeline.
+        :param requires: Names of the stages that must finish before this one starts.
+        """
+        self.name = name
+        self.requires = tuple(requires)
+
+    async def run(self, context):
+        """
+        Process the request.
+
+        :param context: The RequestContext.
+        """
+        raise NotImplementedError
+
+    def on_failure(self, context, error):
+        """
+        Called when a later stage failed, for stages that ran.
+
+        :param context: The RequestContext.
+        :param error: The exception the pipeline is about to raise.
+        """
+
+class AuthenticateStage(Stage):
+    """
+    Stage putting a valid access token in the context.
+    """
+    def __init__(self, transport, name='authenticate', requires=(), token_cache=None, url=None,
+                 refresh_url=None):
+        """
+        :param transport: Transport whose auth_session is used.
+        :param name: Stage name.
+        :param requires: Names of the stages that must finish first.
+        :param token_cache: TokenCache used to reuse access tokens.
+        :param url: Authentication endpoint URL.
+        :param refresh_url: Token refresh endpoint URL.
+        """
+        super().__init__(name, requires)
+        self.handler = AuthorizationHandler(http_client=transport.auth_session, token_cache=token_cache,
+                                            url=url, refresh_url=refresh_url)
+
+    async def run(self, context):
+        try:
+            context.access_token = await self.handler.get_access_token(context.user_name, context.password)
+        except Exception as e:
+            raise AuthorizationError(e) from e
+        if not context.access_token:
+            raise AuthorizationError("Authentication failed")
+
+    def on_failure(self, context, error):
+        # A token rejected by the resource API is not reused.
+        if isinstance(error, DataFetchError) and error.status == 401:
+            self.handler.invalidate_token(context.user_name, context.password)
+
+class FetchStage(Stage):
+    """
+    Stage fetching the user's data from the resource API into ``context.data``.
+    """
+    def __init__(self, transport, name='fetch', requires=('authenticate',), url=None, resilient=True,
+                 response_cache=None):
+        """
+        :param transport: Transport whose resource_session is used.
+        :param name: Stage name.
+        :param requires: Names of the stages that must finish first, one of them setting the access token.
+        :param url: Resource API endpoint URL.
+        :param resilient: Whether to retry, hedge and circuit-break the call with a ResilienceHandler.
+        :param response_cache: TTLCache of responses revalidated with If-None-Match.
+        """
+        super().__init__(name, requires)
+        handler = DataFetchingHandler(http_client=transport.resource_session, url=url,
+                                      response_cache=response_cache)
+        self.handler = ResilienceHandler(handler, endpoint='resource') if resilient else handler
+
+    async def run(self, context):
+        try:
+            context.data = await self.handler.handle_request(access_token=context.access_token)
+        except DataFetchError:
+            raise
+        except Exception as e:
+            # E.g. a CircuitOpenError, raised without calling the resource API.
+            raise DataFetchError(e, status=getattr(e, 'status', None)) from e
+
+class PrefetchStage(Stage):
+    """
+    Stage GETting a public JSON resource into ``context.results``, without credentials.
+    """
+    def __init__(self, transport, url, name='prefetch', requires=(), session='resource'):
+        """
+        :param transport: Transport providing the HTTP session.
+        :param url: URL of the resource.
+        :param name: Stage name, also the key of the result.
+        :param requires: Names of the stages that must finish first.
+        :param session: 'resource' or 'auth', the transport's session to use.
+        """
+        super().__init__(name, requires)
+        self._url = URL(url)
+        self._http_client = transport.auth_session if session == 'auth' else transport.resource_session
+
+    async def run(self, context):
+        try:
+            async with self._http_client.get(self._url) as response:
+                response.raise_for_status()
+                context.results[self.name] = await response.json(loads=loads)
+        except Exception as e:
+            raise DataFetchError(f"Prefetch of {self._url} failed", status=getattr(e, 'status', None)) from e
+
+STAGE_TYPES = {
+    'authenticate': AuthenticateStage,
+    'fetch': FetchStage,
+    'prefetch': PrefetchStage,
+}
+
+def register_stage(stage_type, factory):
+    """
+    Make a stage type available to build_pipeline.
+
+    :param stage_type: Name used in pipeline specs.
+    :param factory: Callable taking the transport and the spec's options, returning a Stage.
+    """
+    STAGE_TYPES[stage_type] = factory
+
+class Pipeline:
+    """
+    Runs stages over a RequestContext, concurrently where their requirements allow.
+
+    Pipelines can stand in for the head of a handler chain: Client calls
+    ``handle_request(user_name, password)`` on either.
+    """
+    def __init__(self, stages):
+        """
+        :param stages: Stages, in the order they run within a level.
+        :raises ValueError: If stage names repeat, or requirements are unknown or circular.
+        """
+        self.stages = list(stages)
+        self.levels = self._order(self.stages)
+        # Bound once, so timing a stage does not look up its labels.
+        self._timers = {stage.name: _STAGE_SECONDS.labels(stage.name) for stage in self.stages}
+
+    async def handle_request(self, user_name, password, **kwargs):
+        """
+        Process a request.
+
+        :param user_name: User's name.
+        :param password: User's password.
+        :param kwargs: Additional request arguments, stored in the context's extras.
+        :return: The context's data once the pipeline finished.
+        """
+        context = await self.run(RequestContext(user_name, password, **kwargs))
+        return context.data
+
+    async def run(self, context):
+        """
+        Run the stages over a context.
+
+        When a stage fails, every stage that ran is notified through on_failure
+        and the error is raised.
+
+        :param context: The RequestContext.
+        :return: The context.
+        """
+        try:
+            for level in self.levels:
+                if len(level) == 1:
+                    await self._run_stage(level[0], context)
+                else:
+                    await self._run_level(level, context)
+                if context.done:
+                    break
+        except Exception as error:
+            for stage in self.stages:
+                if stage.name in context.timings:
+                    stage.on_failure(context, error)
+            raise
+        return context
+
+    async def _run_level(self, level, context):
+        tasks = [asyncio.ensure_future(self._run_stage(stage, context)) for stage in level]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            # A failed stage cancels its siblings.
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _run_stage(self, stage, context):
+        started = time.perf_counter()
+        try:
+            await stage.run(context)
+        finally:
+            elapsed = time.perf_counter() - started
+            context.timings[stage.name] = elapsed
+            self._timers[stage.name].observe(elapsed)
+
+    @staticmethod
+    def _order(stages):
+        """
+        Group stages into levels whose stages only require stages of earlier levels.
+        """
+        names = [stage.name for stage in stages]
+        if len(set(names)) != len(names):
+            raise ValueError(f"Duplicate pipeline stage names: {names}")
+        for stage in stages:
+            unknown = [name for name in stage.requires if name not in names]
+            if unknown:
+                raise ValueError(f"Stage {stage.name} requires unknown stages: {unknown}")
+        levels = []
+        placed = set()
+        remaining = list(stages)
+        while remaining:
+            level = [stage for stage in remaining if placed.issuperset(stage.requires)]
+            if not level:
+                raise ValueError(f"Circular stage requirements: {[stage.name for stage in remaining]}")
+            levels.append(level)
+            placed.update(stage.name for stage in level)
+            remaining = [stage for stage in remaining if stage.name not in placed]
+        return levels
+
+def build_pipeline(transport, specs=None):
+    """
+    Assemble a Pipeline from stage specs.
+
+    :param transport: Transport whose sessions the stages use.
+    :param specs: List of stage type names or dicts with the type under 'stage' and the
+                  factory's keyword arguments, defaults to settings.PIPELINE_STAGES.
+    :return: A Pipeline.
+    :raises ValueError: If a stage type is unknown or the stages cannot be ordered.
+    """
+    stages = []
+    for spec in settings.PIPELINE_STAGES if specs is None else specs:
+        options = {'stage': spec} if isinstance(spec, str) else dict(spec)
+        stage_type = options.pop('stage')
+        factory = STAGE_TYPES.get(stage_type)
+        if factory is None:
+            raise ValueError(f"Unknown pipeline stage type: {stage_type}")
+        stages.append(factory(transport, **options))
+    return Pipeline(stages)
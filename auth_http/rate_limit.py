@@ -0,0 +1,181 @@
+"""
+Rate limiting and admission control for the mock servers.
+
+setup_rate_limiting installs a middleware that sheds load before any handler
+work is done: requests beyond settings.MAX_CONCURRENT_REQUESTS in flight are
+answered with 503, and each source IP is limited by a token bucket answering
+429. Users are only known once a handler has parsed the credentials, so
+handlers call limit_user to charge the user's bucket before doing expensive
+work such as password hashing. A user has one bucket per source IP, so
+failed logins sent from elsewhere cannot lock the user out. Every rejection
+carries a Retry-After header.
+
+Buckets live in a dict keyed by IP or by (IP, user name) and are evicted once
+idle long enough to have refilled, so memory follows the number of active
+clients.
+"""
+import math
+import time
+from aiohttp import web
+from auth_http.metrics import REGISTRY
+from settings import settings
+
+_REJECTIONS = REGISTRY.counter('server_rate_limited_total', 'Requests rejected by rate limiting.', ('reason',))
+_REJECTED_USER = _REJECTIONS.labels('user')
+_REJECTED_IP = _REJECTIONS.labels('ip')
+_REJECTED_OVERLOAD = _REJECTIONS.labels('overload')
+
+class _Bucket:
+    __slots__ = ('tokens', 'updated')
+
+    def __init__(self, tokens, updated):
+        self.tokens = tokens
+        self.updated = updated
+
+class TokenBucketLimiter:
+    """
+    Token buckets, one per key, refilling at ``rate`` tokens per second up to ``burst``.
+    """
+    def __init__(self, rate, burst, idle_timeout=None, clock=time.monotonic):
+        """
+        Initialize the limiter.
+
+        :param rate: Tokens added per second; 0 disables limiting.
+        :param burst: Bucket capacity.
+        :param idle_timeout: Seconds after which an unused bucket is evicted,
+                             defaults to settings.RATE_LIMIT_IDLE_TIMEOUT.
+        :param clock: Monotonic clock.
+        """
+        self.rate = rate
+        self.burst = burst
+        self.idle_timeout = settings.RATE_LIMIT_IDLE_TIMEOUT if idle_timeout is None else idle_timeout
+        # Evicting after the refill time too keeps eviction equivalent to a full bucket.
+        if rate > 0:
+            self.idle_timeout = max(self.idle_timeout, burst / rate)
+        self._clock = clock
+        self._buckets = {}
+        self._next_eviction = clock() + self.idle_timeout
+
+    def acquire(self, key, cost=1):
+        """
+        Take tokens from a key's bucket.
+
+        :param key: Bucket key, e.g. a user name or an IP address.
+        :param cost: Tokens to take.
+        :return: 0 if the tokens were taken, otherwise the seconds until they are available.
+        """
+        if self.rate <= 0:
+            return 0
+        now = self._clock()
+        if now >= self._next_eviction:
+            self.evict_idle(now)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = _Bucket(self.burst, now)
+        else:
+            bucket.tokens = min(self.burst, bucket.tokens + (now - bucket.updated) * self.rate)
+            bucket.updated = now
+        if bucket.tokens >= cost:
+            bucket.tokens -= cost
+            return 0
+        return (cost - bucket.tokens) / self.rate
+
+    def evict_idle(self, now=None):
+        """
+        Drop buckets unused for idle_timeout seconds, which have refilled completely.
+
+        :param now: Current clock value.
+        """
+        now = self._clock() if now is None else now
+        deadline = now - self.idle_timeout
+        for key in [key for key, bucket in self._buckets.items() if bucket.updated <= deadline]:
+            del self._buckets[key]
+        self._next_eviction = now + self.idle_timeout
+
+    def __len__(self):
+        return len(self._buckets)
+
+class RateLimiter:
+    """
+    Per-user and per-IP token buckets and a global limit of requests in flight.
+    """
+    def __init__(self, config=settings, clock=time.monotonic):
+        """
+        Initialize the rate limiter from settings.
+
+        :param config: Settings object providing the RATE_LIMIT_* and MAX_CONCURRENT_REQUESTS values.
+        :param clock: Monotonic clock.
+        """
+        self.users = TokenBucketLimiter(config.RATE_LIMIT_USER_RATE, config.RATE_LIMIT_USER_BURST,
+                                        config.RATE_LIMIT_IDLE_TIMEOUT, clock)
+        self.ips = TokenBucketLimiter(config.RATE_LIMIT_IP_RATE, config.RATE_LIMIT_IP_BURST,
+                                      config.RATE_LIMIT_IDLE_TIMEOUT, clock)
+        self.max_in_flight = config.MAX_CONCURRENT_REQUESTS
+        self.overload_retry_after = config.OVERLOAD_RETRY_AFTER
+        self.exempt_paths = frozenset(config.RATE_LIMIT_EXEMPT_PATHS)
+        self.in_flight = 0
+
+RATE_LIMITER = web.AppKey("rate_limiter", RateLimiter)
+
+def _retry_after(seconds):
+    return str(max(1, math.ceil(seconds)))
+
+def _too_many_requests(wait):
+    return web.Response(status=429, text='Too Many Requests', headers={'Retry-After': _retry_after(wait)})
+
+@web.middleware
+async def rate_limit_middleware(request, handler):
+    """
+    Shed requests beyond the concurrency limit with 503 and rate limit source IPs with 429.
+
+    :param request: The HTTP request object.
+    :param handler: The next handler.
+    :return: The handler's response or a rejection.
+    """
+    limiter = request.app.get(RATE_LIMITER)
+    if limiter is None or request.path in limiter.exempt_paths:
+        return await handler(request)
+    if limiter.max_in_flight and limiter.in_flight >= limiter.max_in_flight:
+        _REJECTED_OVERLOAD.inc()
+        return web.Response(status=503, text='Service Unavailable',
+                            headers={'Retry-After': _retry_after(limiter.overload_retry_after)})
+    wait = limiter.ips.acquire(request.remote)
+    if wait:
+        _REJECTED_IP.inc()
+        return _too_many_requests(wait)
+    limiter.in_flight += 1
+    try:
+        return await handler(request)
+    finally:
+        limiter.in_flight -= 1
+
+def limit_user(request, user_name):
+    """
+    Charge a request to the token bucket of a user at the request's source IP.
+
+    :param request: The HTTP request object.
+    :param user_name: User the request was made for.
+    :return: A 429 response if the user is over its rate from that IP, otherwise None.
+    """
+    limiter = request.app.get(RATE_LIMITER)
+    if limiter is None:
+        return None
+    wait = limiter.users.acquire((request.remote, user_name))
+    if wait:
+        _REJECTED_USER.inc()
+        return _too_many_requests(wait)
+    return None
+
+def setup_rate_limiting(app, config=settings):
+    """
+    Enable rate limiting and admission control on an application.
+
+    Applications set up without it are not limited.
+
+    :param app: The aiohttp application, before it is started.
+    :param config: Settings object.
+    :return: The application's RateLimiter.
+    """
+    limiter = app[RATE_LIMITER] = RateLimiter(config)
+    app.middlewares.append(rate_limit_middleware)
+    return limiter
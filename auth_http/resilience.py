@@ -0,0 +1,294 @@
+"""
+Resilience layer for the handler chain.
+
+ResilienceHandler can be inserted anywhere in the chain and guards the rest of
+it: transient failures of idempotent calls are retried with jittered
+exponential backoff, a hedged second call is started when the first one runs
+longer than the recent p95 latency, and a circuit breaker per endpoint fails
+fast while that endpoint keeps failing.
+
+Only transient failures count: connection errors, timeouts, 429 and 5xx
+statuses found anywhere in an exception's cause chain. A 401 means the
+endpoint is healthy and is passed on without retrying.
+"""
+import asyncio
+import math
+import random
+import time
+from collections import deque
+import aiohttp
+from auth_http.exceptions import CircuitOpenError, TransientError
+from auth_http.handlers import Handler
+from auth_http.metrics import REGISTRY
+from settings import settings
+
+TRANSIENT_STATUSES = frozenset((429, 500, 502, 503, 504))
+
+_BREAKER_STATE = REGISTRY.gauge(
+    'client_circuit_breaker_state', 'Circuit breaker state per endpoint: 0 closed, 1 half-open, 2 open.',
+    ('endpoint',))
+_RETRIES = REGISTRY.counter('client_retries_total', 'Calls retried after a transient failure.', ('endpoint',))
+_HEDGES = REGISTRY.counter('client_hedged_requests_total', 'Hedged second calls started.', ('endpoint',))
+_REJECTED = REGISTRY.counter(
+    'client_circuit_rejected_total', 'Calls failed fast by an open circuit breaker.', ('endpoint',))
+
+def is_transient(error):
+    """
+    Decide whether a failure is worth retrying.
+
+    The exception and its causes are inspected in turn; the first one that is a
+    connection error, a timeout, a TransientError or carries an HTTP status decides.
+
+    :param error: The exception raised by a handler.
+    :return: True for transient failures.
+    """
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        if isinstance(error, CircuitOpenError):
+            return False
+        if isinstance(error, (TransientError, aiohttp.ClientConnectionError, asyncio.TimeoutError, ConnectionError)):
+            return True
+        status = getattr(error, 'status', None)
+        if isinstance(status, int):
+            return status in TRANSIENT_STATUSES
+        error = error.__cause__ or error.__context__
+    return False
+
+class CircuitBreaker:
+    """
+    Fails calls fast after repeated transient failures of an endpoint.
+
+    After ``failure_threshold`` consecutive failures the breaker opens; once
+    ``reset_timeout`` seconds passed a single trial call is let through
+    (half-open), and its outcome closes or re-opens the breaker. Calls admitted
+    before the breaker opened may still finish later; their outcome no longer
+    changes the state.
+    """
+    CLOSED = 'closed'
+    HALF_OPEN = 'half_open'
+    OPEN = 'open'
+
+    _GAUGE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+    def __init__(self, endpoint, failure_threshold=None, reset_timeout=None, clock=time.monotonic):
+        """
+        Initialize the circuit breaker.
+
+        :param endpoint: Endpoint name, used in metrics.
+        :param failure_threshold: Consecutive failures opening the breaker,
+                                  defaults to settings.CIRCUIT_FAILURE_THRESHOLD.
+        :param reset_timeout: Seconds the breaker stays open, defaults to settings.CIRCUIT_RESET_TIMEOUT.
+        :param clock: Monotonic clock.
+        """
+        self.endpoint = endpoint
+        self.failure_threshold = failure_threshold or settings.CIRCUIT_FAILURE_THRESHOLD
+        self.reset_timeout = settings.CIRCUIT_RESET_TIMEOUT if reset_timeout is None else reset_timeout
+        self._clock = clock
+        self._gauge = _BREAKER_STATE.labels(endpoint)
+        self.failures = 0
+        self.opened_at = None
+        self._trial_running = False
+        self._set_state(self.CLOSED)
+
+    def before_call(self):
+        """
+        Admit a call.
+
+        :return: Ticket to pass to after_call: True if the call is the half-open trial.
+        :raises CircuitOpenError: If the breaker is open, or half-open with its trial call running.
+        """
+        if self.state == self.OPEN:
+            if self._clock() - self.opened_at < self.reset_timeout:
+                _REJECTED.labels(self.endpoint).inc()
+                raise CircuitOpenError(f"Circuit breaker of {self.endpoint} is open")
+            self._set_state(self.HALF_OPEN)
+        if self.state == self.HALF_OPEN:
+            if self._trial_running:
+                _REJECTED.labels(self.endpoint).inc()
+                raise CircuitOpenError(f"Circuit breaker of {self.endpoint} is half-open")
+            self._trial_running = True
+            return True
+        return False
+
+    def after_call(self, trial, success):
+        """
+        Record the outcome of an admitted call.
+
+        :param trial: The ticket before_call returned for the call.
+        :param success: True if the endpoint answered, False for a transient failure,
+                        None if the call was abandoned, e.g. cancelled.
+        """
+        if trial:
+            self._trial_running = False
+            if success is None:
+                return
+            if success:
+                self.failures = 0
+                self._set_state(self.CLOSED)
+            else:
+                self._open()
+            return
+        if success is None or self.state != self.CLOSED:
+            # Admitted while closed but finished after the breaker opened: only the trial decides.
+            return
+        if success:
+            self.failures = 0
+            return
+        self.failures += 1
+        if self.failures >= self.failure_threshold:
+            self._open()
+
+    def snapshot(self):
+        """
+        :return: Dict with the breaker's state, consecutive failures and seconds since it opened.
+        """
+        return {
+            'state': self.state,
+            'failures': self.failures,
+            'open_for': None if self.opened_at is None or self.state == self.CLOSED
+            else self._clock() - self.opened_at,
+        }
+
+    def _open(self):
+        self.opened_at = self._clock()
+        self._set_state(self.OPEN)
+
+    def _set_state(self, state):
+        self.state = state
+        self._gauge.set(self._GAUGE_VALUES[state])
+
+_breakers = {}
+
+def get_circuit_breaker(endpoint):
+    """
+    Return the circuit breaker shared by every handler calling an endpoint.
+
+    :param endpoint: Endpoint name.
+    :return: A CircuitBreaker.
+    """
+    breaker = _breakers.get(endpoint)
+    if breaker is None:
+        breaker = _breakers[endpoint] = CircuitBreaker(endpoint)
+    return breaker
+
+def circuit_breaker_states():
+    """
+    :return: Dict mapping endpoint name to its circuit breaker snapshot, for monitoring.
+    """
+    return {endpoint: breaker.snapshot() for endpoint, breaker in _breakers.items()}
+
+class ResilienceHandler(Handler):
+    """
+    Handler retrying, hedging and circuit-breaking the calls to its successor.
+    """
+    def __init__(self, successor=None, endpoint='default', idempotent=True, max_attempts=None, hedge=True,
+                 breaker=None):
+        """
+        Initialize the ResilienceHandler.
+
+        :param successor: The next handler in the chain.
+        :param endpoint: Name of the endpoint the successor calls; handlers with the same
+                         name share a circuit breaker.
+        :param idempotent: Whether calls may be repeated; only idempotent calls are retried or hedged.
+        :param max_attempts: Calls made before giving up, defaults to settings.RESILIENCE_MAX_ATTEMPTS.
+        :param hedge: Whether to start a hedged call once the p95 latency is exceeded.
+        :param breaker: CircuitBreaker to use, the endpoint's shared one by default.
+        """
+        super().__init__(successor)
+        self.endpoint = endpoint
+        self.idempotent = idempotent
+        self.max_attempts = max_attempts or settings.RESILIENCE_MAX_ATTEMPTS
+        self.hedge = hedge
+        self.breaker = breaker if breaker is not None else get_circuit_breaker(endpoint)
+        self._latencies = deque(maxlen=settings.RESILIENCE_LATENCY_WINDOW)
+        self._hedge_delay = None
+        self._samples_since_update = 0
+
+    async def handle_request(self, **kwargs):
+        """
+        Delegate the request to the successor, retrying transient failures.
+
+        :param kwargs: Arguments of the successor's handle_request.
+        :return: Result of the request handling.
+        :raises CircuitOpenError: If the endpoint's circuit breaker is open.
+        """
+        if self._successor is None:
+            return None
+        attempts = self.max_attempts if self.idempotent else 1
+        for attempt in range(attempts):
+            trial = self.breaker.before_call()
+            success = None
+            try:
+                result = await self._call(kwargs)
+                success = True
+                return result
+            except Exception as error:
+                transient = is_transient(error)
+                success = not transient
+                if not transient or attempt + 1 == attempts:
+                    raise
+            finally:
+                self.breaker.after_call(trial, success)
+            _RETRIES.labels(self.endpoint).inc()
+            await asyncio.sleep(self.backoff(attempt))
+
+    def backoff(self, attempt):
+        """
+        Return the delay before a retry, with full jitter.
+
+        :param attempt: Index of the failed attempt, 0 for the first.
+        :return: Seconds to wait, uniformly drawn below the exponential backoff.
+        """
+        ceiling = min(settings.RESILIENCE_BACKOFF_CAP, settings.RESILIENCE_BACKOFF_BASE * 2 ** attempt)
+        return random.uniform(0, ceiling)
+
+    @property
+    def hedge_delay(self):
+        """Seconds after which a hedged call starts, None until enough latencies were observed."""
+        return self._hedge_delay
+
+    async def _call(self, kwargs):
+        delay = self._hedge_delay if self.hedge and self.idempotent else None
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        if delay is None:
+            result = await self._successor.handle_request(**kwargs)
+            self._observe(loop.time() - started)
+            return result
+
+        tasks = {asyncio.ensure_future(self._successor.handle_request(**kwargs))}
+        try:
+            done, tasks = await asyncio.wait(tasks, timeout=delay)
+            if not done:
+                _HEDGES.labels(self.endpoint).inc()
+                tasks.add(asyncio.ensure_future(self._successor.handle_request(**kwargs)))
+            error = None
+            while True:
+                for task in done:
+                    if task.exception() is None:
+                        self._observe(loop.time() - started)
+                        return task.result()
+                    error = task.exception()
+                if not tasks:
+                    raise error
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in tasks:
+                task.cancel()
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _observe(self, latency):
+        """
+        Record a successful call's latency and periodically recompute the hedge delay.
+        """
+        self._latencies.append(latency)
+        self._samples_since_update += 1
+        if len(self._latencies) < settings.RESILIENCE_HEDGE_MIN_SAMPLES:
+            return
+        if self._hedge_delay is None or self._samples_since_update >= max(1, self._latencies.maxlen // 10):
+            ordered = sorted(self._latencies)
+            rank = math.ceil(settings.RESILIENCE_HEDGE_PERCENTILE / 100 * len(ordered))
+            self._hedge_delay = ordered[max(rank, 1) - 1]
+            self._samples_since_update = 0
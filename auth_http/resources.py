@@ -0,0 +1,136 @@
+"""
+Resources served by the mock resource API.
+
+A Dataset is a sequence of records produced on demand from their index, so the
+resource API can stream result sets of any size without holding them in memory.
+Each dataset has a version, increased by every change; the strong ETag of every
+representation served from it (the full resource, an NDJSON stream or a page)
+is derived from the version and size, so computing it never touches the
+records. Pages are addressed by opaque
+cursors encoding the index of their first record.
+"""
+import base64
+from aiohttp import web
+from settings import settings
+
+NDJSON_CONTENT_TYPE = 'application/x-ndjson'
+
+def mock_record(index):
+    """
+    Build the record at an index of the mock dataset.
+
+    :param index: Record index.
+    :return: Record dict.
+    """
+    return {'id': index, 'data': 'mock_data'}
+
+def encode_cursor(index):
+    """
+    Encode a record index as an opaque pagination cursor.
+
+    :param index: Index of the first record of the page.
+    :return: URL-safe cursor string.
+    """
+    return base64.urlsafe_b64encode(str(index).encode('ascii')).rstrip(b'=').decode('ascii')
+
+def decode_cursor(cursor):
+    """
+    Decode a pagination cursor.
+
+    :param cursor: Cursor returned with a previous page.
+    :return: Index of the first record of the page.
+    :raises ValueError: If the cursor is malformed.
+    """
+    index = int(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode('ascii'))
+    if index < 0:
+        raise ValueError("Negative cursor")
+    return index
+
+class Dataset:
+    """
+    A resource made of ``size`` records built by ``make_record``.
+    """
+    def __init__(self, size=None, make_record=mock_record):
+        """
+        Initialize the dataset.
+
+        :param size: Number of records, defaults to settings.RESOURCE_RECORD_COUNT.
+        :param make_record: Callable building the record at an index.
+        """
+        self.size = settings.RESOURCE_RECORD_COUNT if size is None else size
+        self._make_record = make_record
+        self.version = 1
+
+    def __len__(self):
+        return self.size
+
+    def records(self, start=0, stop=None):
+        """
+        Iterate over records lazily.
+
+        :param start: Index of the first record.
+        :param stop: Index after the last record, the end of the dataset by default.
+        :return: Iterator of record dicts.
+        """
+        stop = self.size if stop is None else min(stop, self.size)
+        make_record = self._make_record
+        for index in range(start, stop):
+            yield make_record(index)
+
+    def page(self, start, limit):
+        """
+        Return a page of records.
+
+        :param start: Index of the first record.
+        :param limit: Maximum number of records.
+        :return: Tuple of the records list and the cursor of the next page, None on the last page.
+        """
+        stop = start + limit
+        records = list(self.records(start, stop))
+        return records, encode_cursor(stop) if stop < self.size else None
+
+    def update(self, size=None, make_record=None):
+        """
+        Change the dataset's content, starting a new version.
+
+        :param size: New number of records, unchanged by default.
+        :param make_record: New record builder, unchanged by default.
+        """
+        if size is not None:
+            self.size = size
+        if make_record is not None:
+            self._make_record = make_record
+        self.version += 1
+
+    def etag(self, representation):
+        """
+        Return the strong entity tag of a representation of the current version.
+
+        Every change goes through update(), which starts a new version, so the
+        version and size identify the content without hashing the records.
+
+        :param representation: Name of the representation, e.g. 'ndjson' or a page range.
+        :return: Unquoted entity tag.
+        """
+        return f"v{self.version}-{self.size}-{representation}"
+
+DATASET = web.AppKey("dataset", Dataset)
+
+_default_dataset = None
+
+def get_dataset(app):
+    """
+    Return the dataset served by an aiohttp application.
+
+    Applications without one share a mock dataset sized from settings.
+
+    :param app: The aiohttp application.
+    :return: A Dataset.
+    """
+    dataset = app.get(DATASET)
+    if dataset is None:
+        global _default_dataset
+        if _default_dataset is None:
+            _default_dataset = Dataset()
+        dataset = _default_dataset
+    return dataset
@@ -0,0 +1,394 @@
+"""
+Revocation of issued tokens by their ``jti`` claim.
+
+The authorization server records revoked token IDs in a RevocationLog, an
+append-only log whose version is the number of entries ever appended, and
+serves the entries after a given version at settings.REVOCATIONS_ENDPOINT.
+The resource API keeps a RevocationList synced incrementally in the background:
+it only asks for the entries after the version it already has.
+
+A revoked ID only matters until the token it names expires, so both sides drop
+IDs once their ``exp`` has passed, wherever they are in the log: entries keep
+the version they were appended with, so removing them does not renumber the
+rest, and memory follows the number of revocations within a token lifetime. The resource API checks membership in a set of the
+``jti`` strings taken from verified payloads, whose hash Python caches, so the
+check on the request path is a single O(1) lookup that allocates nothing.
+
+A RevocationLog lives in one process. The workers of auth_http.server share a
+SQLiteRevocationLog instead, whose entries and epoch are stored in a database
+file, so a resource API syncing from any worker sees every revocation under
+one epoch.
+"""
+import asyncio
+import bisect
+import sqlite3
+import time
+import uuid
+import aiohttp
+from aiohttp import web
+from auth_http.serialization import loads
+from settings import settings
+
+# Revoked IDs are grouped by the minute their token expires, for pruning.
+_EXPIRY_BUCKET_SECONDS = 60
+
+class _ExpiringSet:
+    """
+    Set of token IDs that forgets each ID once its token has expired.
+    """
+    def __init__(self):
+        self.ids = set()
+        self._buckets = {}
+
+    def add(self, jti, exp):
+        if jti in self.ids:
+            return False
+        self.ids.add(jti)
+        self._buckets.setdefault(int(exp // _EXPIRY_BUCKET_SECONDS), []).append(jti)
+        return True
+
+    def prune(self, now):
+        """
+        Drop the IDs of tokens that expired a whole bucket before now.
+
+        :param now: Current UNIX time.
+        :return: Number of IDs dropped.
+        """
+        current = int(now // _EXPIRY_BUCKET_SECONDS)
+        dropped = 0
+        for bucket in [bucket for bucket in self._buckets if bucket < current]:
+            expired = self._buckets.pop(bucket)
+            self.ids.difference_update(expired)
+            dropped += len(expired)
+        return dropped
+
+    def clear(self):
+        self.ids.clear()
+        self._buckets.clear()
+
+class RevocationLog:
+    """
+    The authorization server's log of revoked token IDs.
+    """
+    def __init__(self, clock=time.time):
+        """
+        Initialize an empty log.
+
+        :param clock: Callable returning the current UNIX time.
+        """
+        # Identifies this log, so readers notice a restarted server whose versions start over.
+        self.epoch = uuid.uuid4().hex
+        self._clock = clock
+        # (version, jti, exp) tuples in version order; expired ones are removed.
+        self._entries = []
+        self._version = 0
+        self._revoked = _ExpiringSet()
+
+    @property
+    def version(self):
+        return self._version
+
+    def revoke(self, jti, exp):
+        """
+        Revoke a token.
+
+        :param jti: Token ID.
+        :param exp: Expiry of the token, after which the revocation is forgotten.
+        :return: The log version including the revocation.
+        """
+        if exp > self._clock() and self._revoked.add(jti, exp):
+            self._version += 1
+            self._entries.append((self._version, jti, exp))
+        return self._version
+
+    def is_revoked(self, jti):
+        """
+        :param jti: Token ID.
+        :return: True if the token was revoked and has not expired yet.
+        """
+        return jti in self._revoked.ids
+
+    def changes(self, since=0, epoch=None, limit=None):
+        """
+        Return the revocations after a version.
+
+        Readers of another epoch, or ahead of this log, get every entry again with 'reset' set.
+
+        :param since: Version the reader already has.
+        :param epoch: Epoch of the log the reader synced from.
+        :param limit: Maximum number of entries, defaults to settings.REVOCATION_PAGE_SIZE.
+        :return: Dict with 'epoch', 'version' reached by applying 'revoked', the 'latest' version,
+                 'reset' and 'revoked', a list of [jti, exp] pairs.
+        """
+        self.prune()
+        limit = limit or settings.REVOCATION_PAGE_SIZE
+        reset = epoch != self.epoch or since > self._version
+        start = 0 if reset else bisect.bisect_left(self._entries, (since + 1,))
+        entries = self._entries[start:start + limit]
+        # A page that reaches the end of the log also covers the pruned versions after its last entry.
+        version = entries[-1][0] if start + limit < len(self._entries) else self._version
+        return {
+            'epoch': self.epoch,
+            'version': version,
+            'latest': self._version,
+            'reset': reset,
+            'revoked': [[jti, exp] for _, jti, exp in entries],
+        }
+
+    def prune(self):
+        """
+        Forget expired revocations.
+
+        The log is compacted whenever the set of revoked IDs dropped some, at most
+        once per expiry bucket, so entries expiring early are removed even when
+        longer-lived ones were revoked before them.
+        """
+        if self._revoked.prune(self._clock()):
+            ids = self._revoked.ids
+            self._entries = [entry for entry in self._entries if entry[1] in ids]
+
+    def close(self):
+        """Release the resources held by the log."""
+
+class SQLiteRevocationLog(RevocationLog):
+    """
+    Revocation log in a SQLite database, shared by every process opening the same file.
+
+    Versions are the table's AUTOINCREMENT row IDs, which are never reused, so
+    removing expired entries does not renumber the rest. The epoch is created
+    with the database and read by every process opening it.
+    """
+    def __init__(self, path, clock=time.time):
+        """
+        Open, and create if needed, the log.
+
+        :param path: Path of the SQLite database file.
+        :param clock: Callable returning the current UNIX time.
+        """
+        self._clock = clock
+        self._pruned_bucket = None
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS revocation_epoch ("
+                "id INTEGER PRIMARY KEY CHECK (id = 0), epoch TEXT NOT NULL)")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS revocations ("
+                "version INTEGER PRIMARY KEY AUTOINCREMENT, jti TEXT NOT NULL UNIQUE, exp REAL NOT NULL)")
+            self._connection.execute("CREATE INDEX IF NOT EXISTS revocations_exp ON revocations (exp)")
+            self._connection.execute("INSERT OR IGNORE INTO revocation_epoch VALUES (0, ?)", (uuid.uuid4().hex,))
+        self.epoch = self._connection.execute("SELECT epoch FROM revocation_epoch").fetchone()[0]
+
+    @property
+    def version(self):
+        row = self._connection.execute("SELECT seq FROM sqlite_sequence WHERE name = 'revocations'").fetchone()
+        return row[0] if row else 0
+
+    def revoke(self, jti, exp):
+        if exp > self._clock():
+            with self._connection:
+                # Not INSERT OR IGNORE, which would use up a version for an ID already revoked.
+                self._connection.execute(
+                    "INSERT INTO revocations (jti, exp) SELECT ?, ? WHERE NOT EXISTS "
+                    "(SELECT 1 FROM revocations WHERE jti = ?)", (jti, exp, jti))
+        return self.version
+
+    def is_revoked(self, jti):
+        return self._connection.execute(
+            "SELECT 1 FROM revocations WHERE jti = ? AND exp > ?", (jti, self._clock())).fetchone() is not None
+
+    def changes(self, since=0, epoch=None, limit=None):
+        self.prune()
+        limit = limit or settings.REVOCATION_PAGE_SIZE
+        # Read first, so entries another process appends meanwhile are left to the next page.
+        latest = self.version
+        reset = epoch != self.epoch or since > latest
+        entries = self._connection.execute(
+            "SELECT version, jti, exp FROM revocations WHERE version > ? AND version <= ? ORDER BY version LIMIT ?",
+            (0 if reset else since, latest, limit + 1)).fetchall()
+        version = entries[limit - 1][0] if len(entries) > limit else latest
+        return {
+            'epoch': self.epoch,
+            'version': version,
+            'latest': latest,
+            'reset': reset,
+            'revoked': [[jti, exp] for _, jti, exp in entries[:limit]],
+        }
+
+    def prune(self):
+        """Delete expired revocations, at most once per expiry bucket."""
+        now = self._clock()
+        bucket = int(now // _EXPIRY_BUCKET_SECONDS)
+        if bucket != self._pruned_bucket:
+            self._pruned_bucket = bucket
+            with self._connection:
+                self._connection.execute("DELETE FROM revocations WHERE exp <= ?", (now,))
+
+    def close(self):
+        self._connection.close()
+
+def create_revocation_log(config=settings):
+    """
+    Build the revocation log selected by settings.
+
+    :param config: Settings object; REVOCATION_LOG_PATH locates a SQLiteRevocationLog,
+                   a RevocationLog in memory is used when it is empty.
+    :return: A RevocationLog.
+    """
+    if config.REVOCATION_LOG_PATH:
+        return SQLiteRevocationLog(config.REVOCATION_LOG_PATH)
+    return RevocationLog()
+
+class RevocationList:
+    """
+    The resource API's copy of the revoked token IDs, synced in the background.
+    """
+    def __init__(self, url=None, interval=None, clock=time.time):
+        """
+        Initialize an empty list.
+
+        :param url: Revocations URL, settings.REVOCATIONS_ENDPOINT on the authorization server by default.
+        :param interval: Seconds between syncs, defaults to settings.REVOCATION_SYNC_INTERVAL.
+        :param clock: Callable returning the current UNIX time.
+        """
+        self.url = url or (f"http://{settings.AUTHORIZATION_HOST}:{settings.AUTHORIZATION_PORT}"
+                           f"{settings.REVOCATIONS_ENDPOINT}")
+        self.interval = settings.REVOCATION_SYNC_INTERVAL if interval is None else interval
+        self._clock = clock
+        self._revoked = _ExpiringSet()
+        # Bound once: the request path only does a set lookup.
+        self.ids = self._revoked.ids
+        self.epoch = None
+        self.version = 0
+        self._task = None
+
+    def is_revoked(self, jti):
+        """
+        :param jti: Token ID.
+        :return: True if the token was revoked.
+        """
+        return jti in self.ids
+
+    def apply(self, changes):
+        """
+        Apply a response of RevocationLog.changes.
+
+        :param changes: Changes dict.
+        :return: True if more changes are available.
+        """
+        if changes['reset'] or changes['epoch'] != self.epoch:
+            self._revoked.clear()
+        for jti, exp in changes['revoked']:
+            self._revoked.add(jti, exp)
+        self.epoch = changes['epoch']
+        self.version = changes['version']
+        self._revoked.prune(self._clock())
+        return self.version < changes['latest']
+
+    def __len__(self):
+        return len(self.ids)
+
+    async def sync(self):
+        """Fetch every revocation after the current version."""
+        timeout = aiohttp.ClientTimeout(total=settings.HTTP_TOTAL_TIMEOUT)
+        async with aiohttp.ClientSession(timeout=timeout) as session:
+            more = True
+            while more:
+                params = {'since': self.version}
+                if self.epoch:
+                    params['epoch'] = self.epoch
+                async with session.get(self.url, params=params) as response:
+                    response.raise_for_status()
+                    more = self.apply(await response.json(loads=loads))
+
+    def start(self):
+        """Start the background sync task on the running event loop."""
+        self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        """Stop the background sync task."""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.sync()
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError, KeyError, TypeError):
+                # Keep the IDs we have; try again next round. Malformed responses raise
+                # KeyError or TypeError in apply.
+                pass
+
+REVOCATION_LOG = web.AppKey("revocation_log", RevocationLog)
+REVOCATION_LIST = web.AppKey("revocation_list", RevocationList)
+
+_default_revocation_log = None
+_default_revocation_list = None
+
+def get_revocation_log(app):
+    """
+    Return the revocation log of an authorization server application.
+
+    Applications without one share a log created on first use.
+
+    :param app: The aiohttp application.
+    :return: A RevocationLog.
+    """
+    log = app.get(REVOCATION_LOG)
+    if log is None:
+        global _default_revocation_log
+        if _default_revocation_log is None:
+            _default_revocation_log = RevocationLog()
+        log = _default_revocation_log
+    return log
+
+def get_revocation_list(app):
+    """
+    Return the revocation list of a resource API application.
+
+    Applications without one share a list built from settings on first use.
+
+    :param app: The aiohttp application.
+    :return: A RevocationList.
+    """
+    revocations = app.get(REVOCATION_LIST)
+    if revocations is None:
+        global _default_revocation_list
+        if _default_revocation_list is None:
+            _default_revocation_list = RevocationList()
+        revocations = _default_revocation_list
+    return revocations
+
+async def _close_revocation_log(app):
+    app[REVOCATION_LOG].close()
+
+def setup_revocation_log(app, config=settings):
+    """
+    Give an authorization server application its own revocation log, closed on cleanup.
+
+    :param app: The aiohttp application, before it is started.
+    :param config: Settings object, see create_revocation_log.
+    :return: The application's RevocationLog.
+    """
+    log = app[REVOCATION_LOG] = create_revocation_log(config)
+    app.on_cleanup.append(_close_revocation_log)
+    return log
+
+async def revocation_syncer(app):
+    """
+    aiohttp cleanup context syncing the revocation list at startup and in the background.
+
+    :param app: The resource API aiohttp application.
+    """
+    revocations = get_revocation_list(app)
+    try:
+        await revocations.sync()
+    except (aiohttp.ClientError, asyncio.TimeoutError, ValueError, KeyError, TypeError):
+        # The authorization server may start later; the background task retries.
+        pass
+    revocations.start()
+    yield
+    await revocations.stop()
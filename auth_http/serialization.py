@@ -0,0 +1,193 @@
+"""
+Pluggable JSON serialization for the mock servers and the client.
+
+The backend is chosen by settings.JSON_BACKEND: 'orjson' or 'msgspec' when
+installed, or the standard library 'json' module. 'auto' picks the first
+available in that order. Every backend encodes to compact UTF-8 bytes and
+decodes bytes or str, so callers do not depend on which one is active.
+
+Response bodies can also be decoded into Struct subclasses, small
+``__slots__`` objects that validate their required fields, instead of dicts.
+"""
+import json
+from aiohttp import web
+from settings import settings
+
+BACKENDS = ('orjson', 'msgspec', 'json')
+
+class Serializer:
+    """
+    A JSON backend: ``dumps`` encodes to bytes, ``loads`` decodes bytes or str.
+    """
+    def __init__(self, name, dumps, loads):
+        """
+        :param name: Backend name.
+        :param dumps: Callable encoding an object to UTF-8 JSON bytes.
+        :param loads: Callable decoding JSON bytes or str.
+        """
+        self.name = name
+        self.dumps = dumps
+        self._loads = loads
+
+    def loads(self, data, struct=None):
+        """
+        Decode a JSON document.
+
+        :param data: JSON bytes or str.
+        :param struct: Struct subclass to decode a JSON object into, a plain dict by default.
+        :return: The decoded value.
+        :raises ValueError: If data is not valid JSON or misses a field of struct.
+        """
+        value = self._loads(data)
+        return value if struct is None else struct.from_dict(value)
+
+    def __repr__(self):
+        return f"Serializer({self.name!r})"
+
+def _stdlib_serializer():
+    encoder = json.JSONEncoder(separators=(',', ':'))
+    return Serializer('json', lambda obj: encoder.encode(obj).encode('utf8'), json.loads)
+
+def _orjson_serializer():
+    import orjson
+    return Serializer('orjson', orjson.dumps, orjson.loads)
+
+def _msgspec_serializer():
+    import msgspec
+    encoder = msgspec.json.Encoder()
+    decoder = msgspec.json.Decoder()
+
+    def loads(data):
+        # msgspec.DecodeError is not a ValueError, unlike the errors of the other backends.
+        try:
+            return decoder.decode(data)
+        except msgspec.DecodeError as error:
+            raise ValueError(str(error)) from error
+
+    return Serializer('msgspec', encoder.encode, loads)
+
+_FACTORIES = {'orjson': _orjson_serializer, 'msgspec': _msgspec_serializer, 'json': _stdlib_serializer}
+
+def get_serializer(name=None):
+    """
+    Build the serializer for a backend.
+
+    :param name: 'orjson', 'msgspec', 'json' or 'auto', defaults to settings.JSON_BACKEND.
+    :return: A Serializer.
+    :raises ValueError: If the backend is unknown.
+    :raises ImportError: If an explicitly requested backend is not installed.
+    """
+    name = name or settings.JSON_BACKEND
+    if name == 'auto':
+        for candidate in BACKENDS:
+            try:
+                return _FACTORIES[candidate]()
+            except ImportError:
+                continue
+    if name not in _FACTORIES:
+        raise ValueError(f"Unknown JSON backend: {name}")
+    return _FACTORIES[name]()
+
+serializer = get_serializer()
+
+def dumps(obj):
+    """Encode an object to JSON bytes with the configured backend."""
+    return serializer.dumps(obj)
+
+def loads(data, struct=None):
+    """Decode JSON bytes or str with the configured backend, see Serializer.loads."""
+    return serializer.loads(data, struct)
+
+def json_response(data, status=200, headers=None):
+    """
+    Build a JSON response encoded by the configured backend.
+
+    A drop-in for web.json_response that skips the intermediate str.
+
+    :param data: JSON-serializable response data.
+    :param status: HTTP status.
+    :param headers: Additional response headers.
+    :return: A web.Response.
+    """
+    return web.Response(body=serializer.dumps(data), status=status, headers=headers,
+                        content_type='application/json')
+
+class Struct:
+    """
+    Base class of typed, ``__slots__``-based decoding targets.
+
+    Subclasses list their fields in ``__slots__``; fields named in ``_defaults``
+    are optional, every other field is required.
+    """
+    __slots__ = ()
+    _defaults = {}
+    _required = ()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._required = tuple(name for name in cls.__slots__ if name not in cls._defaults)
+
+    def __init__(self, **fields):
+        for name in self.__slots__:
+            if name in fields:
+                setattr(self, name, fields[name])
+            elif name in self._defaults:
+                setattr(self, name, self._defaults[name])
+            else:
+                raise ValueError(f"{type(self).__name__} requires {name!r}")
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        Build an instance from a decoded JSON object, ignoring unknown members.
+
+        :param data: Decoded JSON object.
+        :return: An instance of cls.
+        :raises ValueError: If data is not an object or misses a required field.
+        """
+        if not isinstance(data, dict):
+            raise ValueError(f"{cls.__name__} must be decoded from a JSON object")
+        # Fill the slots straight from the object, without a keyword dict and __init__.
+        instance = object.__new__(cls)
+        try:
+            for name in cls._required:
+                setattr(instance, name, data[name])
+        except KeyError:
+            raise ValueError(f"{cls.__name__} requires {name!r}") from None
+        for name, default in cls._defaults.items():
+            setattr(instance, name, data.get(name, default))
+        return instance
+
+    @classmethod
+    def loads(cls, data):
+        """
+        Decode a JSON object into an instance with the configured backend.
+
+        Usable as the ``loads`` argument of aiohttp's ``response.json``.
+
+        :param data: JSON bytes or str.
+        :return: An instance of cls.
+        :raises ValueError: If data is not a JSON object or misses a required field.
+        """
+        return serializer.loads(data, cls)
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __eq__(self, other):
+        if type(other) is not type(self):
+            return NotImplemented
+        return self.to_dict() == other.to_dict()
+
+    def __repr__(self):
+        fields = ', '.join(f"{name}={getattr(self, name)!r}" for name in self.__slots__)
+        return f"{type(self).__name__}({fields})"
+
+class DataResponse(Struct):
+    """Default response of the resource API's /get_data endpoint."""
+    __slots__ = ('data',)
+
+class ResourcePage(Struct):
+    """A page of records returned by /get_data with a cursor or limit."""
+    __slots__ = ('data', 'next_cursor')
+    _defaults = {'next_cursor': None}
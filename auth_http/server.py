@@ -0,0 +1,223 @@
+"""
+Multi-process launcher for the mock authorization server and resource API.
+
+A supervisor process forks a configurable number of workers per app. Workers
+either bind their own listening socket with SO_REUSEPORT, letting the kernel
+balance connections between them, or share one socket bound by the supervisor
+before forking. Workers that exit unexpectedly are restarted; SIGTERM or SIGINT
+makes every worker stop accepting connections and drain in-flight requests.
+
+The supervisor parses the settings and imports the app modules once; forked
+workers inherit both and only build their application with ``create_app``.
+State every worker of an app must share is built by the supervisor before
+forking too: the authorization server's workers sign with one key ring, so any
+of them accepts the tokens issued by the others and publishes the same JWKS, and
+they revoke tokens into one SQLiteRevocationLog, a temporary file unless
+REVOCATION_LOG_PATH is set, so revocations survive worker restarts and a
+resource API syncing from any worker sees all of them.
+
+Usage: python -m auth_http.server [auth] [resource] [--workers N]
+"""
+import argparse
+import asyncio
+import importlib
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import tempfile
+import threading
+from aiohttp import web
+from auth_http.keys import SigningKeyRing
+from auth_http.revocation import SQLiteRevocationLog
+from settings import settings
+
+logger = logging.getLogger(__name__)
+
+# App name -> (module defining `create_app`, host setting, port setting, worker count setting)
+APPS = {
+    'auth': ('auth_http.mock_auth_server', 'AUTHORIZATION_HOST', 'AUTHORIZATION_PORT', 'AUTH_WORKERS'),
+    'resource': ('auth_http.mock_resource_api', 'API_HOST', 'API_PORT', 'API_WORKERS'),
+}
+
+def bind_socket(host, port, backlog, reuse_port=False):
+    """
+    Create a listening TCP socket.
+
+    :param host: Host to bind.
+    :param port: Port to bind, 0 for an ephemeral port.
+    :param backlog: Listen backlog.
+    :param reuse_port: Whether to set SO_REUSEPORT so several processes can bind the same port.
+    :return: The listening socket.
+    """
+    sock = socket.create_server((host, port), backlog=backlog, reuse_port=reuse_port)
+    sock.setblocking(False)
+    return sock
+
+async def serve(app, sock, stop, config=settings):
+    """
+    Serve an application on a listening socket until stop is set, then drain.
+
+    :param app: The aiohttp application.
+    :param sock: Listening socket.
+    :param stop: asyncio.Event set to begin a graceful shutdown.
+    :param config: Settings object providing SERVER_SHUTDOWN_TIMEOUT.
+    """
+    runner = web.AppRunner(app, shutdown_timeout=config.SERVER_SHUTDOWN_TIMEOUT)
+    await runner.setup()
+    try:
+        site = web.SockSite(runner, sock, backlog=config.SERVER_BACKLOG)
+        await site.start()
+        await stop.wait()
+    finally:
+        # Stops accepting, waits up to the shutdown timeout for in-flight requests.
+        await runner.cleanup()
+
+def _install_event_loop_policy(use_uvloop):
+    if not use_uvloop:
+        return
+    try:
+        import uvloop
+    except ImportError:
+        logger.warning("SERVER_USE_UVLOOP is set but uvloop is not installed, using asyncio")
+        return
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+
+def _worker_main(name, sock, config, options=None):
+    """
+    Entry point of a worker process.
+
+    :param name: App name, a key of APPS.
+    :param sock: Socket shared by the supervisor, or None to bind one with SO_REUSEPORT.
+    :param config: Settings object.
+    :param options: Additional keyword arguments of the app's create_app.
+    """
+    module_name, host_setting, port_setting, _ = APPS[name]
+    # Let the supervisor decide when workers stop; a terminal Ctrl+C reaches every process.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    _install_event_loop_policy(config.SERVER_USE_UVLOOP)
+    if sock is None:
+        sock = bind_socket(getattr(config, host_setting), getattr(config, port_setting),
+                           config.SERVER_BACKLOG, reuse_port=True)
+    # The module is normally imported by the supervisor already; the settings are the
+    # supervisor's parsed instance, inherited through fork.
+    app = importlib.import_module(module_name).create_app(config, **(options or {}))
+
+    async def run():
+        stop = asyncio.Event()
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, stop.set)
+        await serve(app, sock, stop, config)
+
+    asyncio.run(run())
+
+class Supervisor:
+    """
+    Starts, monitors and stops the worker processes of one or more apps.
+    """
+    def __init__(self, names, config=settings, workers=None):
+        """
+        Initialize the supervisor.
+
+        :param names: App names to serve, keys of APPS.
+        :param config: Settings object.
+        :param workers: Worker count per app, overriding the *_WORKERS settings.
+        """
+        self._config = config
+        self._context = multiprocessing.get_context('fork')
+        self._stop = threading.Event()
+        self._sockets = {}
+        self._slots = []
+        for name in names:
+            count = workers or getattr(config, APPS[name][3])
+            self._slots.extend((name, index) for index in range(count))
+        self._processes = {}
+        # App name -> create_app keyword arguments shared by the app's workers.
+        self._app_options = {}
+        self._directory = None
+
+    def run(self):
+        """
+        Run until SIGTERM or SIGINT, restarting workers that exit unexpectedly.
+        """
+        config = self._config
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(signum, lambda signum, frame: self._stop.set())
+
+        if not config.SERVER_REUSE_PORT:
+            for name in {name for name, _ in self._slots}:
+                _, host_setting, port_setting, _ = APPS[name]
+                self._sockets[name] = bind_socket(getattr(config, host_setting), getattr(config, port_setting),
+                                                  config.SERVER_BACKLOG)
+
+        # Import the app modules once, before forking, so workers started or restarted
+        # later share them instead of importing them again.
+        for name in {name for name, _ in self._slots}:
+            importlib.import_module(APPS[name][0])
+        if any(name == 'auth' for name, _ in self._slots):
+            self._app_options['auth'] = {'signing_keys': SigningKeyRing.from_settings(config)}
+            if not config.REVOCATION_LOG_PATH:
+                self._directory = tempfile.TemporaryDirectory(prefix='auth_http-')
+                config = self._config = config.model_copy(
+                    update={'REVOCATION_LOG_PATH': os.path.join(self._directory.name, 'revocations.db')})
+            # Created once here, so every worker reads the same epoch.
+            SQLiteRevocationLog(config.REVOCATION_LOG_PATH).close()
+
+        for slot in self._slots:
+            self._start(slot)
+        try:
+            while not self._stop.wait(config.SERVER_HEALTH_CHECK_INTERVAL):
+                for slot, process in list(self._processes.items()):
+                    if not process.is_alive():
+                        logger.warning("%s worker %d exited with %s, restarting", slot[0], slot[1], process.exitcode)
+                        if self._stop.wait(config.SERVER_RESTART_DELAY):
+                            break
+                        self._start(slot)
+        finally:
+            self._shutdown()
+
+    def stop(self):
+        """Ask run() to shut every worker down."""
+        self._stop.set()
+
+    def _start(self, slot):
+        name, index = slot
+        process = self._context.Process(
+            target=_worker_main,
+            args=(name, self._sockets.get(name), self._config, self._app_options.get(name)),
+            name=f"{name}-worker-{index}",
+            # Not daemonic, so workers may start child processes, e.g. the process pool of
+            # PASSWORD_HASH_EXECUTOR='process'; _shutdown terminates and joins them.
+            daemon=False,
+        )
+        process.start()
+        self._processes[slot] = process
+
+    def _shutdown(self):
+        """Terminate the workers, wait for them to drain and kill those still running."""
+        for process in self._processes.values():
+            if process.is_alive():
+                process.terminate()
+        for process in self._processes.values():
+            process.join(self._config.SERVER_SHUTDOWN_TIMEOUT + 1)
+            if process.is_alive():
+                process.kill()
+                process.join()
+        for sock in self._sockets.values():
+            sock.close()
+        if self._directory is not None:
+            self._directory.cleanup()
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the mock servers in worker processes.")
+    parser.add_argument('apps', nargs='*', help=f"apps to serve: {', '.join(sorted(APPS))}; all by default")
+    parser.add_argument('--workers', type=int, help="worker processes per app")
+    args = parser.parse_args()
+    unknown = set(args.apps) - set(APPS)
+    if unknown:
+        parser.error(f"unknown apps: {', '.join(sorted(unknown))}")
+    logging.basicConfig(level=logging.DEBUG if settings.DEBUG_MODE else logging.INFO)
+    Supervisor(args.apps or sorted(APPS), workers=args.workers).run()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+"""
+Client-side access token cache.
+
+Tokens issued by the authorization server are reused until shortly before the
+``exp`` claim they carry, so the handler chain only talks to the authorization
+server when a user has no usable token. When the server also issued a refresh
+token, tokens close to expiry are renewed in the background through the cheap
+refresh endpoint, and an expired token is renewed through it instead of a full
+login.
+"""
+import asyncio
+import hashlib
+import time
+from auth_http.cache import TTLCache
+from auth_http.metrics import REGISTRY
+from settings import settings
+
+_LOOKUPS = REGISTRY.counter('client_token_cache_total', 'Access token lookups by cache result.', ('result',))
+_HIT = _LOOKUPS.labels('hit')
+_MISS = _LOOKUPS.labels('miss')
+
+class _CachedToken:
+    __slots__ = ('access_token', 'refresh_token', 'refresh_at', 'usable_until')
+
+    def __init__(self, access_token, refresh_token, refresh_at, usable_until):
+        self.access_token = access_token
+        self.refresh_token = refresh_token
+        self.refresh_at = refresh_at
+        self.usable_until = usable_until
+
+class TokenCache:
+    """
+    Bounded, expiry-aware cache of access tokens keyed by client credentials.
+
+    Concurrent callers missing the cache for the same credentials share a single
+    in-flight authentication instead of each hitting the authorization server.
+    """
+    def __init__(self, maxsize=None, refresh_margin=None, default_ttl=None, refresh_ahead=None,
+                 clock=time.time):
+        """
+        Initialize the token cache.
+
+        :param maxsize: Maximum number of cached tokens, defaults to settings.TOKEN_CACHE_SIZE.
+        :param refresh_margin: Seconds before expiry at which a token is no longer reused,
+                               defaults to settings.TOKEN_REFRESH_MARGIN.
+        :param default_ttl: Lifetime assumed for tokens without an ``exp`` claim,
+                            defaults to settings.TOKEN_DEFAULT_TTL.
+        :param refresh_ahead: Seconds before expiry at which a background refresh starts,
+                              defaults to settings.TOKEN_REFRESH_AHEAD.
+        :param clock: Callable returning the current UNIX time.
+        """
+        if maxsize is None:
+            maxsize = settings.TOKEN_CACHE_SIZE
+        self.refresh_margin = settings.TOKEN_REFRESH_MARGIN if refresh_margin is None else refresh_margin
+        self.default_ttl = settings.TOKEN_DEFAULT_TTL if default_ttl is None else default_ttl
+        self.refresh_ahead = settings.TOKEN_REFRESH_AHEAD if refresh_ahead is None else refresh_ahead
+        self._clock = clock
+        self._tokens = TTLCache(maxsize, clock=clock)
+        self._pending = {}
+
+    @property
+    def hits(self):
+        return self._tokens.hits
+
+    @property
+    def misses(self):
+        return self._tokens.misses
+
+    async def get_or_fetch(self, user_name, password, fetch, refresh=None):
+        """
+        Return a cached token for the credentials or obtain a new one.
+
+        :param user_name: Client's username.
+        :param password: Client's password.
+        :param fetch: Coroutine function called without arguments to log in; it returns the
+                      authorization server's token response with 'access_token' and
+                      optionally 'refresh_token'.
+        :param refresh: Coroutine function called with a refresh token to renew the access
+                        token; it returns a token response like fetch.
+        :return: A usable access token.
+        """
+        key = self._key(user_name, password)
+        entry = self._tokens.get(key)
+        now = self._clock()
+        if entry is not None and now < entry.usable_until:
+            if refresh is not None and entry.refresh_token and now >= entry.refresh_at:
+                # Renew ahead of expiry without making this caller wait.
+                self._renew(key, entry, fetch, refresh)
+            _HIT.inc()
+            return entry.access_token
+        _MISS.inc()
+        return await asyncio.shield(self._renew(key, entry, fetch, refresh))
+
+    def invalidate(self, user_name, password):
+        """
+        Drop the cached token for the credentials, e.g. after it was rejected.
+
+        :param user_name: Client's username.
+        :param password: Client's password.
+        """
+        self._tokens.pop(self._key(user_name, password))
+
+    def clear(self):
+        """Drop every cached token."""
+        self._tokens.clear()
+
+    def __len__(self):
+        return len(self._tokens)
+
+    def _renew(self, key, entry, fetch, refresh):
+        """
+        Return the in-flight renewal for key, starting one if there is none.
+        """
+        pending = self._pending.get(key)
+        if pending is None:
+            pending = asyncio.ensure_future(self._obtain(key, entry, fetch, refresh))
+            self._pending[key] = pending
+            pending.add_done_callback(lambda future: self._forget(key, future))
+        return pending
+
+    async def _obtain(self, key, entry, fetch, refresh):
+        grant = None
+        if entry is not None and entry.refresh_token and refresh is not None:
+            try:
+                grant = await refresh(entry.refresh_token)
+            except Exception:
+                # Refresh token rejected or endpoint unavailable, fall back to a full login.
+                grant = None
+            if grant and not grant.get('refresh_token'):
+                grant = dict(grant, refresh_token=entry.refresh_token)
+        if not grant:
+            grant = await fetch()
+        token = grant.get('access_token') if grant else None
+        if token:
+            self._store(key, token, grant.get('refresh_token'))
+        return token
+
+    def _store(self, key, access_token, refresh_token):
+        usable_until = self._expires_at(access_token) - self.refresh_margin
+        refresh_at = usable_until + self.refresh_margin - self.refresh_ahead
+        # Keep the entry while its refresh token can still renew it.
+        expires_at = usable_until
+        if refresh_token:
+            expires_at = max(expires_at, self._expires_at(refresh_token) - self.refresh_margin)
+        if expires_at > self._clock():
+            self._tokens.set(key, _CachedToken(access_token, refresh_token, refresh_at, usable_until),
+                             expires_at=expires_at)
+
+    def _forget(self, key, future):
+        if self._pending.get(key) is future:
+            del self._pending[key]
+        if not future.cancelled():
+            # Mark the exception as retrieved when every waiter went away.
+            future.exception()
+
+    def _expires_at(self, token):
+        """
+        Read the ``exp`` claim of a token without verifying its signature.
+
+        The signature is checked by the resource API; the client only needs to
+        know how long the token may be reused.
+        """
+        # Deferred to the first cached token: PyJWT pulls in its crypto backends.
+        import jwt
+        try:
+            exp = jwt.decode(token, options={"verify_signature": False}).get("exp")
+        except jwt.PyJWTError:
+            exp = None
+        if isinstance(exp, (int, float)):
+            return exp
+        return self._clock() + self.default_ttl
+
+    @staticmethod
+    def _key(user_name, password):
+        return hashlib.sha256(f"{user_name}\x00{password}".encode('utf8')).digest()
@@ -0,0 +1,144 @@
+"""
+Pooled HTTP transport for the handler chain.
+
+The authorization server and the resource API each get their own
+aiohttp.ClientSession, so a burst of logins cannot starve data fetches of
+connections and each pool can be sized independently.
+"""
+import aiohttp
+from settings import settings
+
+class PoolStats:
+    """
+    Point-in-time view of one connection pool.
+    """
+    __slots__ = ('name', 'limit', 'limit_per_host', 'in_use', 'idle', 'waiting', 'queued_total')
+
+    def __init__(self, name, limit, limit_per_host, in_use, idle, waiting, queued_total):
+        """
+        :param name: Pool name.
+        :param limit: Maximum number of connections, 0 for unlimited.
+        :param limit_per_host: Maximum number of connections per host, 0 for unlimited.
+        :param in_use: Connections currently serving a request.
+        :param idle: Keep-alive connections available for reuse.
+        :param waiting: Requests currently queued for a free connection.
+        :param queued_total: Requests that had to queue since the pool was opened.
+        """
+        self.name = name
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.in_use = in_use
+        self.idle = idle
+        self.waiting = waiting
+        self.queued_total = queued_total
+
+    def as_dict(self):
+        return {slot: getattr(self, slot) for slot in self.__slots__}
+
+    def __repr__(self):
+        return f"PoolStats({', '.join(f'{slot}={getattr(self, slot)!r}' for slot in self.__slots__)})"
+
+class _Pool:
+    """
+    A ClientSession together with the counters needed to report its pool statistics.
+    """
+    def __init__(self, name, limit, limit_per_host, config):
+        self.name = name
+        self.waiting = 0
+        self.queued_total = 0
+
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_connection_queued_start.append(self._on_queued_start)
+        trace_config.on_connection_queued_end.append(self._on_queued_end)
+
+        self.connector = aiohttp.TCPConnector(
+            limit=limit,
+            limit_per_host=limit_per_host,
+            keepalive_timeout=config.HTTP_KEEPALIVE_TIMEOUT,
+            ttl_dns_cache=config.HTTP_DNS_CACHE_TTL,
+        )
+        self.session = aiohttp.ClientSession(
+            connector=self.connector,
+            timeout=aiohttp.ClientTimeout(
+                total=config.HTTP_TOTAL_TIMEOUT,
+                sock_connect=config.HTTP_CONNECT_TIMEOUT,
+                sock_read=config.HTTP_READ_TIMEOUT,
+            ),
+            trace_configs=[trace_config],
+        )
+
+    async def _on_queued_start(self, session, context, params):
+        self.waiting += 1
+        self.queued_total += 1
+
+    async def _on_queued_end(self, session, context, params):
+        self.waiting -= 1
+
+    def stats(self):
+        connector = self.connector
+        # aiohttp does not expose pool occupancy publicly; read it defensively.
+        acquired = getattr(connector, '_acquired', ())
+        idle = getattr(connector, '_conns', {})
+        return PoolStats(
+            name=self.name,
+            limit=connector.limit,
+            limit_per_host=connector.limit_per_host,
+            in_use=len(acquired),
+            idle=sum(len(connections) for connections in idle.values()),
+            waiting=self.waiting,
+            queued_total=self.queued_total,
+        )
+
+class Transport:
+    """
+    Separate keep-alive connection pools for the authorization server and the resource API.
+
+    Use it as an async context manager; the sessions are created on entry because
+    aiohttp sessions must be created inside a running event loop.
+    """
+    def __init__(self, config=settings):
+        """
+        Initialize the transport.
+
+        :param config: Settings object providing the pool limits and timeouts.
+        """
+        self._config = config
+        self._auth_pool = None
+        self._resource_pool = None
+
+    @property
+    def auth_session(self):
+        """aiohttp.ClientSession used to reach the authorization server."""
+        return self._auth_pool.session
+
+    @property
+    def resource_session(self):
+        """aiohttp.ClientSession used to reach the resource API."""
+        return self._resource_pool.session
+
+    async def start(self):
+        """Create both connection pools."""
+        config = self._config
+        self._auth_pool = _Pool('auth', config.AUTH_POOL_LIMIT, config.AUTH_POOL_LIMIT_PER_HOST, config)
+        self._resource_pool = _Pool('resource', config.API_POOL_LIMIT, config.API_POOL_LIMIT_PER_HOST, config)
+        return self
+
+    async def close(self):
+        """Close both connection pools."""
+        for pool in (self._auth_pool, self._resource_pool):
+            if pool is not None:
+                await pool.session.close()
+
+    def stats(self):
+        """
+        Report the occupancy of both pools.
+
+        :return: Dict mapping pool name to PoolStats.
+        """
+        return {pool.name: pool.stats() for pool in (self._auth_pool, self._resource_pool) if pool is not None}
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
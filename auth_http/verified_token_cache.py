@@ -0,0 +1,120 @@
+"""
+Cache of access tokens already verified by the resource API.
+
+Verifying a JWT signature dominates the cost of serving /get_data, while clients
+present the same token over and over. Verified payloads are kept under a digest
+of the token until the token's ``exp`` claim, so repeated requests skip both the
+signature check and the user lookup.
+"""
+import hashlib
+import time
+from aiohttp import web
+from auth_http.cache import TTLCache
+from settings import settings
+
+class VerifiedTokenCache:
+    """
+    Bounded cache mapping token digests to verified JWT payloads.
+
+    Entries expire at the token's ``exp`` claim, or after ``max_ttl`` seconds if
+    that is sooner, and every entry of a user is invalidated by invalidate_user.
+    """
+    def __init__(self, maxsize=None, max_ttl=None, clock=time.time):
+        """
+        Initialize the cache.
+
+        :param maxsize: Maximum number of cached tokens, defaults to settings.VERIFIED_TOKEN_CACHE_SIZE.
+        :param max_ttl: Longest time in seconds a token stays cached, defaults to
+                        settings.VERIFIED_TOKEN_CACHE_TTL.
+        :param clock: Callable returning the current UNIX time.
+        """
+        if maxsize is None:
+            maxsize = settings.VERIFIED_TOKEN_CACHE_SIZE
+        self.max_ttl = settings.VERIFIED_TOKEN_CACHE_TTL if max_ttl is None else max_ttl
+        self._clock = clock
+        self._payloads = TTLCache(maxsize, clock=clock)
+        # Bumped when a user is invalidated; entries stored under an older generation are stale.
+        self._generations = {}
+
+    @property
+    def hits(self):
+        return self._payloads.hits
+
+    @property
+    def misses(self):
+        return self._payloads.misses
+
+    def get(self, token):
+        """
+        Return the verified payload of a token.
+
+        :param token: Encoded access token.
+        :return: The decoded payload, or None if the token has not been verified recently.
+        """
+        entry = self._payloads.get(self._key(token))
+        if entry is None:
+            return None
+        payload, generation = entry
+        if generation != self._generations.get(payload.get('user_name'), 0):
+            # Count it as the miss it is, not the hit TTLCache recorded.
+            self._payloads.hits -= 1
+            self._payloads.misses += 1
+            return None
+        return payload
+
+    def put(self, token, payload):
+        """
+        Remember a verified token.
+
+        :param token: Encoded access token.
+        :param payload: Payload returned by signature verification.
+        """
+        expires_at = self._clock() + self.max_ttl
+        exp = payload.get('exp')
+        if isinstance(exp, (int, float)):
+            expires_at = min(expires_at, exp)
+        generation = self._generations.get(payload.get('user_name'), 0)
+        self._payloads.set(self._key(token), (payload, generation), expires_at=expires_at)
+
+    def invalidate_user(self, user_name):
+        """
+        Forget every cached token of a user, e.g. after the user was removed.
+
+        :param user_name: User's name.
+        """
+        self._generations[user_name] = self._generations.get(user_name, 0) + 1
+
+    def clear(self):
+        """Forget every cached token."""
+        self._payloads.clear()
+
+    def stats(self):
+        """
+        :return: Dict with the cache size and hit and miss counters.
+        """
+        return {'size': len(self._payloads), 'hits': self.hits, 'misses': self.misses}
+
+    @staticmethod
+    def _key(token):
+        return hashlib.blake2b(token.encode(), digest_size=16).digest()
+
+VERIFIED_TOKEN_CACHE = web.AppKey("verified_token_cache", VerifiedTokenCache)
+
+_default_cache = None
+
+def get_verified_token_cache(app):
+    """
+    Return the verified-token cache configured on an aiohttp application.
+
+    Applications without one share a cache built from settings on first use.
+
+    :param app: The aiohttp application.
+    :return: A VerifiedTokenCache.
+    """
+    cache = app.get(VERIFIED_TOKEN_CACHE)
+    if cache is None:
+        global _default_cache
+        if _default_cache is None:
+            _default_cache = VerifiedTokenCache()
+        cache = _default_cache
+    return cache
@@ -0,0 +1,112 @@
+"""
+Micro-benchmark of the per-request CPU cost of the handler path.
+
+The HTTP session is replaced by an in-memory fake so only the Python work done
+by AuthorizationHandler.authenticate and DataFetchingHandler.fetch_data is
+measured, including decoding the canned JSON body. The "before" variants
+reproduce the original handlers, which rebuilt the endpoint URL from settings
+on every call and decoded with the json module. The "after" variants are the
+current handlers: URLs are built once, bodies are decoded with the configured
+JSON backend, and requests are counted and timed in the client metrics;
+fetch_data also keeps responses for ETag revalidation. Both variants
+base64-encode the credentials on every call.
+
+Usage: python -m benchmarks.bench_handlers [--iterations N]
+"""
+import argparse
+import asyncio
+import base64
+import json
+import time
+from auth_http.handlers import AuthorizationHandler, DataFetchingHandler
+from settings import settings
+
+class _FakeResponse:
+    def __init__(self, body):
+        self.status = 200
+        self.headers = {}
+        self._body = body
+
+    async def json(self, loads=json.loads):
+        return loads(self._body)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return False
+
+class _FakeSession:
+    """Answers every request with a canned 200 response without touching the network."""
+    def __init__(self):
+        self._token_response = _FakeResponse(b'{"access_token":"mock_access_token"}')
+        self._data_response = _FakeResponse(b'{"data":"mock_data"}')
+
+    def post(self, url, **kwargs):
+        return self._token_response
+
+    def get(self, url, **kwargs):
+        return self._data_response
+
+class _LegacyAuthorizationHandler(AuthorizationHandler):
+    async def authenticate(self, user_name, password):
+        auth_server_url = "http://" + settings.AUTHORIZATION_HOST\
+        + ":" + str(settings.AUTHORIZATION_PORT)\
+        + settings.AUTHORIZATION_ENDPOINT
+        credentials = f"{user_name}:{password}"
+        encoded_credentials = base64.b64encode(credentials.encode('utf8')).decode('utf8')
+        headers = {"Authorization": f"Basic {encoded_credentials}"}
+        async with self._http_client.post(auth_server_url, headers=headers) as response:
+            data = await response.json()
+            return data["access_token"]
+
+class _LegacyDataFetchingHandler(DataFetchingHandler):
+    async def fetch_data(self, access_token):
+        resource_api_url = "http://" + settings.API_HOST\
+        + ":" + str(settings.API_PORT)\
+        + settings.API_ENDPOINT
+        headers = {"Authorization": f"Bearer {access_token}"}
+        async with self.http_client.get(resource_api_url, headers=headers) as response:
+            data = await response.json()
+            return data['data']
+
+async def _time_per_call(call, iterations):
+    for _ in range(min(iterations, 1000)):
+        await call()
+    start = time.process_time()
+    for _ in range(iterations):
+        await call()
+    return (time.process_time() - start) / iterations
+
+async def run(iterations):
+    """
+    Measure the original and the current handler path.
+
+    :param iterations: Number of calls timed per variant.
+    :return: Dict mapping variant name to CPU microseconds per call.
+    """
+    session = _FakeSession()
+    variants = {
+        'authenticate (before)': _LegacyAuthorizationHandler(session),
+        'authenticate (after)': AuthorizationHandler(session),
+        'fetch_data (before)': _LegacyDataFetchingHandler(session),
+        'fetch_data (after)': DataFetchingHandler(session),
+    }
+    results = {}
+    for name, handler in variants.items():
+        if isinstance(handler, AuthorizationHandler):
+            call = lambda handler=handler: handler.authenticate(settings.USER_NAME, settings.PASSWORD)
+        else:
+            call = lambda handler=handler: handler.fetch_data("mock_access_token")
+        results[name] = await _time_per_call(call, iterations) * 1e6
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--iterations', type=int, default=100000)
+    args = parser.parse_args()
+    for name, micros in asyncio.run(run(args.iterations)).items():
+        print(f"{name:<24} {micros:8.2f} us/call")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Micro-benchmark of JSON encoding and decoding per endpoint and backend.
+
+Each endpoint's typical body is encoded the way its server does and decoded
+the way the client does, once with every installed backend of
+auth_http.serialization. The standard library backend is the baseline the
+speedups are relative to.
+
+Usage: python -m benchmarks.bench_serialization [--iterations N]
+"""
+import argparse
+import time
+from auth_http.keys import SigningKeyRing
+from auth_http.resources import Dataset
+from auth_http.serialization import BACKENDS, DataResponse, ResourcePage, get_serializer
+
+def _payloads():
+    """
+    :return: Dict mapping endpoint name to (body, Struct type decoded on the client or None).
+    """
+    ring = SigningKeyRing()
+    ring.rotate('EdDSA')
+    access_token = ring.sign({'user_name': 'ABNAMRO', 'iat': 0, 'exp': 300, 'jti': '0' * 32})
+    dataset = Dataset(1000)
+    page, next_cursor = dataset.page(0, 100)
+    return {
+        '/authenticate': ({'access_token': access_token, 'token_type': 'Bearer', 'expires_in': 300,
+                           'refresh_token': access_token}, None),
+        '/get_data': ({'data': 'mock_data'}, DataResponse),
+        '/get_data?limit=100': ({'data': page, 'next_cursor': next_cursor}, ResourcePage),
+        '/get_data (ndjson)': (list(dataset.records()), None),
+        '/.well-known/jwks.json': (ring.jwks(), None),
+    }
+
+def _time_per_call(call, iterations):
+    for _ in range(min(iterations, 1000)):
+        call()
+    start = time.process_time()
+    for _ in range(iterations):
+        call()
+    return (time.process_time() - start) / iterations
+
+def run(iterations):
+    """
+    Time an encode/decode round trip of each endpoint body with each installed backend.
+
+    NDJSON bodies are encoded and decoded one record per call, as the server and client do.
+
+    :param iterations: Number of round trips timed per endpoint and backend.
+    :return: Dict mapping (endpoint, backend) to CPU microseconds per round trip.
+    """
+    serializers = []
+    for name in BACKENDS:
+        try:
+            serializers.append(get_serializer(name))
+        except ImportError:
+            continue
+
+    results = {}
+    for endpoint, (body, struct) in _payloads().items():
+        for serializer in serializers:
+            if isinstance(body, list):
+                def call(serializer=serializer, records=body):
+                    for record in records:
+                        serializer.loads(serializer.dumps(record))
+                count = max(1, iterations // len(body))
+            else:
+                def call(serializer=serializer, body=body, struct=struct):
+                    serializer.loads(serializer.dumps(body), struct)
+                count = iterations
+            results[endpoint, serializer.name] = _time_per_call(call, count) * 1e6
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--iterations', type=int, default=20000)
+    args = parser.parse_args()
+    results = run(args.iterations)
+    for (endpoint, backend), micros in results.items():
+        speedup = results[endpoint, 'json'] / micros
+        print(f"{endpoint:<24} {backend:<8} {micros:10.2f} us/round trip  {speedup:5.2f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""
+Startup benchmark: import time and time to first request.
+
+Three measurements, each repeated and reported as the median and minimum:
+
+- import: importing a module in a fresh interpreter, for the client and both
+  servers.
+- cold process: a fresh interpreter importing everything, starting both mock
+  servers with create_app on ephemeral ports and completing one request through
+  the client pipeline. Reported from interpreter launch, as seen by the parent.
+- forked worker: a worker forked by a process that already imported the app
+  modules, as auth_http.server's supervisor does, building its app and serving
+  its first request on a socket bound before forking.
+
+Usage: python -m benchmarks.bench_startup [--repeat N]
+"""
+import argparse
+import importlib
+import multiprocessing
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+
+MODULES = ('settings', 'auth_http.client', 'auth_http.pipeline', 'auth_http.mock_auth_server',
+           'auth_http.mock_resource_api')
+
+_IMPORT_SCRIPT = "import time; started = time.perf_counter(); import {module}; print(time.perf_counter() - started)"
+
+def _first_request():
+    """
+    Start both servers in this process and complete one request through the client.
+    """
+    import asyncio
+    from aiohttp import web
+    from auth_http.client import Client
+    from auth_http.mock_auth_server import create_app as create_auth_app
+    from auth_http.mock_resource_api import create_app as create_resource_api_app
+    from auth_http.pipeline import build_pipeline
+    from auth_http.server import bind_socket
+    from auth_http.transport import Transport
+    from settings import settings
+
+    async def serve(app):
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        sock = bind_socket('127.0.0.1', 0, settings.SERVER_BACKLOG)
+        await web.SockSite(runner, sock).start()
+        return runner, sock.getsockname()[1]
+
+    async def run():
+        config = settings.model_copy(update={'RATE_LIMIT_ENABLED': False})
+        auth_runner, auth_port = await serve(create_auth_app(config))
+        config = config.model_copy(update={'AUTHORIZATION_HOST': '127.0.0.1', 'AUTHORIZATION_PORT': auth_port})
+        resource_runner, resource_port = await serve(create_resource_api_app(config))
+        try:
+            async with Transport() as transport:
+                pipeline = build_pipeline(transport, [
+                    {'stage': 'authenticate', 'url': f"http://127.0.0.1:{auth_port}{settings.AUTHORIZATION_ENDPOINT}"},
+                    {'stage': 'fetch', 'url': f"http://127.0.0.1:{resource_port}{settings.API_ENDPOINT}"},
+                ])
+                data = await Client(pipeline).process_request(settings.USER_NAME, settings.PASSWORD)
+                if data != 'mock_data':
+                    raise RuntimeError(f"Unexpected response: {data}")
+        finally:
+            await resource_runner.cleanup()
+            await auth_runner.cleanup()
+
+    asyncio.run(run())
+
+def measure_imports(repeat):
+    """
+    :param repeat: Fresh interpreters per module.
+    :return: Dict mapping module name to import times in seconds.
+    """
+    results = {}
+    for module in MODULES:
+        script = _IMPORT_SCRIPT.format(module=module)
+        results[module] = [float(subprocess.run([sys.executable, '-c', script], check=True, capture_output=True,
+                                                text=True).stdout) for _ in range(repeat)]
+    return results
+
+def measure_cold_process(repeat):
+    """
+    :param repeat: Fresh interpreters started.
+    :return: Seconds from launching the interpreter to the end of its first request, per run.
+    """
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        subprocess.run([sys.executable, '-m', 'benchmarks.bench_startup', '--child'], check=True)
+        times.append(time.perf_counter() - started)
+    return times
+
+def measure_forked_worker(repeat):
+    """
+    :param repeat: Workers forked.
+    :return: Seconds from forking a worker to the end of its first response, per run.
+    """
+    from auth_http.server import APPS, _worker_main, bind_socket
+    from settings import settings
+
+    # Import the app module before forking, as the supervisor's parent has, so the
+    # workers measure building the app and serving rather than importing it.
+    importlib.import_module(APPS['auth'][0])
+
+    context = multiprocessing.get_context('fork')
+    times = []
+    for _ in range(repeat):
+        sock = bind_socket('127.0.0.1', 0, settings.SERVER_BACKLOG)
+        url = f"http://127.0.0.1:{sock.getsockname()[1]}/metrics"
+        started = time.perf_counter()
+        worker = context.Process(target=_worker_main, args=('auth', sock, settings), daemon=True)
+        worker.start()
+        try:
+            # The connection waits in the listen backlog until the worker accepts it.
+            with urllib.request.urlopen(url, timeout=30) as response:
+                response.read()
+            times.append(time.perf_counter() - started)
+        finally:
+            worker.terminate()
+            worker.join()
+            sock.close()
+    return times
+
+def _report(name, times):
+    print(f"{name:<36} median {statistics.median(times) * 1000:8.1f} ms  min {min(times) * 1000:8.1f} ms")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        _first_request()
+        return
+    for module, times in measure_imports(args.repeat).items():
+        _report(f"import {module}", times)
+    _report("cold process, first request", measure_cold_process(args.repeat))
+    _report("forked worker, first request", measure_forked_worker(args.repeat))
+
+if __name__ == "__main__":
+    main()
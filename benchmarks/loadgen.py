@@ -0,0 +1,364 @@
+"""
+Load generator for the full authorization flow.
+
+Runs the real AuthorizationHandler -> DataFetchingHandler chain that Client
+drives against in-process mock_auth_server and mock_resource_api apps bound to
+ephemeral ports, and reports throughput and latency percentiles.
+
+Modes:
+- closed: a fixed number of workers each send the next request as soon as the
+  previous one finished.
+- open: requests are started on a Poisson arrival schedule at a fixed rate,
+  whether or not earlier ones finished. Latency is measured from the scheduled
+  start so queueing delay is not hidden.
+
+Scenarios, mixed by weight:
+- cold: a login through AuthorizationHandler.request_tokens, without a token
+  cache, then a data fetch. The servers' password verification cache is
+  disabled, so every cold login pays the KDF.
+- warm: login served from the token cache, data fetch only.
+- invalid: data fetch with a bogus token, rejected by the resource API.
+
+Usage:
+    python -m benchmarks.loadgen --mode closed --concurrency 50 --duration 10
+    python -m benchmarks.loadgen --mode open --rate 500 --mix cold=1,warm=8,invalid=1 --output run.json
+    python -m benchmarks.loadgen --compare base.json run.json
+"""
+import argparse
+import asyncio
+import json
+import math
+import platform
+import random
+import subprocess
+import sys
+import time
+from aiohttp import web
+from auth_http.credential_store import CREDENTIAL_STORE
+from auth_http.handlers import AuthorizationHandler, DataFetchingHandler
+from auth_http.mock_auth_server import create_app as create_auth_app
+from auth_http.mock_resource_api import create_app as create_resource_api_app
+from auth_http.server import bind_socket
+from auth_http.token_cache import TokenCache
+from auth_http.transport import Transport
+from settings import settings
+
+SCENARIOS = ('cold', 'warm', 'invalid')
+
+def percentile(sorted_values, fraction):
+    """
+    Nearest-rank percentile of an already sorted list.
+
+    :param sorted_values: Sorted sample.
+    :param fraction: Percentile as a fraction, e.g. 0.99.
+    :return: The percentile, or None for an empty sample.
+    """
+    if not sorted_values:
+        return None
+    rank = max(0, min(len(sorted_values) - 1, math.ceil(fraction * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+def summarize(latencies, errors, elapsed):
+    """
+    Summarize the latencies of one group of requests.
+
+    :param latencies: Latencies in seconds.
+    :param errors: Number of requests whose outcome was not the expected one.
+    :param elapsed: Wall-clock duration of the run in seconds.
+    :return: Dict with request count, errors, throughput and latency percentiles in milliseconds.
+    """
+    ordered = sorted(latencies)
+    summary = {
+        'requests': len(ordered),
+        'errors': errors,
+        'requests_per_second': len(ordered) / elapsed if elapsed else 0.0,
+    }
+    for name, fraction in (('p50_ms', 0.50), ('p95_ms', 0.95), ('p99_ms', 0.99)):
+        value = percentile(ordered, fraction)
+        summary[name] = None if value is None else value * 1000
+    summary['max_ms'] = ordered[-1] * 1000 if ordered else None
+    return summary
+
+def parse_mix(mix):
+    """
+    Parse a scenario mix such as 'cold=1,warm=8,invalid=1'.
+
+    :param mix: Comma-separated scenario=weight pairs.
+    :return: Dict mapping scenario to weight.
+    :raises ValueError: If a scenario is unknown or a weight is negative.
+    """
+    weights = {}
+    for part in mix.split(','):
+        scenario, _, weight = part.partition('=')
+        scenario = scenario.strip()
+        if scenario not in SCENARIOS:
+            raise ValueError(f"Unknown scenario: {scenario}")
+        weights[scenario] = float(weight or 1)
+        if weights[scenario] < 0:
+            raise ValueError(f"Negative weight for {scenario}")
+    return weights
+
+class LocalServers:
+    """
+    The mock authorization server and resource API running in this process on ephemeral ports.
+    """
+    def __init__(self, config=None, credential_store=None):
+        """
+        :param config: Settings object the apps are built from. By default the settings with rate
+                       limiting disabled, since it would measure the limiter rather than the servers,
+                       and without the password verification cache, which would answer repeated
+                       logins without hashing.
+        :param credential_store: CredentialStore shared by both apps, each app's own store built from
+                                 the config by default.
+        """
+        self._config = config if config is not None else settings.model_copy(
+            update={'RATE_LIMIT_ENABLED': False, 'PASSWORD_VERIFY_CACHE_SIZE': 0})
+        self._credential_store = credential_store
+
+    async def start(self):
+        self._runners = []
+        config = self._config
+        auth_port = await self._serve(create_auth_app(config))
+
+        config = config.model_copy(update={'AUTHORIZATION_HOST': '127.0.0.1', 'AUTHORIZATION_PORT': auth_port})
+        resource_port = await self._serve(create_resource_api_app(config))
+
+        self.auth_url = f"http://127.0.0.1:{auth_port}{settings.AUTHORIZATION_ENDPOINT}"
+        self.resource_url = f"http://127.0.0.1:{resource_port}{settings.API_ENDPOINT}"
+        return self
+
+    def connections(self):
+        """
+        :return: Number of client connections the servers currently hold open.
+        """
+        return sum(len(runner.server.connections) for runner in self._runners)
+
+    async def _serve(self, app):
+        if self._credential_store is not None:
+            app[CREDENTIAL_STORE] = self._credential_store
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        self._runners.append(runner)
+        sock = bind_socket('127.0.0.1', 0, settings.SERVER_BACKLOG)
+        await web.SockSite(runner, sock).start()
+        return sock.getsockname()[1]
+
+    async def close(self):
+        for runner in reversed(self._runners):
+            await runner.cleanup()
+
+class LoadGenerator:
+    """
+    Drives one load test run against LocalServers.
+    """
+    def __init__(self, servers, transport, weights, seed):
+        """
+        :param servers: Started LocalServers.
+        :param transport: Started Transport.
+        :param weights: Dict mapping scenario to weight.
+        :param seed: Seed of the scenario and arrival schedule random generator.
+        """
+        self._random = random.Random(seed)
+        self._scenarios = [scenario for scenario in SCENARIOS if weights.get(scenario)]
+        self._weights = [weights[scenario] for scenario in self._scenarios]
+        self._data_handler = DataFetchingHandler(transport.resource_session, url=servers.resource_url)
+        # Cold logins go straight to request_tokens: a TokenCache, even an empty one, would merge
+        # concurrent logins of the same user into one.
+        self._auth_handler = AuthorizationHandler(transport.auth_session, url=servers.auth_url)
+        self._warm_chain = AuthorizationHandler(transport.auth_session, successor=self._data_handler,
+                                                token_cache=TokenCache(), url=servers.auth_url)
+        self.reset()
+
+    def reset(self):
+        """Discard the recorded latencies and errors, e.g. after warming up."""
+        self.latencies = {scenario: [] for scenario in self._scenarios}
+        self.errors = {scenario: 0 for scenario in self._scenarios}
+
+    def next_scenario(self):
+        return self._random.choices(self._scenarios, self._weights)[0]
+
+    async def request(self, scenario, started=None):
+        """
+        Send one request and record its latency.
+
+        :param scenario: Scenario name.
+        :param started: perf_counter timestamp the latency is measured from, now by default.
+        """
+        started = time.perf_counter() if started is None else started
+        try:
+            if scenario == 'invalid':
+                await self._data_handler.handle_request(access_token='invalid_token')
+                expected = False
+            elif scenario == 'cold':
+                tokens = await self._auth_handler.request_tokens(settings.USER_NAME, settings.PASSWORD)
+                await self._data_handler.handle_request(access_token=tokens['access_token'])
+                expected = True
+            else:
+                await self._warm_chain.handle_request(settings.USER_NAME, settings.PASSWORD)
+                expected = True
+        except Exception:
+            expected = scenario == 'invalid'
+        self.latencies[scenario].append(time.perf_counter() - started)
+        if not expected:
+            self.errors[scenario] += 1
+
+    async def closed_loop(self, concurrency, duration, requests):
+        deadline = time.perf_counter() + duration
+        remaining = [requests]
+
+        async def worker():
+            while time.perf_counter() < deadline:
+                if requests:
+                    if remaining[0] <= 0:
+                        return
+                    remaining[0] -= 1
+                await self.request(self.next_scenario())
+
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+
+    async def open_loop(self, rate, duration, max_outstanding):
+        outstanding = set()
+        dropped = 0
+        start = time.perf_counter()
+        scheduled = start
+        while scheduled - start < duration:
+            scheduled += self._random.expovariate(rate)
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if len(outstanding) >= max_outstanding:
+                dropped += 1
+                continue
+            task = asyncio.ensure_future(self.request(self.next_scenario(), started=scheduled))
+            outstanding.add(task)
+            task.add_done_callback(outstanding.discard)
+        await asyncio.gather(*outstanding)
+        return dropped
+
+    def report(self, elapsed):
+        everything = [latency for latencies in self.latencies.values() for latency in latencies]
+        return {
+            'overall': summarize(everything, sum(self.errors.values()), elapsed),
+            'scenarios': {scenario: summarize(self.latencies[scenario], self.errors[scenario], elapsed)
+                          for scenario in self._scenarios},
+        }
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+async def run(mode='closed', concurrency=50, rate=500.0, duration=10.0, requests=0,
+              mix='cold=1,warm=8,invalid=1', seed=0, max_outstanding=10000, warmup=1.0):
+    """
+    Run one load test.
+
+    :param mode: 'closed' or 'open'.
+    :param concurrency: Number of workers in closed-loop mode.
+    :param rate: Arrival rate in requests per second in open-loop mode.
+    :param duration: Measured duration in seconds.
+    :param requests: Stop a closed-loop run after this many requests, 0 for no limit.
+    :param mix: Scenario mix, see parse_mix.
+    :param seed: Random seed making the scenario sequence and arrival schedule reproducible.
+    :param max_outstanding: Open-loop requests in flight beyond which arrivals are dropped and counted.
+    :param warmup: Seconds of closed-loop warm-up traffic excluded from the results.
+    :return: Dict with the run configuration, environment and results.
+    """
+    weights = parse_mix(mix)
+    servers = await LocalServers().start()
+    try:
+        async with Transport() as transport:
+            generator = LoadGenerator(servers, transport, weights, seed)
+            if warmup:
+                await generator.closed_loop(concurrency, warmup, 0)
+                generator.reset()
+
+            started = time.perf_counter()
+            dropped = 0
+            if mode == 'closed':
+                await generator.closed_loop(concurrency, duration, requests)
+            elif mode == 'open':
+                dropped = await generator.open_loop(rate, duration, max_outstanding)
+            else:
+                raise ValueError(f"Unknown mode: {mode}")
+            elapsed = time.perf_counter() - started
+    finally:
+        await servers.close()
+
+    results = generator.report(elapsed)
+    results['overall']['dropped'] = dropped
+    return {
+        'config': {'mode': mode, 'concurrency': concurrency, 'rate': rate, 'duration': duration,
+                   'requests': requests, 'mix': weights, 'seed': seed, 'max_outstanding': max_outstanding,
+                   'warmup': warmup},
+        'environment': {'commit': _git_commit(), 'python': sys.version.split()[0],
+                        'platform': platform.platform(), 'timestamp': time.time()},
+        'elapsed': elapsed,
+        'results': results,
+    }
+
+def compare(baseline, current):
+    """
+    Compare two result files scenario by scenario.
+
+    :param baseline: Result dict of the reference run.
+    :param current: Result dict of the run under test.
+    :return: List of (group, metric, baseline, current, relative change) tuples.
+    """
+    rows = []
+    groups = {'overall': (baseline['results']['overall'], current['results']['overall'])}
+    for scenario, summary in current['results']['scenarios'].items():
+        if scenario in baseline['results']['scenarios']:
+            groups[scenario] = (baseline['results']['scenarios'][scenario], summary)
+    for group, (before, after) in groups.items():
+        for metric in ('requests_per_second', 'p50_ms', 'p95_ms', 'p99_ms'):
+            if before.get(metric) and after.get(metric) is not None:
+                rows.append((group, metric, before[metric], after[metric], after[metric] / before[metric] - 1))
+    return rows
+
+def _print_results(result):
+    config = result['config']
+    print(f"mode={config['mode']} duration={result['elapsed']:.1f}s commit={result['environment']['commit']}")
+    header = f"{'group':<10} {'requests':>9} {'errors':>7} {'req/s':>10} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}"
+    print(header)
+    groups = dict(result['results']['scenarios'], overall=result['results']['overall'])
+    for group, summary in groups.items():
+        if not summary['requests']:
+            continue
+        print(f"{group:<10} {summary['requests']:>9} {summary['errors']:>7} {summary['requests_per_second']:>10.1f}"
+              f" {summary['p50_ms']:>8.2f} {summary['p95_ms']:>8.2f} {summary['p99_ms']:>8.2f}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the full authorization flow.")
+    parser.add_argument('--mode', choices=('closed', 'open'), default='closed')
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--rate', type=float, default=500.0, help="open-loop arrivals per second")
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--requests', type=int, default=0, help="closed-loop request limit, 0 for none")
+    parser.add_argument('--mix', default='cold=1,warm=8,invalid=1')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--max-outstanding', type=int, default=10000)
+    parser.add_argument('--warmup', type=float, default=1.0)
+    parser.add_argument('--output', help="write the results as JSON to this file")
+    parser.add_argument('--compare', nargs=2, metavar=('BASELINE', 'CURRENT'),
+                        help="compare two result files instead of running")
+    args = parser.parse_args()
+
+    if args.compare:
+        with open(args.compare[0]) as baseline, open(args.compare[1]) as current:
+            rows = compare(json.load(baseline), json.load(current))
+        for group, metric, before, after, change in rows:
+            print(f"{group:<10} {metric:<20} {before:>10.2f} -> {after:>10.2f} ({change:+.1%})")
+        return
+
+    result = asyncio.run(run(args.mode, args.concurrency, args.rate, args.duration, args.requests,
+                             args.mix, args.seed, args.max_outstanding, args.warmup))
+    _print_results(result)
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(result, output, indent=2)
+
+if __name__ == "__main__":
+    main()
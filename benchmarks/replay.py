@@ -0,0 +1,434 @@
+"""
+Replay and soak harness driven by a recorded access log.
+
+The requests of an access log (see auth_http.access_log) are replayed through
+the client code path against the in-process mock servers of benchmarks.loadgen:
+
+- logins, through AuthorizationHandler.request_tokens;
+- data requests, through the client pipeline, which reuses and refreshes tokens
+  like a real client;
+- logins and data requests that were rejected with 401 or 403 are replayed with
+  a wrong password or an invalid token.
+
+Other paths (token refresh, JWKS and revocation sync, metrics) come from the
+client's token cache and the resource API themselves and are skipped.
+settings.USER_NAME logs in with settings.PASSWORD against its configured
+credential. Every other logged user, including users of
+settings.AUTH_CREDENTIALS whose passwords are not known, gets a credential
+whose password is ``replay-<user>``.
+
+Requests start at their recorded offsets divided by --speed, e.g. 1 or 10, or as
+fast as --concurrency workers allow with --speed max. With --duration the log is
+looped for a soak test. A monitor samples every --interval seconds:
+
+- event-loop lag: how late a timer due every 10 ms fires;
+- memory traced by tracemalloc, and the allocation sites that grew most between
+  the first sample and the end of the run;
+- connections open in the client pools and on the servers;
+- asyncio tasks alive.
+
+Usage:
+    ACCESS_LOG_PATH='access-{pid}.log' python -m benchmarks.loadgen --duration 30
+    python -m benchmarks.replay access-*.log --speed 10
+    python -m benchmarks.replay access-*.log --speed max --concurrency 50 --duration 3600 --output soak.json
+"""
+import argparse
+import asyncio
+import json
+import platform
+import sys
+import time
+import tracemalloc
+from auth_http.access_log import read_access_log
+from auth_http.credential_store import InMemoryCredentialStore
+from auth_http.exceptions import AuthorizationError
+from auth_http.handlers import AuthorizationHandler, DataFetchingHandler
+from auth_http.password_hashing import make_credential
+from auth_http.pipeline import build_pipeline
+from auth_http.transport import Transport
+from benchmarks.loadgen import LocalServers, _git_commit, percentile, summarize
+from settings import settings
+
+GROUPS = ('login', 'data', 'rejected_login', 'rejected_data')
+REJECTED_STATUSES = frozenset((401, 403))
+# Seconds between two event-loop lag probes.
+LAG_PROBE_INTERVAL = 0.01
+
+def replay_password(user_name):
+    """
+    :param user_name: Logged user.
+    :return: settings.PASSWORD for settings.USER_NAME, otherwise ``replay-<user>``, the
+             password of the credential create_credential_store gives the user.
+    """
+    if user_name == settings.USER_NAME:
+        return settings.PASSWORD
+    return f"replay-{user_name}"
+
+def classify(entry):
+    """
+    :param entry: AccessLogEntry.
+    :return: The group the entry is replayed as, None for skipped paths.
+    """
+    path = entry.path.partition('?')[0]
+    rejected = entry.status in REJECTED_STATUSES or entry.user is None
+    if path == settings.AUTHORIZATION_ENDPOINT:
+        return 'rejected_login' if rejected else 'login'
+    if path == settings.API_ENDPOINT:
+        return 'rejected_data' if rejected else 'data'
+    return None
+
+def create_credential_store(entries, kdf=None):
+    """
+    :param entries: AccessLogEntry objects.
+    :param kdf: KDF of the credentials, defaults to settings.PASSWORD_KDF.
+    :return: An InMemoryCredentialStore of settings.AUTH_CREDENTIALS in which every logged
+             user but settings.USER_NAME has a credential for its replay_password.
+    """
+    store = InMemoryCredentialStore(settings.AUTH_CREDENTIALS)
+    for user_name in {entry.user for entry in entries if entry.user not in (None, settings.USER_NAME)}:
+        credential = make_credential(user_name, replay_password(user_name), kdf)
+        store.add(user_name, credential.salt, credential.hash, credential.kdf)
+    return store
+
+def schedule(entries, duration=None):
+    """
+    Yield the replayed entries with their offset from the start of the log.
+
+    :param entries: Replayable AccessLogEntry objects ordered by start time.
+    :param duration: Loop the log until its offsets reach this many seconds, None for one pass.
+    :return: Iterator of (offset, entry) tuples.
+    """
+    first = entries[0].ts
+    span = entries[-1].ts - first
+    # Keep the log's average gap between the last entry of a pass and the first of the next.
+    period = span + span / max(len(entries) - 1, 1) or 1.0
+    loop = 0
+    while True:
+        for entry in entries:
+            offset = loop * period + entry.ts - first
+            if duration is not None and offset >= duration:
+                return
+            yield offset, entry
+        loop += 1
+        if duration is None:
+            return
+
+class Replayer:
+    """
+    Sends replayed requests through the client code path and records their outcome.
+    """
+    def __init__(self, servers, transport, resilient=True):
+        """
+        :param servers: Started LocalServers.
+        :param transport: Started Transport.
+        :param resilient: Whether data requests retry and hedge through a ResilienceHandler, as in main.py.
+        """
+        self._auth_handler = AuthorizationHandler(transport.auth_session, url=servers.auth_url)
+        self._data_handler = DataFetchingHandler(transport.resource_session, url=servers.resource_url)
+        self._pipeline = build_pipeline(transport, [
+            {'stage': 'authenticate', 'url': servers.auth_url},
+            {'stage': 'fetch', 'url': servers.resource_url, 'resilient': resilient},
+        ])
+        self.in_flight = 0
+        self.reset()
+
+    def reset(self):
+        """Discard the recorded latencies and errors, e.g. after warming up."""
+        self.latencies = {group: [] for group in GROUPS}
+        self.errors = {group: 0 for group in GROUPS}
+
+    @property
+    def completed(self):
+        return sum(len(latencies) for latencies in self.latencies.values())
+
+    async def request(self, group, user_name, started=None):
+        """
+        Replay one request and record its latency.
+
+        :param group: Group from classify.
+        :param user_name: Logged user, None if unknown.
+        :param started: perf_counter timestamp the latency is measured from, now by default.
+        """
+        started = time.perf_counter() if started is None else started
+        self.in_flight += 1
+        try:
+            if group == 'login':
+                await self._auth_handler.request_tokens(user_name, replay_password(user_name))
+            elif group == 'data':
+                await self._pipeline.handle_request(user_name, replay_password(user_name))
+            elif group == 'rejected_login':
+                await self._auth_handler.request_tokens(user_name or settings.USER_NAME, 'wrong-password')
+            else:
+                await self._data_handler.handle_request(access_token='invalid_token')
+            expected = not group.startswith('rejected')
+        except AuthorizationError as error:
+            expected = group == 'rejected_login' and error.status == 401
+        except Exception as error:
+            expected = group == 'rejected_data' and getattr(error, 'status', None) == 401
+        finally:
+            self.in_flight -= 1
+        self.latencies[group].append(time.perf_counter() - started)
+        if not expected:
+            self.errors[group] += 1
+
+    async def paced(self, scheduled, speed, max_outstanding):
+        """
+        Start requests at their recorded offsets divided by speed.
+
+        :return: Number of requests dropped because max_outstanding were in flight.
+        """
+        outstanding = set()
+        dropped = 0
+        start = time.perf_counter()
+        for offset, group, user_name in scheduled:
+            due = start + offset / speed
+            delay = due - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if len(outstanding) >= max_outstanding:
+                dropped += 1
+                continue
+            task = asyncio.ensure_future(self.request(group, user_name, started=due))
+            outstanding.add(task)
+            task.add_done_callback(outstanding.discard)
+        await asyncio.gather(*outstanding)
+        return dropped
+
+    async def unpaced(self, scheduled, concurrency, duration=None):
+        """
+        Send the requests as fast as the workers allow.
+        """
+        deadline = None if duration is None else time.perf_counter() + duration
+
+        async def worker():
+            for _, group, user_name in scheduled:
+                await self.request(group, user_name)
+                if deadline is not None and time.perf_counter() >= deadline:
+                    return
+
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+
+    def report(self, elapsed):
+        everything = [latency for latencies in self.latencies.values() for latency in latencies]
+        return {
+            'overall': summarize(everything, sum(self.errors.values()), elapsed),
+            'groups': {group: summarize(self.latencies[group], self.errors[group], elapsed) for group in GROUPS},
+        }
+
+class Monitor:
+    """
+    Samples event-loop lag, memory, connections and tasks while a replay runs.
+    """
+    def __init__(self, servers, transport, replayer, interval, top=10):
+        """
+        :param servers: Started LocalServers.
+        :param transport: Started Transport.
+        :param replayer: The Replayer whose progress is reported.
+        :param interval: Seconds between samples.
+        :param top: Allocation sites reported in the memory growth.
+        """
+        self._servers = servers
+        self._transport = transport
+        self._replayer = replayer
+        self._interval = interval
+        self._top = top
+        self._lags = []
+        # Lag probes due before this loop time are discarded; the baseline snapshot stalls the loop.
+        self._ignore_lags_before = 0.0
+        self._baseline = None
+        self.samples = []
+
+    async def run(self):
+        """Sample until cancelled."""
+        probe = asyncio.ensure_future(self._probe_lag())
+        started = time.perf_counter()
+        try:
+            while True:
+                await asyncio.sleep(self._interval)
+                sample = self.sample(time.perf_counter() - started)
+                self.samples.append(sample)
+                _print_sample(sample)
+        finally:
+            probe.cancel()
+            await asyncio.gather(probe, return_exceptions=True)
+
+    def sample(self, elapsed):
+        lags = sorted(self._lags)
+        self._lags = []
+        if tracemalloc.is_tracing() and self._baseline is None:
+            # The first interval warms caches and connection pools; growth is measured from here.
+            self._baseline = self._snapshot()
+            self._ignore_lags_before = asyncio.get_running_loop().time()
+        current, peak = tracemalloc.get_traced_memory() if tracemalloc.is_tracing() else (0, 0)
+        return {
+            'elapsed': elapsed,
+            'requests': self._replayer.completed,
+            'errors': sum(self._replayer.errors.values()),
+            'in_flight': self._replayer.in_flight,
+            'traced_mb': current / 2 ** 20,
+            'peak_traced_mb': peak / 2 ** 20,
+            'client_connections': {name: stats.in_use + stats.idle for name, stats in self._transport.stats().items()},
+            'server_connections': self._servers.connections(),
+            'tasks': len(asyncio.all_tasks()),
+            'lag_p99_ms': (percentile(lags, 0.99) or 0.0) * 1000,
+            'lag_max_ms': (lags[-1] if lags else 0.0) * 1000,
+        }
+
+    def memory_growth(self):
+        """
+        :return: The allocation sites whose traced memory grew most since the first sample,
+                 as dicts with 'site', 'size_kb' and 'count'.
+        """
+        if self._baseline is None:
+            return []
+        growth = self._snapshot().compare_to(self._baseline, 'lineno')
+        return [{'site': str(stat.traceback), 'size_kb': stat.size_diff / 1024, 'count': stat.count_diff}
+                for stat in growth[:self._top] if stat.size_diff > 0]
+
+    async def _probe_lag(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            due = loop.time() + LAG_PROBE_INTERVAL
+            await asyncio.sleep(LAG_PROBE_INTERVAL)
+            if due >= self._ignore_lags_before:
+                self._lags.append(loop.time() - due)
+
+    @staticmethod
+    def _snapshot():
+        return tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+        ))
+
+def _print_sample(sample):
+    connections = ' '.join(f"{name}={count}" for name, count in sample['client_connections'].items())
+    print(f"t={sample['elapsed']:7.1f}s requests={sample['requests']:>8} errors={sample['errors']:>5}"
+          f" in_flight={sample['in_flight']:>5} traced={sample['traced_mb']:7.1f}MB {connections}"
+          f" server_conns={sample['server_connections']:>4} tasks={sample['tasks']:>5}"
+          f" lag p99={sample['lag_p99_ms']:6.1f}ms max={sample['lag_max_ms']:6.1f}ms", flush=True)
+
+async def run(paths, speed='1', concurrency=50, duration=None, interval=5.0, max_outstanding=10000, trace=True,
+              trace_frames=1, kdf=None, resilient=True):
+    """
+    Replay access logs against the in-process servers.
+
+    :param paths: Access log paths.
+    :param speed: Replay speed factor as a string, or 'max'.
+    :param concurrency: Workers sending requests at max speed.
+    :param duration: Seconds to loop the log for, None for one pass.
+    :param interval: Seconds between monitor samples.
+    :param max_outstanding: Paced requests in flight beyond which arrivals are dropped and counted.
+    :param trace: Whether to trace memory allocations with tracemalloc.
+    :param trace_frames: Frames stored per traced allocation.
+    :param kdf: KDF of the replayed users' credentials, defaults to settings.PASSWORD_KDF.
+    :param resilient: Whether data requests retry and hedge, see Replayer.
+    :return: Dict with the run configuration, environment, samples and results.
+    """
+    entries = read_access_log(*paths)
+    replayable = [entry for entry in entries if classify(entry) is not None]
+    if not replayable:
+        raise ValueError("The access logs have no replayable requests")
+    if duration is None:
+        horizon = None
+    elif speed == 'max':
+        # The wall clock ends the run.
+        horizon = float('inf')
+    else:
+        horizon = duration * float(speed)
+    scheduled = ((offset, classify(entry), entry.user) for offset, entry in schedule(replayable, horizon))
+
+    config = settings.model_copy(update={'RATE_LIMIT_ENABLED': False, 'ACCESS_LOG_PATH': ''})
+    servers = await LocalServers(config, create_credential_store(replayable, kdf)).start()
+    if trace:
+        tracemalloc.start(trace_frames)
+    try:
+        async with Transport() as transport:
+            replayer = Replayer(servers, transport, resilient)
+            monitor = Monitor(servers, transport, replayer, interval)
+            monitoring = asyncio.ensure_future(monitor.run())
+            started = time.perf_counter()
+            dropped = 0
+            try:
+                if speed == 'max':
+                    await replayer.unpaced(scheduled, concurrency, duration)
+                else:
+                    dropped = await replayer.paced(scheduled, float(speed), max_outstanding)
+                elapsed = time.perf_counter() - started
+                final = monitor.sample(elapsed)
+                growth = monitor.memory_growth()
+            finally:
+                monitoring.cancel()
+                await asyncio.gather(monitoring, return_exceptions=True)
+    finally:
+        if trace:
+            tracemalloc.stop()
+        await servers.close()
+
+    results = replayer.report(elapsed)
+    results['overall']['dropped'] = dropped
+    first = monitor.samples[0] if monitor.samples else final
+    return {
+        'config': {'logs': list(paths), 'speed': speed, 'concurrency': concurrency, 'duration': duration,
+                   'interval': interval, 'max_outstanding': max_outstanding, 'trace': trace, 'resilient': resilient,
+                   'logged_requests': len(entries), 'replayable_requests': len(replayable)},
+        'environment': {'commit': _git_commit(), 'python': sys.version.split()[0],
+                        'platform': platform.platform(), 'timestamp': time.time()},
+        'elapsed': elapsed,
+        'results': results,
+        'samples': monitor.samples + [final],
+        'memory': {
+            'traced_growth_mb': final['traced_mb'] - first['traced_mb'],
+            'peak_traced_mb': final['peak_traced_mb'],
+            'top_growth': growth,
+        },
+        'event_loop': {'lag_max_ms': max(sample['lag_max_ms'] for sample in monitor.samples + [final])},
+    }
+
+def _print_results(result):
+    print(f"speed={result['config']['speed']} elapsed={result['elapsed']:.1f}s "
+          f"commit={result['environment']['commit']}")
+    print(f"{'group':<15} {'requests':>9} {'errors':>7} {'req/s':>10} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    groups = dict(result['results']['groups'], overall=result['results']['overall'])
+    for group, summary in groups.items():
+        if not summary['requests']:
+            continue
+        print(f"{group:<15} {summary['requests']:>9} {summary['errors']:>7} {summary['requests_per_second']:>10.1f}"
+              f" {summary['p50_ms']:>8.2f} {summary['p95_ms']:>8.2f} {summary['p99_ms']:>8.2f}")
+    memory = result['memory']
+    print(f"traced memory growth {memory['traced_growth_mb']:+.2f}MB, peak {memory['peak_traced_mb']:.1f}MB; "
+          f"max event-loop lag {result['event_loop']['lag_max_ms']:.1f}ms")
+    for stat in memory['top_growth']:
+        print(f"  {stat['size_kb']:+10.1f}KB {stat['count']:+8} {stat['site']}")
+
+def _speed(value):
+    if value != 'max' and float(value) <= 0:
+        raise argparse.ArgumentTypeError("speed must be positive or 'max'")
+    return value
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded access logs against the in-process servers.")
+    parser.add_argument('logs', nargs='+', help="access log files, e.g. one per worker")
+    parser.add_argument('--speed', type=_speed, default='1', help="speed factor such as 1 or 10, or 'max'")
+    parser.add_argument('--concurrency', type=int, default=50, help="workers at max speed")
+    parser.add_argument('--duration', type=float, help="seconds to loop the log for, a soak test")
+    parser.add_argument('--interval', type=float, default=5.0, help="seconds between monitor samples")
+    parser.add_argument('--max-outstanding', type=int, default=10000)
+    parser.add_argument('--no-tracemalloc', dest='trace', action='store_false',
+                        help="do not trace allocations, which slows the replay down")
+    parser.add_argument('--trace-frames', type=int, default=1, help="frames stored per traced allocation")
+    parser.add_argument('--kdf', help="KDF of the replayed users' credentials")
+    parser.add_argument('--no-resilience', dest='resilient', action='store_false',
+                        help="send data requests without retries and hedging")
+    parser.add_argument('--output', help="write the results as JSON to this file")
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args.logs, args.speed, args.concurrency, args.duration, args.interval,
+                             args.max_outstanding, args.trace, args.trace_frames, args.kdf, args.resilient))
+    _print_results(result)
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(result, output, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -1,43 +1,42 @@
 import asyncio
-from aiohttp import ClientSession, web
-from auth_http.handlers import AuthorizationHandler, DataFetchingHandler
+from aiohttp import web
 from auth_http.client import Client
-from auth_http.mock_auth_server import app as auth_app
-from auth_http.mock_resource_api import app as resource_api_app
+from auth_http.mock_auth_server import create_app as create_auth_app
+from auth_http.mock_resource_api import create_app as create_resource_api_app
+from auth_http.pipeline import build_pipeline
+from auth_http.transport import Transport
 from settings import settings
 
-#Defining runners for authorization server and resource API
-auth_server_runner = web.AppRunner(auth_app)
-resource_api_runner = web.AppRunner(resource_api_app)
-
 async def main():
-    await run_servers()
-    async with ClientSession() as http_client:
-        data_handler = DataFetchingHandler(http_client=http_client)
-        auth_handler = AuthorizationHandler(http_client=http_client, successor = data_handler)
-        client = Client(authorization_handler = auth_handler)
+    runners = await run_servers()
+    async with Transport() as transport:
+        client = Client(authorization_handler = build_pipeline(transport))
 
         result = await client.process_request(settings.USER_NAME, settings.PASSWORD)
         print("Successfully received: " + result)
         #Stop handling all servers and cleanup used resources.
-        await auth_server_runner.cleanup()
-        await resource_api_runner.cleanup()
+        for runner in runners:
+            await runner.cleanup()
 
-async def run_servers():
+async def run_servers(config=settings):
     """
     Run the authorization server and resource API servers.
 
-    This function sets up and starts the authorization server and resource API servers.
+    This function builds the authorization server and resource API applications and starts them.
 
-    :return: None
+    :param config: Settings object.
+    :return: The started runners, to clean up once done.
     """
+    auth_server_runner = web.AppRunner(create_auth_app(config))
     await auth_server_runner.setup()
-    auth_site = web.TCPSite(auth_server_runner, settings.AUTHORIZATION_HOST, settings.AUTHORIZATION_PORT)
+    auth_site = web.TCPSite(auth_server_runner, config.AUTHORIZATION_HOST, config.AUTHORIZATION_PORT)
     await auth_site.start()
 
+    resource_api_runner = web.AppRunner(create_resource_api_app(config))
     await resource_api_runner.setup()
-    resource_api_site = web.TCPSite(resource_api_runner, settings.API_HOST, settings.API_PORT)
+    resource_api_site = web.TCPSite(resource_api_runner, config.API_HOST, config.API_PORT)
     await resource_api_site.start()
+    return auth_server_runner, resource_api_runner
 
 if __name__ == "__main__":
     asyncio.run(main(),
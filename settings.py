@@ -8,11 +8,51 @@ class Settings(BaseSettings):
     AUTHORIZATION_HOST: str = "localhost"
     AUTHORIZATION_PORT: int = 8080
     AUTHORIZATION_ENDPOINT : str = "/authenticate"
+    REFRESH_ENDPOINT : str = "/refresh"
+    # lifetime in seconds of issued access and refresh tokens
+    ACCESS_TOKEN_TTL: int = 300
+    REFRESH_TOKEN_TTL: int = 86400
 
     # resource API Settings
     API_HOST: str = "localhost"
     API_PORT: int = 8081
     API_ENDPOINT : str = "/get_data"
+    # records in the mock dataset streamed by /get_data as NDJSON
+    RESOURCE_RECORD_COUNT: int = 1000
+    # bytes of NDJSON buffered before a chunk is written, bounds time to first record
+    STREAM_CHUNK_SIZE: int = 16384
+    # records per page when /get_data is called with a cursor, and the largest `limit` accepted
+    RESOURCE_PAGE_SIZE: int = 100
+    RESOURCE_MAX_PAGE_SIZE: int = 1000
+
+    # multi-process server launcher, see auth_http.server
+    AUTH_WORKERS: int = 1
+    API_WORKERS: int = 1
+    # bind one SO_REUSEPORT socket per worker instead of sharing a socket bound before forking
+    SERVER_REUSE_PORT: bool = True
+    SERVER_BACKLOG: int = 1024
+    # seconds workers wait for in-flight requests to finish on SIGTERM
+    SERVER_SHUTDOWN_TIMEOUT: float = 10.0
+    SERVER_HEALTH_CHECK_INTERVAL: float = 1.0
+    SERVER_RESTART_DELAY: float = 1.0
+    SERVER_USE_UVLOOP: bool = False
+    # NDJSON access log of the mock servers for benchmarks/replay.py, "{pid}" is replaced
+    # by the worker's process ID; empty disables it, see auth_http.access_log
+    ACCESS_LOG_PATH: str = ""
+
+    # rate limiting and admission control of the mock servers, see auth_http.rate_limit;
+    # rates are requests per second, 0 disables a limit
+    RATE_LIMIT_ENABLED: bool = True
+    RATE_LIMIT_USER_RATE: float = 100.0
+    RATE_LIMIT_USER_BURST: int = 200
+    RATE_LIMIT_IP_RATE: float = 1000.0
+    RATE_LIMIT_IP_BURST: int = 2000
+    # seconds after which the bucket of an inactive user or IP is dropped
+    RATE_LIMIT_IDLE_TIMEOUT: float = 60.0
+    RATE_LIMIT_EXEMPT_PATHS: list = ["/metrics", "/.well-known/jwks.json"]
+    # requests handled at once per worker before new ones are answered with 503
+    MAX_CONCURRENT_REQUESTS: int = 512
+    OVERLOAD_RETRY_AFTER: int = 1
 
     # user Credentials
     USER_NAME: str = "ABNAMRO"
@@ -26,7 +66,102 @@ class Settings(BaseSettings):
         }
     }
 
-    # shared secret key for JWT
-    JWT_SECRET_KEY: str = "iNzszLnvWXALoVicnqCVViIB3CjPy65Q"
+    # HTTP transport used by the handler chain, see auth_http.transport
+    AUTH_POOL_LIMIT: int = 100
+    AUTH_POOL_LIMIT_PER_HOST: int = 0
+    API_POOL_LIMIT: int = 100
+    API_POOL_LIMIT_PER_HOST: int = 0
+    HTTP_KEEPALIVE_TIMEOUT: float = 30.0
+    HTTP_DNS_CACHE_TTL: int = 300
+    HTTP_CONNECT_TIMEOUT: float = 5.0
+    HTTP_READ_TIMEOUT: float = 10.0
+    HTTP_TOTAL_TIMEOUT: float = 30.0
+
+    # JSON backend of the servers and the client: 'orjson', 'msgspec', 'json' or
+    # 'auto' for the first one installed, see auth_http.serialization
+    JSON_BACKEND: str = "auto"
+
+    # responses DataFetchingHandler keeps to revalidate with If-None-Match
+    RESPONSE_CACHE_SIZE: int = 1024
+
+    # ResilienceHandler, see auth_http.resilience: attempts per idempotent call and
+    # full-jitter exponential backoff between them, in seconds
+    RESILIENCE_MAX_ATTEMPTS: int = 3
+    RESILIENCE_BACKOFF_BASE: float = 0.05
+    RESILIENCE_BACKOFF_CAP: float = 1.0
+    # a hedged call starts once a call runs longer than this percentile of the
+    # latencies of the last RESILIENCE_LATENCY_WINDOW successful calls
+    RESILIENCE_HEDGE_PERCENTILE: float = 95.0
+    RESILIENCE_HEDGE_MIN_SAMPLES: int = 20
+    RESILIENCE_LATENCY_WINDOW: int = 200
+    # consecutive transient failures opening an endpoint's circuit breaker, and
+    # seconds before a trial call is let through
+    CIRCUIT_FAILURE_THRESHOLD: int = 5
+    CIRCUIT_RESET_TIMEOUT: float = 10.0
+
+    # stages of the client's request pipeline, see auth_http.pipeline
+    PIPELINE_STAGES: list = ["authenticate", "fetch"]
+
+    # maximum number of requests Client.process_many keeps in flight
+    CLIENT_CONCURRENCY: int = 100
+
+    # client-side access token cache
+    TOKEN_CACHE_SIZE: int = 1024
+    # seconds before `exp` at which a cached token is no longer reused
+    TOKEN_REFRESH_MARGIN: float = 30.0
+    # lifetime assumed for tokens issued without an `exp` claim
+    TOKEN_DEFAULT_TTL: float = 300.0
+    # seconds before `exp` at which a cached token is refreshed in the background
+    TOKEN_REFRESH_AHEAD: float = 60.0
+
+    # credential store used by the mock servers: 'memory' (seeded from
+    # AUTH_CREDENTIALS), 'sqlite' or 'snapshot', see auth_http.credential_store
+    CREDENTIAL_STORE: str = "memory"
+    CREDENTIAL_STORE_PATH: str = ""
+
+    # password hashing on the authorization server, see auth_http.password_hashing
+    # KDF used for newly created credentials
+    PASSWORD_KDF: str = "scrypt$n=16384$r=8$p=1"
+    # 'thread' or 'process' pool running the KDF off the event loop
+    PASSWORD_HASH_EXECUTOR: str = "thread"
+    PASSWORD_HASH_WORKERS: int = 4
+    # verifications running or queued before logins are answered with 503
+    PASSWORD_HASH_MAX_PENDING: int = 64
+    PASSWORD_HASH_RETRY_AFTER: int = 1
+    # recent successful verifications remembered to absorb client retries
+    PASSWORD_VERIFY_CACHE_SIZE: int = 1024
+    PASSWORD_VERIFY_CACHE_TTL: float = 10.0
+
+    # verified access tokens cached by the resource API
+    VERIFIED_TOKEN_CACHE_SIZE: int = 10000
+    # longest time a verified token is reused, tokens also expire at their `exp`
+    VERIFIED_TOKEN_CACHE_TTL: float = 300.0
+
+    # JWT signing: 'EdDSA' or 'RS256' sign with a private key whose public half is
+    # published as a JWKS; 'HS256' signs with JWT_SECRET_KEY
+    JWT_ALGORITHM: str = "EdDSA"
+    # PEM private key shared by every authorization server worker; an ephemeral key
+    # is generated when empty, which only suits a single process
+    JWT_PRIVATE_KEY_PATH: str = ""
+    JWKS_ENDPOINT: str = "/.well-known/jwks.json"
+    JWKS_REFRESH_INTERVAL: float = 300.0
+    JWKS_MIN_REFRESH_INTERVAL: float = 5.0
+
+    # token revocation by `jti`, see auth_http.revocation
+    REVOKE_ENDPOINT: str = "/revoke"
+    REVOCATIONS_ENDPOINT: str = "/revocations"
+    # seconds between incremental syncs of the resource API's revocation list
+    REVOCATION_SYNC_INTERVAL: float = 5.0
+    # revocations returned per sync request
+    REVOCATION_PAGE_SIZE: int = 10000
+    # SQLite file of a revocation log shared by several authorization server processes;
+    # empty keeps the log in memory. auth_http.server uses a temporary file by default
+    REVOCATION_LOG_PATH: str = ""
+
+    # shared secret key for HS256 tokens; empty by default so the resource API only
+    # accepts tokens signed with the authorization server's private key. Setting it
+    # opts the resource API into accepting HS256 tokens, and is required when
+    # JWT_ALGORITHM is 'HS256'
+    JWT_SECRET_KEY: str = ""
 
 settings = Settings()
@@ -0,0 +1,70 @@
+import base64
+import os
+import tempfile
+import asynctest
+from aiohttp import web
+from aiohttp.test_utils import TestServer, TestClient as AioHTTPTestClient
+from auth_http.access_log import AccessLog, AccessLogEntry, read_access_log, setup_access_log
+from auth_http.mock_auth_server import authenticate
+from auth_http.rate_limit import setup_rate_limiting
+from settings import settings
+
+class TestAccessLog(asynctest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def test_round_trip_and_merge(self):
+        first = AccessLog(os.path.join(self.directory.name, 'first-{pid}.log'))
+        second = AccessLog(os.path.join(self.directory.name, 'second.log'))
+        self.assertTrue(first.path.endswith(f'first-{os.getpid()}.log'))
+        first.record(AccessLogEntry(3.0, 'a', 'GET', '/get_data', 200, 0.01))
+        first.record(AccessLogEntry(1.0, 'a', 'POST', '/authenticate', 200, 0.05))
+        second.record(AccessLogEntry(2.0, None, 'GET', '/get_data?limit=10', 401, 0.001))
+        first.close()
+        second.close()
+
+        entries = read_access_log(first.path, second.path)
+        self.assertEqual([entry.ts for entry in entries], [1.0, 2.0, 3.0])
+        self.assertEqual(entries[1].to_dict(), {'ts': 2.0, 'user': None, 'method': 'GET',
+                                                'path': '/get_data?limit=10', 'status': 401, 'duration': 0.001})
+
+class TestAccessLogMiddleware(asynctest.TestCase):
+
+    async def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.path = os.path.join(self.directory.name, 'access.log')
+
+        async def missing(request):
+            raise web.HTTPNotFound()
+
+        self.app = web.Application()
+        setup_access_log(self.app, self.path)
+        setup_rate_limiting(self.app, settings.model_copy(update={'RATE_LIMIT_IP_RATE': 1e-9,
+                                                                 'RATE_LIMIT_IP_BURST': 2}))
+        self.app.router.add_post('/authenticate', authenticate)
+        self.app.router.add_get('/missing', missing)
+        self.client = AioHTTPTestClient(TestServer(self.app))
+        await self.client.start_server()
+
+    async def test_records_user_status_and_rejections(self):
+        credentials = base64.b64encode(f"{settings.USER_NAME}:{settings.PASSWORD}".encode()).decode()
+        response = await self.client.post('/authenticate', headers={'Authorization': f'Basic {credentials}'})
+        self.assertEqual(response.status, 200)
+        self.assertEqual((await self.client.get('/missing')).status, 404)
+        # The IP bucket is empty now; the rate limiter's rejection is logged as well.
+        self.assertEqual((await self.client.get('/missing')).status, 429)
+        await self.client.close()
+
+        entries = read_access_log(self.path)
+        self.assertEqual([(entry.user, entry.method, entry.path, entry.status) for entry in entries], [
+            (settings.USER_NAME, 'POST', '/authenticate', 200),
+            (None, 'GET', '/missing', 404),
+            (None, 'GET', '/missing', 429),
+        ])
+        self.assertTrue(all(entry.duration >= 0 for entry in entries))
+
+if __name__ == '__main__':
+    asynctest.main()
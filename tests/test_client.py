@@ -1,3 +1,4 @@
+import asyncio
 import asynctest
 from asynctest import CoroutineMock, patch
 from auth_http.exceptions import AuthorizationError
@@ -45,5 +46,64 @@ class TestClient(asynctest.TestCase):
 
         self.assertEqual(result, "Authorization failed")
 
+    @patch('auth_http.handlers.AuthorizationHandler')
+    async def test_process_many(self, MockAuthorizationHandler):
+        """
+        Test processing a batch of requests with per-item results.
+
+        This test checks that results come back in submission order and that a failing item
+        reports its exception without affecting the others.
+
+        :param MockAuthorizationHandler: Mocked AuthorizationHandler class.
+        """
+        async def fake_handle_request(user_name, password):
+            if password != "mock_password":
+                raise AuthorizationError("Authorization failed")
+            return "mock_data_" + user_name
+
+        mock_auth_handler_instance = MockAuthorizationHandler.return_value
+        mock_auth_handler_instance.handle_request = CoroutineMock(side_effect=fake_handle_request)
+
+        client = Client(authorization_handler=mock_auth_handler_instance)
+        requests = [(f"user_{i}", "mock_password" if i % 3 else "wrong_password") for i in range(20)]
+
+        results = await client.process_many(requests, concurrency=4)
+
+        self.assertEqual([result.index for result in results], list(range(20)))
+        for result in results:
+            if result.index % 3:
+                self.assertTrue(result.ok)
+                self.assertEqual(result.data, "mock_data_" + result.user_name)
+            else:
+                self.assertIsInstance(result.error, AuthorizationError)
+
+    @patch('auth_http.handlers.AuthorizationHandler')
+    async def test_stream_many_bounds_concurrency(self, MockAuthorizationHandler):
+        """
+        Test that streaming never keeps more requests in flight than the concurrency limit.
+
+        :param MockAuthorizationHandler: Mocked AuthorizationHandler class.
+        """
+        in_flight = []
+        peak = []
+
+        async def fake_handle_request(user_name, password):
+            in_flight.append(user_name)
+            peak.append(len(in_flight))
+            await asyncio.sleep(0)
+            in_flight.remove(user_name)
+            return "mock_data"
+
+        mock_auth_handler_instance = MockAuthorizationHandler.return_value
+        mock_auth_handler_instance.handle_request = CoroutineMock(side_effect=fake_handle_request)
+
+        client = Client(authorization_handler=mock_auth_handler_instance)
+        requests = ((f"user_{i}", "mock_password") for i in range(50))
+
+        results = [result async for result in client.stream_many(requests, concurrency=5)]
+
+        self.assertEqual(len(results), 50)
+        self.assertLessEqual(max(peak), 5)
+
 if __name__ == '__main__':
     asynctest.main()
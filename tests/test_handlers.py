@@ -2,6 +2,11 @@ import asynctest
 from asynctest import CoroutineMock, patch
 from auth_http.exceptions import AuthorizationError, DataFetchError
 from auth_http.handlers import AuthorizationHandler, DataFetchingHandler
+from auth_http.client import Client
+
+def _json_body(body):
+    """Mock response.json decoding body with the loads the handler passes."""
+    return CoroutineMock(side_effect=lambda loads: loads(body))
 
 class TestAuthorizationHandler(asynctest.TestCase):
 
@@ -26,18 +31,68 @@ class TestAuthorizationHandler(asynctest.TestCase):
         with self.assertRaises(AuthorizationError):
             await handler.authenticate("mock_user_name", "mock_password")
 
+    @patch('aiohttp.ClientSession')
+    async def test_access_token_reused_across_requests(self, MockClientSession):
+        http_client = MockClientSession()
+        response_mock = CoroutineMock(status=200, json=CoroutineMock(return_value={"access_token": "mock_access_token"}))
+        http_client.post.return_value.__aenter__.return_value = response_mock
+        successor = DataFetchingHandler(http_client = http_client)
+        successor.handle_request = CoroutineMock(return_value="mock_data")
+        handler = AuthorizationHandler(http_client = http_client, successor = successor)
+
+        await handler.handle_request("mock_user_name", "mock_password")
+        data = await handler.handle_request("mock_user_name", "mock_password")
+
+        self.assertEqual(data, "mock_data")
+        self.assertEqual(http_client.post.call_count, 1)
+        successor.handle_request.assert_called_with(access_token="mock_access_token")
+
 class TestDataFetchingHandler(asynctest.TestCase):
 
     @patch('aiohttp.ClientSession')
     async def test_fetch_data_success(self, MockClientSession):
         http_client = MockClientSession()
-        http_client.get.return_value.__aenter__.return_value = CoroutineMock(status=200, json=CoroutineMock(return_value={"data": "mock_data"}))
+        http_client.get.return_value.__aenter__.return_value = CoroutineMock(status=200, json=_json_body(b'{"data": "mock_data"}'))
         handler = DataFetchingHandler(http_client = http_client)
 
         data = await handler.fetch_data("mock_access_token")
 
         self.assertEqual(data, "mock_data")
 
+    @patch('aiohttp.ClientSession')
+    async def test_fetch_data_revalidates_with_etag(self, MockClientSession):
+        http_client = MockClientSession()
+        http_client.get.return_value.__aenter__.side_effect = [
+            CoroutineMock(status=200, headers={'ETag': '"v1"'}, json=_json_body(b'{"data": "mock_data"}')),
+            CoroutineMock(status=304, headers={'ETag': '"v1"'}),
+        ]
+        handler = DataFetchingHandler(http_client = http_client)
+
+        self.assertEqual(await handler.fetch_data("mock_access_token"), "mock_data")
+        self.assertEqual(await handler.fetch_data("mock_access_token"), "mock_data")
+
+        self.assertEqual(http_client.get.call_args[1]['headers']['If-None-Match'], '"v1"')
+
+    @patch('aiohttp.ClientSession')
+    async def test_fetch_data_uses_configured_url(self, MockClientSession):
+        http_client = MockClientSession()
+        http_client.get.return_value.__aenter__.return_value = CoroutineMock(status=200, headers={}, json=_json_body(b'{"data": "mock_data"}'))
+        handler = DataFetchingHandler(http_client = http_client, url = "http://resource.test:9000/get_data")
+
+        await handler.fetch_data("mock_access_token")
+
+        self.assertEqual(str(http_client.get.call_args[0][0]), "http://resource.test:9000/get_data")
+
+    @patch('aiohttp.ClientSession')
+    async def test_handle_request_ignores_extra_arguments(self, MockClientSession):
+        http_client = MockClientSession()
+        http_client.get.return_value.__aenter__.return_value = CoroutineMock(status=200, headers={}, json=_json_body(b'{"data": "mock_data"}'))
+        handler = DataFetchingHandler(http_client = http_client)
+
+        data = await handler.handle_request(access_token = "mock_access_token", trace_id = "abc")
+
+        self.assertEqual(data, "mock_data")
+
     @patch('aiohttp.ClientSession')
     async def test_fetch_data_failure(self, MockClientSession):
         http_client = MockClientSession()
@@ -47,5 +102,22 @@ class TestDataFetchingHandler(asynctest.TestCase):
         with self.assertRaises(DataFetchError):
             await handler.fetch_data("mock_access_token")
 
+    @patch('aiohttp.ClientSession')
+    async def test_fetch_data_records_metrics(self, MockClientSession):
+        http_client = MockClientSession()
+        http_client.get.return_value.__aenter__.return_value = CoroutineMock(status=403, text="Access denied")
+        handler = DataFetchingHandler(http_client = http_client)
+        before = Client(handler).metrics_snapshot()
+
+        with self.assertRaises(DataFetchError):
+            await handler.fetch_data("mock_access_token")
+
+        after = Client(handler).metrics_snapshot()
+        self.assertEqual(after['client_fetch_responses_total']['403'],
+                         before['client_fetch_responses_total'].get('403', 0) + 1)
+        self.assertEqual(after['client_fetch_duration_seconds']['']['count'],
+                         before['client_fetch_duration_seconds']['']['count'] + 1)
+        self.assertEqual(after['client_fetch_requests_in_flight'][''], 0)
+
 if __name__ == '__main__':
     asynctest.main()
@@ -0,0 +1,98 @@
+import asyncio
+import asynctest
+import jwt
+import time
+from aiohttp import web
+from aiohttp.test_utils import TestServer, TestClient as AioHTTPTestClient
+from auth_http.keys import JWKS_CACHE, SIGNING_KEYS, JWKSCache, SigningKeyRing
+from auth_http.mock_auth_server import jwks
+from auth_http.mock_resource_api import get_data
+from settings import settings
+
+class TestSigningKeyRing(asynctest.TestCase):
+
+    def test_sign_and_verify(self):
+        ring = SigningKeyRing()
+        kid = ring.rotate('EdDSA')
+
+        token = ring.sign({'user_name': settings.USER_NAME})
+
+        self.assertEqual(jwt.get_unverified_header(token)['kid'], kid)
+        self.assertEqual(ring.verify(token)['user_name'], settings.USER_NAME)
+
+    def test_rotation_keeps_previous_key_published(self):
+        ring = SigningKeyRing()
+        old_kid = ring.rotate('EdDSA')
+        old_token = ring.sign({'user_name': settings.USER_NAME})
+        new_kid = ring.rotate('RS256')
+
+        self.assertEqual({jwk['kid'] for jwk in ring.jwks()['keys']}, {old_kid, new_kid})
+        self.assertEqual(ring.verify(old_token)['user_name'], settings.USER_NAME)
+
+        ring.retire(old_kid)
+        with self.assertRaises(jwt.InvalidTokenError):
+            ring.verify(old_token)
+        with self.assertRaises(ValueError):
+            ring.retire(new_kid)
+
+class TestJWKSVerification(asynctest.TestCase):
+
+    async def setUp(self):
+        self.ring = SigningKeyRing()
+        self.ring.rotate('EdDSA')
+        self.auth_app = web.Application()
+        self.auth_app[SIGNING_KEYS] = self.ring
+        self.auth_app.router.add_get('/.well-known/jwks.json', jwks)
+        self.auth_client = AioHTTPTestClient(TestServer(self.auth_app))
+        await self.auth_client.start_server()
+
+        self.jwks_cache = JWKSCache(url=str(self.auth_client.make_url('/.well-known/jwks.json')))
+        self.resource_app = web.Application()
+        self.resource_app[JWKS_CACHE] = self.jwks_cache
+        self.resource_app.router.add_get('/get_data', get_data)
+        self.resource_client = AioHTTPTestClient(TestServer(self.resource_app))
+        await self.resource_client.start_server()
+
+    async def tearDown(self):
+        await self.jwks_cache.stop()
+        await self.resource_client.close()
+        await self.auth_client.close()
+
+    async def get_data(self, token):
+        return await self.resource_client.get('/get_data', headers={'Authorization': 'Bearer ' + token})
+
+    async def test_token_verified_with_published_key(self):
+        await self.jwks_cache.refresh()
+        token = self.ring.sign({'user_name': settings.USER_NAME, 'exp': int(time.time()) + 60})
+
+        response = await self.get_data(token)
+
+        self.assertEqual(response.status, 200)
+
+    async def test_unknown_kid_rejected_and_refreshed_in_background(self):
+        await self.jwks_cache.refresh()
+        self.jwks_cache.min_interval = 0
+        self.ring.rotate('EdDSA')
+        token = self.ring.sign({'user_name': settings.USER_NAME, 'exp': int(time.time()) + 60})
+
+        response = await self.get_data(token)
+        self.assertEqual(response.status, 401)
+
+        for _ in range(100):
+            if self.jwks_cache.get(self.ring.active_kid) is not None:
+                break
+            await asyncio.sleep(0.01)
+        response = await self.get_data(token)
+        self.assertEqual(response.status, 200)
+
+    async def test_token_signed_by_foreign_key_rejected(self):
+        await self.jwks_cache.refresh()
+        foreign = SigningKeyRing()
+        foreign.rotate('EdDSA')
+
+        response = await self.get_data(foreign.sign({'user_name': settings.USER_NAME}))
+
+        self.assertEqual(response.status, 401)
+
+if __name__ == '__main__':
+    asynctest.main()
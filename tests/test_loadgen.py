@@ -0,0 +1,33 @@
+import asynctest
+from benchmarks.loadgen import parse_mix, percentile
+
+class TestPercentile(asynctest.TestCase):
+
+    def test_nearest_rank(self):
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 0.5), 50)
+        self.assertEqual(percentile(values, 0.99), 99)
+        self.assertEqual(percentile(values, 1.0), 100)
+        self.assertEqual(percentile(values, 0.0), 1)
+
+    def test_small_and_empty_samples(self):
+        self.assertEqual(percentile([7], 0.99), 7)
+        self.assertEqual(percentile([1, 2, 3], 0.5), 2)
+        self.assertIsNone(percentile([], 0.5))
+
+class TestParseMix(asynctest.TestCase):
+
+    def test_weights(self):
+        self.assertEqual(parse_mix('cold=1,warm=8, invalid=0.5'), {'cold': 1.0, 'warm': 8.0, 'invalid': 0.5})
+        self.assertEqual(parse_mix('warm'), {'warm': 1.0})
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            parse_mix('cold=1,teleport=2')
+        with self.assertRaises(ValueError):
+            parse_mix('warm=-1')
+        with self.assertRaises(ValueError):
+            parse_mix('warm=lots')
+
+if __name__ == '__main__':
+    asynctest.main()
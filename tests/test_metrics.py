@@ -0,0 +1,118 @@
+import asynctest
+from aiohttp import web
+from aiohttp.test_utils import TestServer, TestClient as AioHTTPTestClient
+from auth_http.keys import JWKS_CACHE, JWKSCache, SigningKeyRing
+from auth_http.metrics import REGISTRY, Registry, instrument_handler, metrics_handler
+from auth_http.mock_resource_api import get_data
+from settings import settings
+
+class TestRegistry(asynctest.TestCase):
+
+    def setUp(self):
+        self.registry = Registry()
+
+    def test_counter_and_gauge(self):
+        counter = self.registry.counter('requests_total', 'Requests.', ('status',))
+        counter.labels(200).inc()
+        counter.labels('200').inc(2)
+        gauge = self.registry.gauge('in_flight', 'In flight.')
+        gauge.inc()
+        gauge.inc()
+        gauge.dec()
+        self.assertEqual(self.registry.snapshot(), {'requests_total': {'200': 3}, 'in_flight': {'': 1}})
+
+    def test_get_or_create(self):
+        counter = self.registry.counter('requests_total', 'Requests.')
+        self.assertIs(self.registry.counter('requests_total', 'Requests.'), counter)
+        with self.assertRaises(ValueError):
+            self.registry.gauge('requests_total', 'Requests.')
+
+    def test_label_count_checked(self):
+        counter = self.registry.counter('requests_total', 'Requests.', ('status',))
+        with self.assertRaises(ValueError):
+            counter.labels(200, 'extra')
+
+    def test_histogram(self):
+        histogram = self.registry.histogram('latency_seconds', 'Latency.', buckets=(0.1, 1.0))
+        for value in (0.05, 0.1, 0.5, 2.0):
+            histogram.observe(value)
+        snapshot = self.registry.snapshot()['latency_seconds']['']
+        self.assertEqual(snapshot['count'], 4)
+        self.assertAlmostEqual(snapshot['sum'], 2.65)
+        self.assertEqual(snapshot['buckets'], {0.1: 2, 1.0: 1, float('inf'): 1})
+
+    def test_render(self):
+        self.registry.counter('requests_total', 'Requests.', ('status',)).labels(401).inc()
+        self.registry.histogram('latency_seconds', 'Latency.', buckets=(0.1,)).observe(0.5)
+        text = self.registry.render()
+        self.assertIn('# TYPE requests_total counter\n', text)
+        self.assertIn('requests_total{status="401"} 1', text)
+        self.assertIn('latency_seconds_bucket{le="0.1"} 0\n', text)
+        self.assertIn('latency_seconds_bucket{le="+Inf"} 1\n', text)
+        self.assertIn('latency_seconds_count 1\n', text)
+
+    def test_snapshot_prefix(self):
+        self.registry.counter('client_requests_total', 'Requests.')
+        self.registry.counter('server_requests_total', 'Requests.')
+        self.assertEqual(list(self.registry.snapshot(prefix='client_')), ['client_requests_total'])
+
+class TestInstrumentHandler(asynctest.TestCase):
+
+    async def setUp(self):
+        self.registry = Registry()
+
+        @instrument_handler('test_handler', self.registry)
+        async def handler(request):
+            if 'fail' in request.query:
+                raise web.HTTPForbidden()
+            return web.Response(text='ok')
+
+        self.app = web.Application()
+        self.app.router.add_get('/', handler)
+        self.client = AioHTTPTestClient(TestServer(self.app))
+        await self.client.start_server()
+
+    async def tearDown(self):
+        await self.client.close()
+
+    async def test_records_status_and_latency(self):
+        await self.client.get('/')
+        await self.client.get('/', params={'fail': '1'})
+        snapshot = self.registry.snapshot()
+        self.assertEqual(snapshot['test_handler_responses_total'], {'200': 1, '403': 1})
+        self.assertEqual(snapshot['test_handler_duration_seconds']['']['count'], 2)
+        self.assertEqual(snapshot['test_handler_in_flight'], {'': 0})
+
+class TestMetricsEndpoint(asynctest.TestCase):
+
+    async def setUp(self):
+        self.app = web.Application()
+        self.ring = SigningKeyRing()
+        self.ring.rotate('EdDSA')
+        jwks_cache = JWKSCache()
+        jwks_cache.load(self.ring.jwks())
+        self.app[JWKS_CACHE] = jwks_cache
+        self.app.router.add_get('/get_data', get_data)
+        self.app.router.add_get('/metrics', metrics_handler)
+        self.client = AioHTTPTestClient(TestServer(self.app))
+        await self.client.start_server()
+
+    async def tearDown(self):
+        await self.client.close()
+
+    async def test_exposes_resource_api_metrics(self):
+        responses = REGISTRY.counter('resource_api_get_data_responses_total', '', ('status',))
+        before = responses.labels(200).value
+        token = self.ring.sign({'user_name': settings.USER_NAME})
+        await self.client.get('/get_data', headers={'Authorization': 'Bearer ' + token})
+        self.assertEqual(responses.labels(200).value, before + 1)
+
+        response = await self.client.get('/metrics')
+        self.assertEqual(response.status, 200)
+        text = await response.text()
+        self.assertIn('resource_api_get_data_duration_seconds_count', text)
+        self.assertIn('resource_api_jwt_verify_seconds_count', text)
+        self.assertIn('resource_api_verified_token_cache_total{result="miss"}', text)
+
+if __name__ == '__main__':
+    asynctest.main()
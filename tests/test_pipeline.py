@@ -0,0 +1,178 @@
+import asyncio
+import aiohttp
+import asynctest
+from asynctest import CoroutineMock, MagicMock, patch
+from auth_http.client import Client
+from auth_http.exceptions import AuthorizationError, DataFetchError
+from auth_http.pipeline import (STAGE_TYPES, AuthenticateStage, FetchStage, Pipeline, RequestContext, Stage,
+                                build_pipeline, register_stage)
+from auth_http.resilience import CircuitBreaker, ResilienceHandler
+
+class FakeTransport:
+    def __init__(self):
+        self.auth_session = MagicMock()
+        self.resource_session = MagicMock()
+
+class RecordingStage(Stage):
+    def __init__(self, name, requires=(), log=None, action=None):
+        super().__init__(name, requires)
+        self.log = log if log is not None else []
+        self.action = action
+        self.failures = []
+
+    async def run(self, context):
+        self.log.append(self.name)
+        if self.action is not None:
+            await self.action(context)
+
+    def on_failure(self, context, error):
+        self.failures.append(error)
+
+class TestPipeline(asynctest.TestCase):
+
+    def test_levels_follow_requirements(self):
+        pipeline = Pipeline([RecordingStage('fetch', ('auth',)), RecordingStage('auth'),
+                             RecordingStage('prefetch')])
+        self.assertEqual([[stage.name for stage in level] for level in pipeline.levels],
+                         [['auth', 'prefetch'], ['fetch']])
+
+    def test_invalid_requirements(self):
+        with self.assertRaises(ValueError):
+            Pipeline([RecordingStage('fetch', ('auth',))])
+        with self.assertRaises(ValueError):
+            Pipeline([RecordingStage('a', ('b',)), RecordingStage('b', ('a',))])
+        with self.assertRaises(ValueError):
+            Pipeline([RecordingStage('a'), RecordingStage('a')])
+
+    async def test_independent_stages_run_concurrently(self):
+        started = asyncio.Event()
+
+        async def wait_for_sibling(context):
+            await started.wait()
+
+        async def start_sibling(context):
+            started.set()
+
+        async def produce(context):
+            context.data = 'mock_data'
+
+        pipeline = Pipeline([RecordingStage('auth', action=wait_for_sibling),
+                             RecordingStage('prefetch', action=start_sibling),
+                             RecordingStage('fetch', ('auth', 'prefetch'), action=produce)])
+        context = await asyncio.wait_for(pipeline.run(RequestContext('user', 'password')), 1)
+        self.assertEqual(context.data, 'mock_data')
+        self.assertEqual(set(context.timings), {'auth', 'prefetch', 'fetch'})
+
+    async def test_short_circuit(self):
+        async def answer_from_cache(context):
+            context.data = 'cached'
+            context.done = True
+
+        log = []
+        pipeline = Pipeline([RecordingStage('cache', log=log, action=answer_from_cache),
+                             RecordingStage('fetch', ('cache',), log=log)])
+        self.assertEqual(await pipeline.handle_request('user', 'password'), 'cached')
+        self.assertEqual(log, ['cache'])
+
+    async def test_failure_notifies_stages_that_ran(self):
+        async def fail(context):
+            raise DataFetchError("rejected", status=401)
+
+        auth = RecordingStage('auth')
+        skipped = RecordingStage('audit', ('fetch',))
+        pipeline = Pipeline([auth, RecordingStage('fetch', ('auth',), action=fail), skipped])
+        with self.assertRaises(DataFetchError):
+            await pipeline.handle_request('user', 'password')
+        self.assertEqual(len(auth.failures), 1)
+        self.assertEqual(skipped.failures, [])
+
+    async def test_failed_stage_cancels_siblings(self):
+        cancelled = asyncio.Event()
+
+        async def hang(context):
+            try:
+                await asyncio.sleep(5)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        async def fail(context):
+            raise AuthorizationError("denied")
+
+        pipeline = Pipeline([RecordingStage('prefetch', action=hang), RecordingStage('auth', action=fail)])
+        with self.assertRaises(AuthorizationError):
+            await asyncio.wait_for(pipeline.handle_request('user', 'password'), 1)
+        self.assertTrue(cancelled.is_set())
+
+class TestStages(asynctest.TestCase):
+
+    def setUp(self):
+        self.transport = FakeTransport()
+
+    async def test_authenticate_then_fetch(self):
+        auth = AuthenticateStage(self.transport)
+        auth.handler.get_access_token = CoroutineMock(return_value='mock_access_token')
+        fetch = FetchStage(self.transport, resilient=False)
+        fetch.handler.fetch_data = CoroutineMock(return_value='mock_data')
+        client = Client(authorization_handler=Pipeline([auth, fetch]))
+
+        self.assertEqual(await client.process_request('user', 'password'), 'mock_data')
+        fetch.handler.fetch_data.assert_called_once_with('mock_access_token')
+
+    async def test_rejected_token_invalidated(self):
+        auth = AuthenticateStage(self.transport)
+        auth.handler.get_access_token = CoroutineMock(return_value='mock_access_token')
+        auth.handler.invalidate_token = MagicMock()
+        fetch = FetchStage(self.transport, resilient=False)
+        fetch.handler.fetch_data = CoroutineMock(side_effect=DataFetchError("rejected", status=401))
+
+        with self.assertRaises(DataFetchError):
+            await Pipeline([auth, fetch]).handle_request('user', 'password')
+        auth.handler.invalidate_token.assert_called_once_with('user', 'password')
+
+    async def test_open_circuit_reported_as_fetch_error(self):
+        auth = AuthenticateStage(self.transport)
+        auth.handler.get_access_token = CoroutineMock(return_value='mock_access_token')
+        fetch = FetchStage(self.transport, resilient=False)
+        fetch.handler.fetch_data = CoroutineMock(side_effect=aiohttp.ClientConnectionError())
+        fetch.handler = ResilienceHandler(fetch.handler, breaker=CircuitBreaker('test-fetch', failure_threshold=1),
+                                          max_attempts=1, hedge=False)
+        client = Client(authorization_handler=Pipeline([auth, fetch]))
+
+        self.assertEqual(await client.process_request('user', 'password'), 'Data fetching failed')
+        self.assertEqual(fetch.handler.breaker.state, CircuitBreaker.OPEN)
+        # The open breaker rejects the call without reaching the resource API.
+        self.assertEqual(await client.process_request('user', 'password'), 'Circuit breaker of test-fetch is open')
+        self.assertEqual(fetch.handler._successor.fetch_data.call_count, 1)
+
+    async def test_authentication_failure(self):
+        auth = AuthenticateStage(self.transport)
+        auth.handler.get_access_token = CoroutineMock(side_effect=AuthorizationError("denied", status=401))
+        with self.assertRaises(AuthorizationError):
+            await Pipeline([auth]).handle_request('user', 'password')
+
+class TestBuildPipeline(asynctest.TestCase):
+
+    def test_default_stages(self):
+        pipeline = build_pipeline(FakeTransport())
+        self.assertEqual([[stage.name for stage in level] for level in pipeline.levels],
+                         [['authenticate'], ['fetch']])
+
+    @patch.dict(STAGE_TYPES)
+    def test_specs(self):
+        register_stage('audit', lambda transport, **options: RecordingStage(**options))
+        pipeline = build_pipeline(FakeTransport(), [
+            'authenticate',
+            {'stage': 'prefetch', 'name': 'jwks', 'url': 'http://localhost:8080/.well-known/jwks.json'},
+            {'stage': 'fetch', 'requires': ['authenticate', 'jwks'], 'resilient': False},
+            {'stage': 'audit', 'name': 'audit', 'requires': ['fetch']},
+        ])
+        self.assertEqual([[stage.name for stage in level] for level in pipeline.levels],
+                         [['authenticate', 'jwks'], ['fetch'], ['audit']])
+
+    def test_unknown_stage_type(self):
+        with self.assertRaises(ValueError):
+            build_pipeline(FakeTransport(), ['teleport'])
+
+if __name__ == '__main__':
+    asynctest.main()
@@ -0,0 +1,131 @@
+import asyncio
+import asynctest
+import base64
+from aiohttp import web
+from aiohttp.test_utils import TestServer, TestClient as AioHTTPTestClient
+from auth_http.mock_auth_server import authenticate
+from auth_http.rate_limit import RATE_LIMITER, TokenBucketLimiter, setup_rate_limiting
+from settings import settings
+
+@web.middleware
+async def _remote_from_header(request, handler):
+    # The test server only sees 127.0.0.1; let requests pose as other clients.
+    remote = request.headers.get('X-Test-Remote')
+    return await handler(request.clone(remote=remote) if remote else request)
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+class TestTokenBucketLimiter(asynctest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.limiter = TokenBucketLimiter(rate=2, burst=3, idle_timeout=10, clock=self.clock)
+
+    def test_burst_then_refill(self):
+        for _ in range(3):
+            self.assertEqual(self.limiter.acquire('user'), 0)
+        self.assertAlmostEqual(self.limiter.acquire('user'), 0.5)
+        self.clock.now += 0.5
+        self.assertEqual(self.limiter.acquire('user'), 0)
+
+    def test_keys_are_independent(self):
+        for _ in range(3):
+            self.limiter.acquire('noisy')
+        self.assertGreater(self.limiter.acquire('noisy'), 0)
+        self.assertEqual(self.limiter.acquire('quiet'), 0)
+
+    def test_idle_buckets_evicted(self):
+        self.limiter.acquire('a')
+        self.clock.now = 5
+        self.limiter.acquire('b')
+        self.assertEqual(len(self.limiter), 2)
+        self.clock.now = 12
+        self.limiter.acquire('b')
+        self.assertEqual(len(self.limiter), 1)
+
+    def test_disabled(self):
+        limiter = TokenBucketLimiter(rate=0, burst=0, clock=self.clock)
+        self.assertEqual(limiter.acquire('user'), 0)
+        self.assertEqual(len(limiter), 0)
+
+class TestRateLimitMiddleware(asynctest.TestCase):
+
+    async def setUp(self):
+        self.release = asyncio.Event()
+
+        async def slow(request):
+            await self.release.wait()
+            return web.Response(text='ok')
+
+        async def fast(request):
+            return web.Response(text='ok')
+
+        self.config = settings.model_copy(update={
+            'RATE_LIMIT_IP_RATE': 1.0, 'RATE_LIMIT_IP_BURST': 3,
+            'RATE_LIMIT_USER_RATE': 1.0, 'RATE_LIMIT_USER_BURST': 2,
+            'MAX_CONCURRENT_REQUESTS': 1, 'RATE_LIMIT_EXEMPT_PATHS': ['/metrics'],
+        })
+        self.app = web.Application(middlewares=[_remote_from_header])
+        setup_rate_limiting(self.app, self.config)
+        self.app.router.add_get('/slow', slow)
+        self.app.router.add_get('/fast', fast)
+        self.app.router.add_get('/metrics', fast)
+        self.app.router.add_post('/authenticate', authenticate)
+        self.client = AioHTTPTestClient(TestServer(self.app))
+        await self.client.start_server()
+
+    async def tearDown(self):
+        self.release.set()
+        await self.client.close()
+
+    async def test_ip_rate_limited(self):
+        statuses = [(await self.client.get('/fast')).status for _ in range(4)]
+        self.assertEqual(statuses, [200, 200, 200, 429])
+        response = await self.client.get('/fast')
+        self.assertEqual(response.headers['Retry-After'], '1')
+
+    async def test_exempt_path(self):
+        statuses = [(await self.client.get('/metrics')).status for _ in range(5)]
+        self.assertEqual(set(statuses), {200})
+
+    async def test_overload_shed(self):
+        pending = asyncio.ensure_future(self.client.get('/slow'))
+        while self.app[RATE_LIMITER].in_flight == 0:
+            await asyncio.sleep(0.01)
+        response = await self.client.get('/fast')
+        self.assertEqual(response.status, 503)
+        self.assertIn('Retry-After', response.headers)
+        self.release.set()
+        self.assertEqual((await pending).status, 200)
+        self.assertEqual(self.app[RATE_LIMITER].in_flight, 0)
+
+    async def test_user_rate_limited(self):
+        # Let the IP bucket through so only the user's bucket applies.
+        self.app[RATE_LIMITER].ips.rate = 0
+        credentials = base64.b64encode(f"{settings.USER_NAME}:wrong".encode()).decode()
+        headers = {'Authorization': f'Basic {credentials}'}
+        statuses = [(await self.client.post('/authenticate', headers=headers)).status for _ in range(3)]
+        self.assertEqual(statuses, [401, 401, 429])
+
+        other = base64.b64encode(b"someone_else:wrong").decode()
+        response = await self.client.post('/authenticate', headers={'Authorization': f'Basic {other}'})
+        self.assertEqual(response.status, 401)
+
+    async def test_failed_logins_from_elsewhere_do_not_lock_user_out(self):
+        self.app[RATE_LIMITER].ips.rate = 0
+        wrong = base64.b64encode(f"{settings.USER_NAME}:wrong".encode()).decode()
+        headers = {'Authorization': f'Basic {wrong}', 'X-Test-Remote': '203.0.113.7'}
+        statuses = [(await self.client.post('/authenticate', headers=headers)).status for _ in range(3)]
+        self.assertEqual(statuses, [401, 401, 429])
+
+        right = base64.b64encode(f"{settings.USER_NAME}:{settings.PASSWORD}".encode()).decode()
+        response = await self.client.post('/authenticate', headers={'Authorization': f'Basic {right}'})
+        self.assertEqual(response.status, 200)
+
+if __name__ == '__main__':
+    asynctest.main()
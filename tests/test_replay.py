@@ -0,0 +1,26 @@
+import asynctest
+from asynctest import patch
+from auth_http.access_log import AccessLogEntry
+from auth_http.password_hashing import hash_password, make_credential
+from benchmarks.replay import create_credential_store, replay_password
+from settings import settings
+
+class TestReplayCredentials(asynctest.TestCase):
+
+    def test_every_logged_user_can_log_in(self):
+        # A configured user whose password the replay does not know.
+        other = make_credential('configured', 'unknown-password', 'sha256')
+        credentials = dict(settings.AUTH_CREDENTIALS, configured={'salt': other.salt, 'hash': other.hash})
+        entries = [AccessLogEntry(0.0, user, 'POST', settings.AUTHORIZATION_ENDPOINT, 200, 0.01)
+                   for user in (settings.USER_NAME, 'configured', 'logged', None)]
+
+        with patch.object(settings, 'AUTH_CREDENTIALS', credentials):
+            store = create_credential_store(entries, 'sha256')
+
+        for user_name in (settings.USER_NAME, 'configured', 'logged'):
+            credential = store.get(user_name)
+            self.assertEqual(hash_password(replay_password(user_name), credential.salt, credential.kdf),
+                             credential.hash)
+
+if __name__ == '__main__':
+    asynctest.main()
@@ -0,0 +1,213 @@
+import asyncio
+import asynctest
+import aiohttp
+from asynctest import CoroutineMock, MagicMock, patch
+from auth_http.exceptions import AuthorizationError, CircuitOpenError, DataFetchError, TransientError
+from auth_http.resilience import CircuitBreaker, ResilienceHandler, circuit_breaker_states, is_transient
+from settings import settings
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def _chained(error, cause):
+    try:
+        raise error from cause
+    except Exception as chained:
+        return chained
+
+class TestIsTransient(asynctest.TestCase):
+
+    def test_statuses(self):
+        self.assertTrue(is_transient(DataFetchError("unavailable", status=503)))
+        self.assertTrue(is_transient(AuthorizationError("slow down", status=429)))
+        self.assertFalse(is_transient(DataFetchError("rejected", status=401)))
+
+    def test_cause_chain(self):
+        connection_error = aiohttp.ClientConnectionError("reset")
+        error = _chained(AuthorizationError("wrapped"), _chained(DataFetchError("failed"), connection_error))
+        self.assertTrue(is_transient(error))
+
+    def test_permanent(self):
+        self.assertFalse(is_transient(ValueError("bad")))
+        self.assertFalse(is_transient(_chained(AuthorizationError("wrapped"), CircuitOpenError("open"))))
+        self.assertTrue(is_transient(TransientError("retry me")))
+
+class TestCircuitBreaker(asynctest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.breaker = CircuitBreaker('test-breaker', failure_threshold=2, reset_timeout=10, clock=self.clock)
+
+    def fail(self):
+        self.breaker.after_call(self.breaker.before_call(), False)
+
+    def test_opens_after_threshold(self):
+        self.fail()
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+        self.fail()
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+        with self.assertRaises(CircuitOpenError):
+            self.breaker.before_call()
+
+    def test_half_open_trial(self):
+        self.fail()
+        self.fail()
+        self.clock.now = 10
+        trial = self.breaker.before_call()
+        self.assertTrue(trial)
+        self.assertEqual(self.breaker.state, CircuitBreaker.HALF_OPEN)
+        with self.assertRaises(CircuitOpenError):
+            self.breaker.before_call()
+        self.breaker.after_call(trial, True)
+        self.assertEqual(self.breaker.snapshot(), {'state': 'closed', 'failures': 0, 'open_for': None})
+
+    def test_failed_trial_reopens(self):
+        self.fail()
+        self.fail()
+        self.clock.now = 10
+        self.fail()
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+        self.assertEqual(self.breaker.snapshot()['open_for'], 0)
+
+    def test_abandoned_trial_releases_slot(self):
+        self.fail()
+        self.fail()
+        self.clock.now = 10
+        self.breaker.after_call(self.breaker.before_call(), None)
+        self.assertTrue(self.breaker.before_call())
+
+    def test_call_admitted_before_opening_does_not_decide_trial(self):
+        earlier = self.breaker.before_call()
+        self.assertFalse(earlier)
+        self.fail()
+        self.fail()
+        self.clock.now = 10
+        trial = self.breaker.before_call()
+
+        self.breaker.after_call(earlier, True)
+        self.assertEqual(self.breaker.state, CircuitBreaker.HALF_OPEN)
+        with self.assertRaises(CircuitOpenError):
+            self.breaker.before_call()
+        self.breaker.after_call(trial, False)
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+
+class TestResilienceHandler(asynctest.TestCase):
+
+    def setUp(self):
+        self.successor = MagicMock()
+        self.breaker = CircuitBreaker('test-handler', failure_threshold=5)
+        patcher = patch.object(settings, 'RESILIENCE_BACKOFF_BASE', 0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def test_retries_transient_failures(self):
+        self.successor.handle_request = CoroutineMock(side_effect=[
+            DataFetchError("unavailable", status=503), DataFetchError("unavailable", status=502), "mock_data"])
+        handler = ResilienceHandler(self.successor, breaker=self.breaker, hedge=False)
+        self.assertEqual(await handler.handle_request(access_token="token"), "mock_data")
+        self.assertEqual(self.successor.handle_request.call_count, 3)
+        self.successor.handle_request.assert_called_with(access_token="token")
+        self.assertEqual(self.breaker.failures, 0)
+
+    async def test_gives_up_after_max_attempts(self):
+        self.successor.handle_request = CoroutineMock(side_effect=DataFetchError("unavailable", status=503))
+        handler = ResilienceHandler(self.successor, breaker=self.breaker, max_attempts=2, hedge=False)
+        with self.assertRaises(DataFetchError):
+            await handler.handle_request(access_token="token")
+        self.assertEqual(self.successor.handle_request.call_count, 2)
+        self.assertEqual(self.breaker.failures, 2)
+
+    async def test_permanent_failure_not_retried(self):
+        self.successor.handle_request = CoroutineMock(side_effect=DataFetchError("rejected", status=401))
+        handler = ResilienceHandler(self.successor, breaker=self.breaker, hedge=False)
+        with self.assertRaises(DataFetchError):
+            await handler.handle_request(access_token="token")
+        self.assertEqual(self.successor.handle_request.call_count, 1)
+        self.assertEqual(self.breaker.failures, 0)
+
+    async def test_non_idempotent_not_retried(self):
+        self.successor.handle_request = CoroutineMock(side_effect=DataFetchError("unavailable", status=503))
+        handler = ResilienceHandler(self.successor, breaker=self.breaker, idempotent=False)
+        with self.assertRaises(DataFetchError):
+            await handler.handle_request(access_token="token")
+        self.assertEqual(self.successor.handle_request.call_count, 1)
+
+    async def test_open_breaker_fails_fast(self):
+        self.successor.handle_request = CoroutineMock(side_effect=DataFetchError("unavailable", status=503))
+        breaker = CircuitBreaker('test-fail-fast', failure_threshold=2)
+        handler = ResilienceHandler(self.successor, endpoint='test-fail-fast', breaker=breaker, max_attempts=5,
+                                    hedge=False)
+        with self.assertRaises(CircuitOpenError):
+            await handler.handle_request(access_token="token")
+        self.assertEqual(self.successor.handle_request.call_count, 2)
+
+    async def test_concurrent_call_finishing_during_trial(self):
+        clock = FakeClock()
+        breaker = CircuitBreaker('test-concurrent', failure_threshold=1, reset_timeout=10, clock=clock)
+        release_slow = asyncio.Event()
+        release_trial = asyncio.Event()
+        outcomes = iter(['slow', 'fail', 'trial'])
+
+        async def handle_request(**kwargs):
+            outcome = next(outcomes)
+            if outcome == 'slow':
+                await release_slow.wait()
+                return outcome
+            if outcome == 'fail':
+                raise DataFetchError("unavailable", status=503)
+            await release_trial.wait()
+            return outcome
+
+        self.successor.handle_request = handle_request
+        handler = ResilienceHandler(self.successor, endpoint='test-concurrent', breaker=breaker, max_attempts=1,
+                                    hedge=False)
+        slow = asyncio.ensure_future(handler.handle_request(access_token="token"))
+        await asyncio.sleep(0)
+        with self.assertRaises(DataFetchError):
+            await handler.handle_request(access_token="token")
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        clock.now = 10
+        trial = asyncio.ensure_future(handler.handle_request(access_token="token"))
+        await asyncio.sleep(0)
+
+        release_slow.set()
+        self.assertEqual(await slow, 'slow')
+        self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+        with self.assertRaises(CircuitOpenError):
+            await handler.handle_request(access_token="token")
+
+        release_trial.set()
+        self.assertEqual(await trial, 'trial')
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+    async def test_hedges_slow_call(self):
+        calls = []
+
+        async def handle_request(**kwargs):
+            calls.append(kwargs)
+            if len(calls) == 1:
+                await asyncio.sleep(5)
+                return "slow"
+            return "fast"
+
+        self.successor.handle_request = handle_request
+        handler = ResilienceHandler(self.successor, breaker=self.breaker)
+        for _ in range(settings.RESILIENCE_HEDGE_MIN_SAMPLES):
+            handler._observe(0.01)
+        self.assertEqual(handler.hedge_delay, 0.01)
+
+        self.assertEqual(await asyncio.wait_for(handler.handle_request(access_token="token"), 1), "fast")
+        self.assertEqual(len(calls), 2)
+
+    async def test_default_breaker_shared_per_endpoint(self):
+        first = ResilienceHandler(self.successor, endpoint='shared-endpoint')
+        second = ResilienceHandler(self.successor, endpoint='shared-endpoint')
+        self.assertIs(first.breaker, second.breaker)
+        self.assertEqual(circuit_breaker_states()['shared-endpoint']['state'], 'closed')
+
+if __name__ == '__main__':
+    asynctest.main()
@@ -3,13 +3,25 @@ import jwt
 import time
 from aiohttp import web
 from aiohttp.test_utils import TestServer, TestClient as AioHTTPTestClient
-from auth_http.mock_resource_api import get_data
+from asynctest import patch
+from auth_http import mock_resource_api
+from auth_http.config import CONFIG
+from auth_http.keys import JWKS_CACHE, JWKSCache, SigningKeyRing
+from auth_http.mock_resource_api import create_app, get_data
+from auth_http.rate_limit import RATE_LIMITER
+from auth_http.resources import DATASET
+from auth_http.revocation import REVOCATION_LIST
 from settings import settings
 
 class TestResourceAPI(asynctest.TestCase):
 
     async def setUp(self):
+        self.ring = SigningKeyRing()
+        self.ring.rotate('EdDSA')
+        jwks_cache = JWKSCache()
+        jwks_cache.load(self.ring.jwks())
         self.app = web.Application()
+        self.app[JWKS_CACHE] = jwks_cache
         self.app.router.add_get('/get_data', get_data)
         self.server = TestServer(self.app)
         self.client = AioHTTPTestClient(self.server)
@@ -19,7 +31,7 @@ class TestResourceAPI(asynctest.TestCase):
         await self.client.close()
 
     async def test_valid_token(self):
-        auth_header = 'Bearer ' + jwt.encode({'user_name': settings.USER_NAME}, settings.JWT_SECRET_KEY, algorithm='HS256')
+        auth_header = 'Bearer ' + self.ring.sign({'user_name': settings.USER_NAME})
         response = await self.client.get('/get_data', headers={'Authorization': auth_header})
         self.assertEqual(response.status, 200)
         self.assertEqual(await response.json(), {'data': 'mock_data'})
@@ -29,13 +41,13 @@ class TestResourceAPI(asynctest.TestCase):
         self.assertEqual(response.status, 401)
 
     async def test_invalid_auth_type(self):
-        auth_header = 'InvalidType ' + jwt.encode({'user_name': settings.USER_NAME}, settings.JWT_SECRET_KEY, algorithm='HS256')
+        auth_header = 'InvalidType ' + self.ring.sign({'user_name': settings.USER_NAME})
         response = await self.client.get('/get_data', headers={'Authorization': auth_header})
         self.assertEqual(response.status, 401)
 
     async def test_expired_token(self):
         token_payload = {'user_name': settings.USER_NAME, 'exp': int(time.time()) - 3600}  # One hour ago
-        expired_token = jwt.encode(token_payload, settings.JWT_SECRET_KEY, algorithm='HS256')
+        expired_token = self.ring.sign(token_payload)
         auth_header = 'Bearer ' + expired_token
         response = await self.client.get('/get_data', headers={'Authorization': auth_header})
         self.assertEqual(response.status, 401)
@@ -45,10 +57,44 @@ class TestResourceAPI(asynctest.TestCase):
         response = await self.client.get('/get_data', headers={'Authorization': auth_header})
         self.assertEqual(response.status, 401)
 
+    async def test_refresh_token_rejected(self):
+        token = self.ring.sign({'user_name': settings.USER_NAME, 'typ': 'refresh'})
+        response = await self.client.get('/get_data', headers={'Authorization': 'Bearer ' + token})
+        self.assertEqual(response.status, 401)
+
     async def test_unknown_user(self):
-        auth_header = 'Bearer ' + jwt.encode({'user_name': 'unknown_user'}, settings.JWT_SECRET_KEY, algorithm='HS256')
+        auth_header = 'Bearer ' + self.ring.sign({'user_name': 'unknown_user'})
         response = await self.client.get('/get_data', headers={'Authorization': auth_header})
         self.assertEqual(response.status, 401)
 
+    async def test_shared_secret_token_rejected_by_default(self):
+        token = jwt.encode({'user_name': settings.USER_NAME}, 'guessed-secret-of-thirty-two-byte', algorithm='HS256')
+        response = await self.client.get('/get_data', headers={'Authorization': 'Bearer ' + token})
+        self.assertEqual(response.status, 401)
+
+    async def test_shared_secret_token_accepted_when_configured(self):
+        with patch.object(settings, 'JWT_SECRET_KEY', 'configured-secret-thirty-two-byte'):
+            token = jwt.encode({'user_name': settings.USER_NAME}, 'configured-secret-thirty-two-byte', algorithm='HS256')
+            response = await self.client.get('/get_data', headers={'Authorization': 'Bearer ' + token})
+        self.assertEqual(response.status, 200)
+
+class TestCreateApp(asynctest.TestCase):
+
+    def test_app_follows_config(self):
+        config = settings.model_copy(update={'AUTHORIZATION_PORT': 9999, 'RATE_LIMIT_ENABLED': False,
+                                             'RESOURCE_RECORD_COUNT': 7})
+        app = create_app(config)
+        self.assertIs(app[CONFIG], config)
+        self.assertEqual(app[DATASET].size, 7)
+        self.assertEqual(app[JWKS_CACHE].url, f"http://{settings.AUTHORIZATION_HOST}:9999{settings.JWKS_ENDPOINT}")
+        self.assertEqual(app[REVOCATION_LIST].url,
+                         f"http://{settings.AUTHORIZATION_HOST}:9999{settings.REVOCATIONS_ENDPOINT}")
+        self.assertNotIn(RATE_LIMITER, app)
+
+    def test_module_app_built_on_first_use(self):
+        self.assertIs(mock_resource_api.app, mock_resource_api.app)
+        with self.assertRaises(AttributeError):
+            mock_resource_api.missing
+
 if __name__ == '__main__':
     asynctest.main()
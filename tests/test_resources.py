@@ -0,0 +1,149 @@
+import asynctest
+from asynctest import patch
+from aiohttp import web
+from aiohttp.test_utils import TestServer, TestClient as AioHTTPTestClient
+from auth_http.exceptions import DataFetchError
+from auth_http.handlers import DataFetchingHandler
+from auth_http.keys import JWKS_CACHE, JWKSCache, SigningKeyRing
+from auth_http.mock_resource_api import get_data
+from auth_http.resources import DATASET, NDJSON_CONTENT_TYPE, Dataset, decode_cursor, encode_cursor
+from settings import settings
+
+class TestDataset(asynctest.TestCase):
+
+    def test_records(self):
+        dataset = Dataset(3)
+        self.assertEqual(len(dataset), 3)
+        self.assertEqual(list(dataset.records()), [{'id': i, 'data': 'mock_data'} for i in range(3)])
+
+    def test_records_range(self):
+        dataset = Dataset(5, make_record=lambda index: index)
+        self.assertEqual(list(dataset.records(2)), [2, 3, 4])
+        self.assertEqual(list(dataset.records(3, 10)), [3, 4])
+
+    def test_page(self):
+        dataset = Dataset(5, make_record=lambda index: index)
+        records, cursor = dataset.page(0, 3)
+        self.assertEqual(records, [0, 1, 2])
+        self.assertEqual(decode_cursor(cursor), 3)
+        self.assertEqual(dataset.page(3, 3), ([3, 4], None))
+
+    def test_cursor_round_trip(self):
+        self.assertEqual(decode_cursor(encode_cursor(12345)), 12345)
+        for cursor in ('', '!!', encode_cursor(-1)):
+            with self.assertRaises(ValueError):
+                decode_cursor(cursor)
+
+    def test_etag_changes_with_version(self):
+        dataset = Dataset(3)
+        etag = dataset.etag('data')
+        self.assertEqual(dataset.etag('data'), etag)
+        self.assertNotEqual(dataset.etag('ndjson'), etag)
+        dataset.update(make_record=lambda index: {'id': index, 'data': 'changed'})
+        self.assertEqual(dataset.version, 2)
+        self.assertNotEqual(dataset.etag('data'), etag)
+
+class TestStreaming(asynctest.TestCase):
+
+    async def setUp(self):
+        self.app = web.Application()
+        self.app[DATASET] = Dataset(500)
+        self.ring = SigningKeyRing()
+        self.ring.rotate('EdDSA')
+        jwks_cache = JWKSCache()
+        jwks_cache.load(self.ring.jwks())
+        self.app[JWKS_CACHE] = jwks_cache
+        self.app.router.add_get('/get_data', get_data)
+        self.client = AioHTTPTestClient(TestServer(self.app))
+        await self.client.start_server()
+        self.token = self.ring.sign({'user_name': settings.USER_NAME})
+
+    async def tearDown(self):
+        await self.client.close()
+
+    async def test_default_response_unchanged(self):
+        response = await self.client.get('/get_data', headers={'Authorization': 'Bearer ' + self.token})
+        self.assertEqual(await response.json(), {'data': 'mock_data'})
+
+    async def test_ndjson_stream(self):
+        with patch.object(settings, 'STREAM_CHUNK_SIZE', 256):
+            response = await self.client.get('/get_data', headers={
+                'Authorization': 'Bearer ' + self.token, 'Accept': NDJSON_CONTENT_TYPE})
+            self.assertEqual(response.status, 200)
+            self.assertEqual(response.content_type, NDJSON_CONTENT_TYPE)
+            lines = (await response.text()).splitlines()
+        self.assertEqual(len(lines), 500)
+        self.assertEqual(lines[0], '{"id":0,"data":"mock_data"}')
+
+    async def test_handler_streams_records(self):
+        handler = DataFetchingHandler(self.client.session, url=self.client.make_url('/get_data'))
+        ids = [record['id'] async for record in handler.stream_records(self.token)]
+        self.assertEqual(ids, list(range(500)))
+
+    async def test_handler_stream_rejected(self):
+        handler = DataFetchingHandler(self.client.session, url=self.client.make_url('/get_data'))
+        with self.assertRaises(DataFetchError) as raised:
+            async for _ in handler.stream_records('invalid_token'):
+                pass
+        self.assertEqual(raised.exception.status, 401)
+
+class TestConditionalRequests(asynctest.TestCase):
+
+    async def setUp(self):
+        self.dataset = Dataset(25)
+        self.app = web.Application()
+        self.app[DATASET] = self.dataset
+        self.ring = SigningKeyRing()
+        self.ring.rotate('EdDSA')
+        jwks_cache = JWKSCache()
+        jwks_cache.load(self.ring.jwks())
+        self.app[JWKS_CACHE] = jwks_cache
+        self.app.router.add_get('/get_data', get_data)
+        self.client = AioHTTPTestClient(TestServer(self.app))
+        await self.client.start_server()
+        self.token = self.ring.sign({'user_name': settings.USER_NAME})
+        self.headers = {'Authorization': 'Bearer ' + self.token}
+
+    async def tearDown(self):
+        await self.client.close()
+
+    async def test_not_modified(self):
+        response = await self.client.get('/get_data', headers=self.headers)
+        etag = response.headers['ETag']
+        response = await self.client.get('/get_data', headers=dict(self.headers, **{'If-None-Match': etag}))
+        self.assertEqual(response.status, 304)
+        self.assertEqual(response.headers['ETag'], etag)
+
+        self.dataset.update(size=30)
+        response = await self.client.get('/get_data', headers=dict(self.headers, **{'If-None-Match': etag}))
+        self.assertEqual(response.status, 200)
+        self.assertNotEqual(response.headers['ETag'], etag)
+
+    async def test_pagination(self):
+        response = await self.client.get('/get_data', params={'limit': 10}, headers=self.headers)
+        body = await response.json()
+        self.assertEqual([record['id'] for record in body['data']], list(range(10)))
+        response = await self.client.get('/get_data', params={'limit': 10, 'cursor': body['next_cursor']},
+                                         headers=self.headers)
+        self.assertEqual((await response.json())['data'][0]['id'], 10)
+
+    async def test_invalid_page(self):
+        for params in ({'limit': 0}, {'limit': 'ten'}, {'cursor': '!!'}):
+            response = await self.client.get('/get_data', params=params, headers=self.headers)
+            self.assertEqual(response.status, 400)
+
+    async def test_handler_iterates_pages(self):
+        handler = DataFetchingHandler(self.client.session, url=self.client.make_url('/get_data'))
+        pages = [[record['id'] for record in page] async for page in handler.iter_pages(self.token, limit=10)]
+        self.assertEqual(pages, [list(range(10)), list(range(10, 20)), list(range(20, 25))])
+
+    async def test_handler_revalidates_cached_response(self):
+        handler = DataFetchingHandler(self.client.session, url=self.client.make_url('/get_data'))
+        with patch.object(self.client.session, 'get', wraps=self.client.session.get) as get:
+            self.assertEqual(await handler.fetch_data(self.token), 'mock_data')
+            self.assertEqual(await handler.fetch_data(self.token), 'mock_data')
+        self.assertNotIn('If-None-Match', get.call_args_list[0][1]['headers'])
+        self.assertIn('If-None-Match', get.call_args_list[1][1]['headers'])
+
+if __name__ == '__main__':
+    asynctest.main()
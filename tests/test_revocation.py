@@ -0,0 +1,216 @@
+import asyncio
+import asynctest
+import base64
+import os
+import tempfile
+from aiohttp import web
+from aiohttp.test_utils import TestServer, TestClient as AioHTTPTestClient
+from auth_http.keys import JWKS_CACHE, SIGNING_KEYS, JWKSCache, SigningKeyRing
+from auth_http.mock_auth_server import authenticate, jwks, refresh, revocations, revoke
+from auth_http.mock_resource_api import get_data
+from auth_http.revocation import REVOCATION_LIST, REVOCATION_LOG, RevocationList, RevocationLog, SQLiteRevocationLog
+from settings import settings
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+class RevocationLogTests:
+    """Behaviour shared by every revocation log implementation."""
+
+    def test_incremental_changes(self):
+        self.assertEqual(self.log.revoke('a', 2000), 1)
+        self.assertEqual(self.log.revoke('a', 2000), 1)
+        self.assertEqual(self.log.revoke('b', 2000), 2)
+        self.assertTrue(self.log.is_revoked('a'))
+
+        changes = self.log.changes(1, self.log.epoch)
+        self.assertEqual(changes['revoked'], [['b', 2000]])
+        self.assertEqual((changes['version'], changes['latest'], changes['reset']), (2, 2, False))
+
+    def test_paging(self):
+        for index in range(5):
+            self.log.revoke(str(index), 2000)
+        changes = self.log.changes(0, self.log.epoch, limit=2)
+        self.assertEqual((changes['version'], changes['latest']), (2, 5))
+        changes = self.log.changes(changes['version'], self.log.epoch, limit=2)
+        self.assertEqual(changes['revoked'], [['2', 2000], ['3', 2000]])
+
+    def test_reset_for_other_epoch(self):
+        self.log.revoke('a', 2000)
+        changes = self.log.changes(7, 'another-epoch')
+        self.assertTrue(changes['reset'])
+        self.assertEqual(changes['revoked'], [['a', 2000]])
+
+    def test_expired_revocations_forgotten(self):
+        self.log.revoke('old', 1010)
+        self.log.revoke('new', 5000)
+        self.assertEqual(self.log.revoke('dead', 900), 2)
+        self.clock.now = 1200
+        changes = self.log.changes(0, self.log.epoch)
+        self.assertEqual(changes['revoked'], [['new', 5000]])
+        self.assertEqual(changes['version'], 2)
+        self.assertFalse(self.log.is_revoked('old'))
+
+class TestRevocationLog(RevocationLogTests, asynctest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.log = RevocationLog(clock=self.clock)
+
+    def test_expired_entries_removed_behind_longer_lived_ones(self):
+        self.log.revoke('refresh', 1000 + settings.REFRESH_TOKEN_TTL)
+        for index in range(1000):
+            self.log.revoke(f'access-{index}', 1000 + settings.ACCESS_TOKEN_TTL)
+        self.log.revoke('late', 5000)
+        self.assertEqual(self.log.version, 1002)
+
+        self.clock.now = 2000
+        changes = self.log.changes(0, 'another-epoch')
+        self.assertEqual(changes['revoked'], [['refresh', 1000 + settings.REFRESH_TOKEN_TTL], ['late', 5000]])
+        self.assertEqual((changes['version'], changes['latest']), (1002, 1002))
+        self.assertEqual(len(self.log._entries), 2)
+        self.assertFalse(self.log.is_revoked('access-0'))
+
+        changes = self.log.changes(1, self.log.epoch, limit=1)
+        self.assertEqual((changes['revoked'], changes['version']), ([['late', 5000]], 1002))
+        self.log.revoke('next', 5000)
+        changes = self.log.changes(1002, self.log.epoch)
+        self.assertEqual((changes['revoked'], changes['version']), ([['next', 5000]], 1003))
+
+class TestSQLiteRevocationLog(RevocationLogTests, asynctest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.path = os.path.join(self.directory.name, 'revocations.db')
+        self.clock = FakeClock()
+        self.log = SQLiteRevocationLog(self.path, clock=self.clock)
+        self.addCleanup(self.log.close)
+
+    def test_processes_share_the_log(self):
+        other = SQLiteRevocationLog(self.path, clock=self.clock)
+        self.addCleanup(other.close)
+        self.assertEqual(other.epoch, self.log.epoch)
+
+        self.log.revoke('a', 2000)
+        self.assertEqual(other.revoke('b', 2000), 2)
+        self.assertTrue(other.is_revoked('a'))
+        changes = self.log.changes(0, other.epoch)
+        self.assertEqual((changes['revoked'], changes['version'], changes['reset']),
+                         ([['a', 2000], ['b', 2000]], 2, False))
+
+    def test_versions_not_reused_after_pruning(self):
+        self.log.revoke('a', 1010)
+        self.clock.now = 1200
+        self.log.prune()
+        self.assertEqual(self.log.revoke('b', 2000), 2)
+        self.assertEqual(self.log.changes(0, self.log.epoch)['revoked'], [['b', 2000]])
+
+class TestRevocationList(asynctest.TestCase):
+
+    def test_apply(self):
+        clock = FakeClock()
+        log = RevocationLog(clock=clock)
+        revocation_list = RevocationList(url='http://auth.test/revocations', clock=clock)
+        log.revoke('a', 2000)
+        self.assertFalse(revocation_list.apply(log.changes(revocation_list.version, revocation_list.epoch)))
+        log.revoke('b', 2000)
+        revocation_list.apply(log.changes(revocation_list.version, revocation_list.epoch))
+        self.assertTrue(revocation_list.is_revoked('a'))
+        self.assertTrue(revocation_list.is_revoked('b'))
+        self.assertFalse(revocation_list.is_revoked(None))
+
+        restarted = RevocationLog(clock=clock)
+        restarted.revoke('c', 2000)
+        revocation_list.apply(restarted.changes(revocation_list.version, revocation_list.epoch))
+        self.assertEqual(revocation_list.ids, {'c'})
+
+    async def test_malformed_changes_do_not_stop_syncing(self):
+        revocation_list = RevocationList(url='http://auth.test/revocations', interval=0)
+        calls = []
+        synced = asyncio.Event()
+
+        async def sync():
+            calls.append(1)
+            if len(calls) == 1:
+                revocation_list.apply({'epoch': 'e', 'version': 1, 'latest': 1, 'reset': False, 'revoked': None})
+            synced.set()
+
+        revocation_list.sync = sync
+        revocation_list.start()
+        await asyncio.wait_for(synced.wait(), 1)
+        await revocation_list.stop()
+        self.assertGreaterEqual(len(calls), 2)
+
+class TestRevocationFlow(asynctest.TestCase):
+
+    async def setUp(self):
+        ring = SigningKeyRing()
+        ring.rotate('EdDSA')
+        self.auth_app = web.Application()
+        self.auth_app[SIGNING_KEYS] = ring
+        self.auth_app[REVOCATION_LOG] = RevocationLog()
+        self.auth_app.router.add_post('/authenticate', authenticate)
+        self.auth_app.router.add_post('/refresh', refresh)
+        self.auth_app.router.add_get('/.well-known/jwks.json', jwks)
+        self.auth_app.router.add_post('/revoke', revoke)
+        self.auth_app.router.add_get('/revocations', revocations)
+        self.auth_client = AioHTTPTestClient(TestServer(self.auth_app))
+        await self.auth_client.start_server()
+
+        self.jwks_cache = JWKSCache(url=str(self.auth_client.make_url('/.well-known/jwks.json')))
+        await self.jwks_cache.refresh()
+        self.revocation_list = RevocationList(url=str(self.auth_client.make_url('/revocations')))
+        self.resource_app = web.Application()
+        self.resource_app[JWKS_CACHE] = self.jwks_cache
+        self.resource_app[REVOCATION_LIST] = self.revocation_list
+        self.resource_app.router.add_get('/get_data', get_data)
+        self.resource_client = AioHTTPTestClient(TestServer(self.resource_app))
+        await self.resource_client.start_server()
+
+        credentials = base64.b64encode(f"{settings.USER_NAME}:{settings.PASSWORD}".encode()).decode()
+        response = await self.auth_client.post('/authenticate', headers={'Authorization': f'Basic {credentials}'})
+        self.tokens = await response.json()
+
+    async def tearDown(self):
+        await self.resource_client.close()
+        await self.auth_client.close()
+
+    async def get_data(self):
+        return await self.resource_client.get(
+            '/get_data', headers={'Authorization': 'Bearer ' + self.tokens['access_token']})
+
+    async def test_revoked_access_token_rejected_after_sync(self):
+        # The first request also puts the token in the verified-token cache.
+        self.assertEqual((await self.get_data()).status, 200)
+
+        response = await self.auth_client.post('/revoke', data={'token': self.tokens['access_token']})
+        self.assertEqual(response.status, 200)
+        self.assertEqual((await self.get_data()).status, 200)
+
+        await self.revocation_list.sync()
+        response = await self.get_data()
+        self.assertEqual(response.status, 401)
+        self.assertEqual(await response.text(), 'Token has been revoked')
+
+    async def test_revoked_refresh_token_rejected(self):
+        headers = {'Authorization': 'Bearer ' + self.tokens['refresh_token']}
+        self.assertEqual((await self.auth_client.post('/refresh', headers=headers)).status, 200)
+        await self.auth_client.post('/revoke', data={'token': self.tokens['refresh_token']})
+        self.assertEqual((await self.auth_client.post('/refresh', headers=headers)).status, 401)
+
+    async def test_revoke_requires_token(self):
+        self.assertEqual((await self.auth_client.post('/revoke', data={})).status, 400)
+        self.assertEqual((await self.auth_client.post('/revoke', data={'token': 'garbage'})).status, 200)
+        self.assertEqual(self.auth_app[REVOCATION_LOG].version, 0)
+
+    async def test_invalid_sync_parameters(self):
+        response = await self.auth_client.get('/revocations', params={'since': '-1'})
+        self.assertEqual(response.status, 400)
+
+if __name__ == '__main__':
+    asynctest.main()
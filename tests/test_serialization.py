@@ -0,0 +1,65 @@
+import asynctest
+from auth_http import serialization
+from auth_http.serialization import DataResponse, ResourcePage, get_serializer
+
+def _available_serializers():
+    for name in serialization.BACKENDS:
+        try:
+            yield get_serializer(name)
+        except ImportError:
+            continue
+
+class TestSerializer(asynctest.TestCase):
+
+    def test_round_trip(self):
+        document = {'data': [{'id': 1, 'data': 'mock_data'}], 'next_cursor': None, 'text': 'é'}
+        for serializer in _available_serializers():
+            with self.subTest(backend=serializer.name):
+                encoded = serializer.dumps(document)
+                self.assertIsInstance(encoded, bytes)
+                self.assertNotIn(b' ', encoded)
+                self.assertEqual(serializer.loads(encoded), document)
+                self.assertEqual(serializer.loads(encoded.decode('utf8')), document)
+
+    def test_invalid_json(self):
+        for serializer in _available_serializers():
+            with self.subTest(backend=serializer.name):
+                with self.assertRaises(ValueError):
+                    serializer.loads(b'{not json')
+
+    def test_auto_prefers_installed_backend(self):
+        self.assertEqual(get_serializer('auto').name, next(_available_serializers()).name)
+
+    def test_unknown_backend(self):
+        with self.assertRaises(ValueError):
+            get_serializer('yaml')
+
+    def test_json_response(self):
+        response = serialization.json_response({'data': 'mock_data'}, status=201, headers={'ETag': '"x"'})
+        self.assertEqual(response.status, 201)
+        self.assertEqual(response.content_type, 'application/json')
+        self.assertEqual(response.headers['ETag'], '"x"')
+        self.assertEqual(serialization.loads(response.body), {'data': 'mock_data'})
+
+class TestStruct(asynctest.TestCase):
+
+    def test_decode_into_struct(self):
+        page = serialization.loads(b'{"data":[{"id":0}],"extra":1}', ResourcePage)
+        self.assertEqual(page.data, [{'id': 0}])
+        self.assertIsNone(page.next_cursor)
+        self.assertFalse(hasattr(page, '__dict__'))
+        self.assertEqual(serialization.loads(b'{"data":"mock_data"}', DataResponse).data, 'mock_data')
+
+    def test_missing_required_field(self):
+        with self.assertRaises(ValueError):
+            serialization.loads(b'{"next_cursor":"Mg"}', ResourcePage)
+        with self.assertRaises(ValueError):
+            serialization.loads(b'[]', DataResponse)
+
+    def test_equality_and_dict(self):
+        page = ResourcePage(data=[1, 2], next_cursor='Mg')
+        self.assertEqual(page, ResourcePage.from_dict({'data': [1, 2], 'next_cursor': 'Mg'}))
+        self.assertEqual(page.to_dict(), {'data': [1, 2], 'next_cursor': 'Mg'})
+
+if __name__ == '__main__':
+    asynctest.main()
@@ -0,0 +1,200 @@
+import asyncio
+import base64
+import json
+import os
+import signal
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import asynctest
+from concurrent.futures import ProcessPoolExecutor
+from aiohttp import ClientSession, web
+from asynctest import patch
+from auth_http.server import Supervisor, bind_socket, serve
+from settings import settings
+
+def _run_process_pool(name, sock, config, options=None):
+    with ProcessPoolExecutor(max_workers=1) as executor:
+        executor.submit(pow, 2, 3).result()
+
+def _wait_for(condition, timeout=30):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("Timed out")
+        time.sleep(0.05)
+
+def _supervise(supervisor, scenario):
+    """
+    Run a supervisor in this thread and a scenario against it in another, then send SIGTERM.
+
+    The scenario starts once every worker was started.
+    """
+    handlers = {signum: signal.getsignal(signum) for signum in (signal.SIGTERM, signal.SIGINT)}
+    errors = []
+
+    def drive():
+        try:
+            _wait_for(lambda: len(supervisor._processes) == len(supervisor._slots))
+        except AssertionError as e:
+            errors.append(e)
+            supervisor.stop()
+            return
+        try:
+            scenario()
+        except BaseException as e:
+            errors.append(e)
+        finally:
+            os.kill(os.getpid(), signal.SIGTERM)
+
+    thread = threading.Thread(target=drive)
+    thread.start()
+    try:
+        supervisor.run()
+    finally:
+        thread.join()
+        for signum, handler in handlers.items():
+            signal.signal(signum, handler)
+    if errors:
+        raise errors[0]
+
+class TestServe(asynctest.TestCase):
+
+    async def test_serves_until_stopped_and_drains(self):
+        started = asyncio.Event()
+
+        async def slow(request):
+            started.set()
+            await asyncio.sleep(0.1)
+            return web.Response(text="done")
+
+        app = web.Application()
+        app.router.add_get('/slow', slow)
+        sock = bind_socket('127.0.0.1', 0, backlog=16)
+        port = sock.getsockname()[1]
+        stop = asyncio.Event()
+        server = asyncio.ensure_future(serve(app, sock, stop))
+
+        async with ClientSession() as session:
+            request = asyncio.ensure_future(session.get(f'http://127.0.0.1:{port}/slow'))
+            await started.wait()
+            stop.set()
+            response = await request
+            self.assertEqual(await response.text(), "done")
+
+        await server
+
+    def test_reuse_port_allows_several_listeners(self):
+        first = bind_socket('127.0.0.1', 0, backlog=16, reuse_port=True)
+        second = bind_socket('127.0.0.1', first.getsockname()[1], backlog=16, reuse_port=True)
+
+        self.assertEqual(first.getsockname(), second.getsockname())
+        first.close()
+        second.close()
+
+class TestSupervisor(asynctest.TestCase):
+
+    def test_workers_may_start_child_processes(self):
+        supervisor = Supervisor(['auth'], config=settings, workers=1)
+        with patch('auth_http.server._worker_main', _run_process_pool):
+            supervisor._start(('auth', 0))
+        process = supervisor._processes[('auth', 0)]
+        process.join(30)
+        supervisor._shutdown()
+
+        self.assertFalse(process.daemon)
+        self.assertEqual(process.exitcode, 0)
+
+    def _multi_worker_supervisor(self, **overrides):
+        config = settings.model_copy(update={
+            'AUTHORIZATION_HOST': '127.0.0.1', 'AUTHORIZATION_PORT': 0, 'AUTH_WORKERS': 4,
+            'SERVER_REUSE_PORT': False, 'RATE_LIMIT_ENABLED': False, 'SERVER_SHUTDOWN_TIMEOUT': 1.0,
+            **overrides})
+        return Supervisor(['auth'], config=config)
+
+    def test_restarts_killed_worker_and_stops_all_on_sigterm(self):
+        supervisor = self._multi_worker_supervisor(
+            AUTH_WORKERS=2, SERVER_HEALTH_CHECK_INTERVAL=0.05, SERVER_RESTART_DELAY=0.05)
+        slot = ('auth', 0)
+        started = []
+        killed = []
+
+        def scenario():
+            started.extend(supervisor._processes.values())
+            victim = supervisor._processes[slot]
+            killed.append(victim)
+            os.kill(victim.pid, signal.SIGKILL)
+            _wait_for(lambda: supervisor._processes[slot] is not victim and supervisor._processes[slot].is_alive())
+            base = f"http://127.0.0.1:{supervisor._sockets['auth'].getsockname()[1]}"
+            with urllib.request.urlopen(base + settings.JWKS_ENDPOINT, timeout=30) as response:
+                self.assertEqual(response.status, 200)
+
+        _supervise(supervisor, scenario)
+
+        self.assertEqual(killed[0].exitcode, -signal.SIGKILL)
+        self.assertNotIn(killed[0], supervisor._processes.values())
+        for process in started + list(supervisor._processes.values()):
+            self.assertIsNotNone(process.exitcode, process.name)
+
+    def _login(self, base):
+        credentials = base64.b64encode(f"{settings.USER_NAME}:{settings.PASSWORD}".encode()).decode()
+        login = urllib.request.Request(base + settings.AUTHORIZATION_ENDPOINT, method='POST',
+                                       headers={'Authorization': f'Basic {credentials}'})
+        with urllib.request.urlopen(login, timeout=30) as response:
+            return json.load(response)
+
+    def _refresh_status(self, base, refresh_token):
+        refresh = urllib.request.Request(base + settings.REFRESH_ENDPOINT, method='POST',
+                                         headers={'Authorization': f'Bearer {refresh_token}'})
+        try:
+            with urllib.request.urlopen(refresh, timeout=30) as response:
+                return response.status
+        except urllib.error.HTTPError as e:
+            return e.code
+
+    def test_auth_workers_share_signing_keys(self):
+        supervisor = self._multi_worker_supervisor()
+        documents = []
+        refreshed = []
+
+        def scenario():
+            base = f"http://127.0.0.1:{supervisor._sockets['auth'].getsockname()[1]}"
+            refresh_token = self._login(base)['refresh_token']
+            # Each request opens a connection of its own, accepted by any of the workers.
+            for _ in range(20):
+                with urllib.request.urlopen(base + settings.JWKS_ENDPOINT, timeout=30) as response:
+                    documents.append(response.read())
+                refreshed.append(self._refresh_status(base, refresh_token))
+
+        _supervise(supervisor, scenario)
+
+        self.assertEqual(len(set(documents)), 1)
+        self.assertEqual(len(json.loads(documents[0])['keys']), 1)
+        self.assertEqual(refreshed, [200] * 20)
+
+    def test_auth_workers_share_revocations(self):
+        supervisor = self._multi_worker_supervisor()
+        pages = []
+        refreshed = []
+
+        def scenario():
+            base = f"http://127.0.0.1:{supervisor._sockets['auth'].getsockname()[1]}"
+            refresh_token = self._login(base)['refresh_token']
+            revoke = urllib.request.Request(base + settings.REVOKE_ENDPOINT, method='POST',
+                                            data=urllib.parse.urlencode({'token': refresh_token}).encode())
+            urllib.request.urlopen(revoke, timeout=30).close()
+            for _ in range(20):
+                with urllib.request.urlopen(base + settings.REVOCATIONS_ENDPOINT, timeout=30) as response:
+                    pages.append(json.load(response))
+                refreshed.append(self._refresh_status(base, refresh_token))
+
+        _supervise(supervisor, scenario)
+
+        self.assertEqual(len({page['epoch'] for page in pages}), 1)
+        self.assertTrue(all(len(page['revoked']) == 1 for page in pages))
+        self.assertEqual(refreshed, [401] * 20)
+
+if __name__ == '__main__':
+    asynctest.main()
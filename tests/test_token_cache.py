@@ -0,0 +1,136 @@
+import asyncio
+import asynctest
+import jwt
+from asynctest import CoroutineMock
+from auth_http.cache import TTLCache
+from auth_http.token_cache import TokenCache
+
+class TestTTLCache(asynctest.TestCase):
+
+    def test_lru_eviction(self):
+        cache = TTLCache(maxsize=2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+
+        self.assertIn("a", cache)
+        self.assertNotIn("b", cache)
+        self.assertEqual(len(cache), 2)
+
+    def test_entry_expires(self):
+        now = [100.0]
+        cache = TTLCache(maxsize=10, ttl=5, clock=lambda: now[0])
+        cache.set("a", 1)
+        self.assertEqual(cache.get("a"), 1)
+
+        now[0] = 105.0
+
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+class TestTokenCache(asynctest.TestCase):
+
+    async def test_token_reused_until_refresh_margin(self):
+        now = [1000.0]
+        token = jwt.encode({"user_name": "mock_user_name", "exp": 1100}, "iNzszLnvWXALoVicnqCVViIB3CjPy65Q", algorithm="HS256")
+        fetch = CoroutineMock(return_value={"access_token": token})
+        cache = TokenCache(maxsize=10, refresh_margin=30, clock=lambda: now[0])
+
+        self.assertEqual(await cache.get_or_fetch("mock_user_name", "mock_password", fetch), token)
+        self.assertEqual(await cache.get_or_fetch("mock_user_name", "mock_password", fetch), token)
+        self.assertEqual(fetch.call_count, 1)
+
+        now[0] = 1071.0
+        await cache.get_or_fetch("mock_user_name", "mock_password", fetch)
+        self.assertEqual(fetch.call_count, 2)
+
+    async def test_different_password_is_not_served_from_cache(self):
+        fetch = CoroutineMock(return_value={"access_token": "mock_access_token"})
+        cache = TokenCache(maxsize=10, default_ttl=300)
+
+        await cache.get_or_fetch("mock_user_name", "mock_password", fetch)
+        await cache.get_or_fetch("mock_user_name", "wrong_password", fetch)
+
+        self.assertEqual(fetch.call_count, 2)
+
+    async def test_concurrent_misses_share_one_fetch(self):
+        calls = []
+
+        async def fetch():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return {"access_token": "mock_access_token"}
+
+        cache = TokenCache(maxsize=10, default_ttl=300)
+        tokens = await asyncio.gather(*(cache.get_or_fetch("mock_user_name", "mock_password", fetch)
+                                        for _ in range(10)))
+
+        self.assertEqual(tokens, ["mock_access_token"] * 10)
+        self.assertEqual(len(calls), 1)
+
+    async def test_failed_fetch_is_not_cached(self):
+        fetch = CoroutineMock(side_effect=[ValueError("boom"), {"access_token": "mock_access_token"}])
+        cache = TokenCache(maxsize=10, default_ttl=300)
+
+        with self.assertRaises(ValueError):
+            await cache.get_or_fetch("mock_user_name", "mock_password", fetch)
+        token = await cache.get_or_fetch("mock_user_name", "mock_password", fetch)
+
+        self.assertEqual(token, "mock_access_token")
+
+    async def test_token_refreshed_in_background_before_expiry(self):
+        now = [1000.0]
+        secret = "iNzszLnvWXALoVicnqCVViIB3CjPy65Q"
+        first = jwt.encode({"user_name": "mock_user_name", "exp": 1100}, secret, algorithm="HS256")
+        second = jwt.encode({"user_name": "mock_user_name", "exp": 1400}, secret, algorithm="HS256")
+        refresh_token = jwt.encode({"user_name": "mock_user_name", "exp": 5000, "typ": "refresh"}, secret, algorithm="HS256")
+        fetch = CoroutineMock(return_value={"access_token": first, "refresh_token": refresh_token})
+        refresh = CoroutineMock(return_value={"access_token": second})
+        cache = TokenCache(maxsize=10, refresh_margin=30, refresh_ahead=60, clock=lambda: now[0])
+
+        await cache.get_or_fetch("mock_user_name", "mock_password", fetch, refresh)
+        now[0] = 1045.0
+        # Within the refresh-ahead window the current token is still returned immediately.
+        self.assertEqual(await cache.get_or_fetch("mock_user_name", "mock_password", fetch, refresh), first)
+        await asyncio.sleep(0)
+
+        self.assertEqual(await cache.get_or_fetch("mock_user_name", "mock_password", fetch, refresh), second)
+        refresh.assert_called_once_with(refresh_token)
+        self.assertEqual(fetch.call_count, 1)
+
+    async def test_expired_token_renewed_with_refresh_token(self):
+        now = [1000.0]
+        secret = "iNzszLnvWXALoVicnqCVViIB3CjPy65Q"
+        first = jwt.encode({"user_name": "mock_user_name", "exp": 1100}, secret, algorithm="HS256")
+        second = jwt.encode({"user_name": "mock_user_name", "exp": 2300}, secret, algorithm="HS256")
+        refresh_token = jwt.encode({"user_name": "mock_user_name", "exp": 5000, "typ": "refresh"}, secret, algorithm="HS256")
+        fetch = CoroutineMock(return_value={"access_token": first, "refresh_token": refresh_token})
+        refresh = CoroutineMock(return_value={"access_token": second})
+        cache = TokenCache(maxsize=10, refresh_margin=30, refresh_ahead=60, clock=lambda: now[0])
+
+        await cache.get_or_fetch("mock_user_name", "mock_password", fetch, refresh)
+        now[0] = 2000.0
+
+        self.assertEqual(await cache.get_or_fetch("mock_user_name", "mock_password", fetch, refresh), second)
+        refresh.assert_called_once_with(refresh_token)
+        self.assertEqual(fetch.call_count, 1)
+
+    async def test_rejected_refresh_falls_back_to_login(self):
+        now = [1000.0]
+        secret = "iNzszLnvWXALoVicnqCVViIB3CjPy65Q"
+        first = jwt.encode({"user_name": "mock_user_name", "exp": 1100}, secret, algorithm="HS256")
+        refresh_token = jwt.encode({"user_name": "mock_user_name", "exp": 5000, "typ": "refresh"}, secret, algorithm="HS256")
+        fetch = CoroutineMock(return_value={"access_token": first, "refresh_token": refresh_token})
+        refresh = CoroutineMock(side_effect=[ValueError("rejected"), {"access_token": "mock_access_token"}])
+        cache = TokenCache(maxsize=10, refresh_margin=30, refresh_ahead=60, clock=lambda: now[0])
+
+        await cache.get_or_fetch("mock_user_name", "mock_password", fetch, refresh)
+        now[0] = 2000.0
+
+        # A rejected refresh token falls back to a full login.
+        self.assertEqual(await cache.get_or_fetch("mock_user_name", "mock_password", fetch, refresh), first)
+        self.assertEqual(fetch.call_count, 2)
+
+if __name__ == '__main__':
+    asynctest.main()
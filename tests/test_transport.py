@@ -0,0 +1,51 @@
+import asyncio
+import asynctest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from auth_http.transport import Transport
+from settings import settings
+
+class TestTransport(asynctest.TestCase):
+
+    async def setUp(self):
+        async def slow(request):
+            await asyncio.sleep(0.05)
+            return web.Response(text="ok")
+
+        self.app = web.Application()
+        self.app.router.add_get('/slow', slow)
+        self.server = TestServer(self.app)
+        await self.server.start_server()
+        config = settings.model_copy(update={'API_POOL_LIMIT': 1})
+        self.transport = await Transport(config).start()
+
+    async def tearDown(self):
+        await self.transport.close()
+        await self.server.close()
+
+    async def get(self):
+        async with self.transport.resource_session.get(self.server.make_url('/slow')) as response:
+            return await response.text()
+
+    async def test_connection_kept_alive(self):
+        await self.get()
+
+        stats = self.transport.stats()['resource']
+
+        self.assertEqual(stats.in_use, 0)
+        self.assertEqual(stats.idle, 1)
+
+    async def test_waiting_requests_reported(self):
+        requests = [asyncio.ensure_future(self.get()) for _ in range(3)]
+        await asyncio.sleep(0.01)
+
+        stats = self.transport.stats()['resource']
+        self.assertEqual(stats.limit, 1)
+        self.assertEqual(stats.in_use, 1)
+        self.assertEqual(stats.waiting, 2)
+
+        await asyncio.gather(*requests)
+        self.assertEqual(self.transport.stats()['resource'].queued_total, 2)
+
+if __name__ == '__main__':
+    asynctest.main()
@@ -0,0 +1,80 @@
+import asynctest
+from aiohttp import web
+from aiohttp.test_utils import TestServer, TestClient as AioHTTPTestClient
+from auth_http.credential_store import CREDENTIAL_STORE, InMemoryCredentialStore
+from auth_http.keys import JWKS_CACHE, JWKSCache, SigningKeyRing
+from auth_http.mock_resource_api import get_data, remove_user
+from auth_http.verified_token_cache import VERIFIED_TOKEN_CACHE, VerifiedTokenCache
+from settings import settings
+
+class TestVerifiedTokenCache(asynctest.TestCase):
+
+    def setUp(self):
+        self.now = [1000.0]
+        self.cache = VerifiedTokenCache(maxsize=10, max_ttl=300, clock=lambda: self.now[0])
+
+    def test_entry_expires_at_token_exp(self):
+        self.cache.put("token", {'user_name': 'mock_user_name', 'exp': 1060})
+        self.assertEqual(self.cache.get("token")['user_name'], 'mock_user_name')
+
+        self.now[0] = 1060.0
+
+        self.assertIsNone(self.cache.get("token"))
+        self.assertEqual(self.cache.stats(), {'size': 0, 'hits': 1, 'misses': 1})
+
+    def test_entry_without_exp_capped_by_max_ttl(self):
+        self.cache.put("token", {'user_name': 'mock_user_name'})
+        self.now[0] = 1299.0
+        self.assertIsNotNone(self.cache.get("token"))
+
+        self.now[0] = 1300.0
+        self.assertIsNone(self.cache.get("token"))
+
+    def test_invalidate_user(self):
+        self.cache.put("token", {'user_name': 'mock_user_name'})
+        self.cache.put("other_token", {'user_name': 'other_user'})
+
+        self.cache.invalidate_user('mock_user_name')
+
+        self.assertIsNone(self.cache.get("token"))
+        self.assertIsNotNone(self.cache.get("other_token"))
+        self.cache.put("token", {'user_name': 'mock_user_name'})
+        self.assertIsNotNone(self.cache.get("token"))
+
+class TestResourceAPITokenCache(asynctest.TestCase):
+
+    async def setUp(self):
+        self.app = web.Application()
+        self.app[CREDENTIAL_STORE] = InMemoryCredentialStore(settings.AUTH_CREDENTIALS)
+        self.app[VERIFIED_TOKEN_CACHE] = self.cache = VerifiedTokenCache(maxsize=10)
+        self.ring = SigningKeyRing()
+        self.ring.rotate('EdDSA')
+        jwks_cache = JWKSCache()
+        jwks_cache.load(self.ring.jwks())
+        self.app[JWKS_CACHE] = jwks_cache
+        self.app.router.add_get('/get_data', get_data)
+        self.client = AioHTTPTestClient(TestServer(self.app))
+        await self.client.start_server()
+        self.headers = {'Authorization': 'Bearer ' + self.ring.sign({'user_name': settings.USER_NAME})}
+
+    async def tearDown(self):
+        await self.client.close()
+
+    async def test_repeated_token_served_from_cache(self):
+        for _ in range(3):
+            response = await self.client.get('/get_data', headers=self.headers)
+            self.assertEqual(response.status, 200)
+
+        self.assertEqual((self.cache.hits, self.cache.misses), (2, 1))
+
+    async def test_removed_user_rejected(self):
+        response = await self.client.get('/get_data', headers=self.headers)
+        self.assertEqual(response.status, 200)
+
+        remove_user(self.app, settings.USER_NAME)
+
+        response = await self.client.get('/get_data', headers=self.headers)
+        self.assertEqual(response.status, 401)
+
+if __name__ == '__main__':
+    asynctest.main()